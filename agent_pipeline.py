@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+# --- PIPELINE CHỤP -> PHÂN TÍCH -> QUYẾT ĐỊNH ---
+# Ba bước chạy trên các luồng riêng, nối với nhau bằng hàng đợi có giới hạn.
+# Khi bước sau không theo kịp, hàng đợi bỏ khung hình CŨ NHẤT để nhận khung
+# mới (drop-oldest): agent luôn làm việc trên trạng thái bàn gần nhất thay vì
+# xếp hàng chờ các khung đã lỗi thời. Khung nào vượt quá latency_budget (tính
+# từ lúc chụp) cũng bị bỏ trước khi tốn công phân tích/quyết định.
+
+# Một khung hình đi qua pipeline; image được bỏ sau bước phân tích
+StageItem = namedtuple("StageItem", "table_id seq captured_at image result")
+
+
+class DropOldestQueue:
+    """Hàng đợi có giới hạn: put() không bao giờ chặn, khi đầy thì bỏ phần tử cũ nhất."""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Phần tử cũ nhất còn lại, hoặc None nếu hết thời gian chờ / hàng đợi đã đóng."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Pipeline:
+    """
+    capture() -> [(table_id, image), ...] được gọi target_fps lần mỗi giây;
+    analyze(table_id, image) -> kết quả vision, hoặc None nếu khung hình không cần quyết định;
+    decide(table_id, result) -> quyết định;
+    on_decision(table_id, result, decision, latency_giây) nhận kết quả cuối.
+    """
+
+    def __init__(self, capture, analyze, decide, on_decision=None, target_fps=5.0, latency_budget=1.0,
+                 queue_size=2, vision_threads=1):
+        self.capture = capture
+        self.analyze = analyze
+        self.decide = decide
+        self.on_decision = on_decision
+        self.target_fps = target_fps
+        self.latency_budget = latency_budget
+        self.vision_threads = vision_threads
+        self.frames = DropOldestQueue(queue_size)     # chụp -> phân tích
+        self.analyses = DropOldestQueue(queue_size)   # phân tích -> quyết định
+        self._stop = threading.Event()
+        self._threads = []
+        self._seq = 0
+        self._latencies = deque(maxlen=500)
+        self._decided_at = deque(maxlen=100)
+        self._last_seq = {}
+        self._lock = threading.Lock()
+        self.counters = {"captured": 0, "analyzed": 0, "decided": 0, "gated": 0, "late": 0, "errors": 0,
+                         "overruns": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def start(self):
+        self._stop.clear()
+        targets = [self._capture_loop] + [self._vision_loop] * self.vision_threads + [self._decision_loop]
+        self._threads = [threading.Thread(target=target, daemon=True) for target in targets]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        self.frames.close()
+        self.analyses.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _capture_loop(self):
+        # target_fps = None/0: chụp liên tục, không giới hạn tốc độ (ví dụ khi phát lại để đo thông lượng)
+        period = 1.0 / self.target_fps if self.target_fps else 0.0
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                captured = self.capture() or []
+            except Exception as e:
+                print(f"Lỗi khi chụp bàn chơi: {e}")
+                self._count("errors")
+                captured = []
+            now = time.perf_counter()
+            for table_id, image in captured:
+                if image is None:
+                    continue
+                self.frames.put(StageItem(table_id, self._seq, now, image, None))
+                self._seq += 1
+                self._count("captured")
+
+            if not period:
+                continue
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay < 0:
+                # Chụp chậm hơn target_fps: bỏ các nhịp đã lỡ thay vì chạy dồn
+                missed = int(-delay / period) + 1
+                next_tick += missed * period
+                self._count("overruns", missed)
+                delay = next_tick - time.perf_counter()
+            self._stop.wait(max(delay, 0.0))
+
+    def _is_late(self, item):
+        if time.perf_counter() - item.captured_at > self.latency_budget:
+            self._count("late")
+            return True
+        return False
+
+    def _vision_loop(self):
+        while not self._stop.is_set():
+            item = self.frames.get(timeout=0.1)
+            if item is None or self._is_late(item):
+                continue
+            try:
+                result = self.analyze(item.table_id, item.image)
+            except Exception as e:
+                print(f"Lỗi phân tích bàn {item.table_id}: {e}")
+                self._count("errors")
+                continue
+            self._count("analyzed")
+            if result is None:
+                self._count("gated")
+                continue
+            self.analyses.put(item._replace(image=None, result=result))
+
+    def _decision_loop(self):
+        while not self._stop.is_set():
+            item = self.analyses.get(timeout=0.1)
+            if item is None or self._is_late(item):
+                continue
+            # Với nhiều luồng phân tích, kết quả có thể về không theo thứ tự: bỏ khung cũ hơn khung đã quyết định
+            if item.seq < self._last_seq.get(item.table_id, -1):
+                self._count("late")
+                continue
+            self._last_seq[item.table_id] = item.seq
+            try:
+                decision = self.decide(item.table_id, item.result)
+            except Exception as e:
+                print(f"Lỗi khi ra quyết định cho bàn {item.table_id}: {e}")
+                self._count("errors")
+                continue
+            now = time.perf_counter()
+            latency = now - item.captured_at
+            with self._lock:
+                self.counters["decided"] += 1
+                self._latencies.append(latency)
+                self._decided_at.append(now)
+            if self.on_decision is not None:
+                self.on_decision(item.table_id, item.result, decision, latency)
+
+    def stats(self):
+        """Bộ đếm, độ sâu hàng đợi, số khung bị bỏ, FPS thực tế và độ trễ đầu-cuối (ms)."""
+        with self._lock:
+            stats = dict(self.counters)
+            latencies = np.array(self._latencies) * 1000.0
+            decided_at = list(self._decided_at)
+        stats["queue_depth"] = {"vision": len(self.frames), "decision": len(self.analyses)}
+        stats["dropped"] = {"vision": self.frames.dropped, "decision": self.analyses.dropped}
+        span = decided_at[-1] - decided_at[0] if len(decided_at) > 1 else 0.0
+        stats["fps"] = round((len(decided_at) - 1) / span, 2) if span > 0 else 0.0
+        if len(latencies):
+            stats["latency_ms"] = {"p50": round(float(np.percentile(latencies, 50)), 1),
+                                   "p95": round(float(np.percentile(latencies, 95)), 1)}
+        return stats
@@ -0,0 +1,259 @@
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+# --- NGUỒN KHUNG HÌNH ---
+# Mọi cách lấy ảnh bàn chơi đều có chung giao diện CaptureSource:
+#   start(target_fps) / grab(region) -> ảnh BGR hoặc None / close()
+# DxcamSource và MssSource chụp màn hình (region = (left, top, right, bottom)
+# của cửa sổ bàn chơi); ReplaySource phát lại một thư mục PNG hoặc một file
+# video đã ghi, nên pipeline chạy và đo được trên Linux không cần client poker.
+# Ảnh trả về nằm trong các buffer cấp sẵn (FrameBuffers) và chỉ bị ghi đè sau
+# `buffers` lần grab(), đủ để các bước sau của pipeline dùng xong.
+# Nguồn chụp màn hình mặc định trả về BGRA nguyên bản, không chuyển sang BGR:
+# vision nhận thẳng buffer này (FrameView) và chỉ chuyển đổi các ROI cần dùng.
+
+# Số buffer xoay vòng của mỗi nguồn: hàng đợi pipeline + các khung đang phân tích
+FRAME_BUFFERS = 8
+# Khoảng cách giữa hai khung khi tên file ảnh không chứa thời điểm chụp
+DEFAULT_REPLAY_FPS = 5.0
+REPLAY_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+# Số cuối cùng trong tên file: capture_1712345678.png, capture_1712345678.125.png
+_TIMESTAMP_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(?!.*\d)")
+
+
+class FrameBuffers:
+    """Các mảng cấp sẵn dùng xoay vòng; cấp lại chỉ khi kích thước khung hình đổi."""
+
+    def __init__(self, count=FRAME_BUFFERS):
+        self.count = count
+        self._buffers = []
+        self._next = 0
+        self.allocations = 0
+
+    def get(self, shape):
+        index = self._next
+        self._next = (self._next + 1) % self.count
+        if index >= len(self._buffers):
+            self._buffers.append(None)
+        buffer = self._buffers[index]
+        if buffer is None or buffer.shape != tuple(shape):
+            buffer = self._buffers[index] = np.empty(shape, dtype=np.uint8)
+            self.allocations += 1
+        return buffer
+
+    def copy(self, frame):
+        buffer = self.get(frame.shape)
+        np.copyto(buffer, frame)
+        return buffer
+
+
+class CaptureSource:
+    """Giao diện chung của các nguồn khung hình (ảnh trả về là BGR hoặc BGRA)."""
+
+    # False: nguồn không gắn với cửa sổ nào trên màn hình (phát lại)
+    windowed = True
+    finished = False
+
+    def __init__(self, buffers=FRAME_BUFFERS):
+        self.buffers = FrameBuffers(buffers)
+
+    def start(self, target_fps=None):
+        pass
+
+    def grab(self, region=None):
+        """Ảnh BGR của vùng region, hoặc None nếu không chụp được."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DxcamSource(CaptureSource):
+    """Desktop Duplication qua dxcam (chỉ có trên Windows)."""
+
+    def __init__(self, buffers=FRAME_BUFFERS, output_color="BGRA"):
+        import dxcam
+        super().__init__(buffers)
+        self.camera = dxcam.create(output_color=output_color)
+
+    def start(self, target_fps=None):
+        if target_fps:
+            self.camera.start(target_fps=int(target_fps))
+
+    def grab(self, region=None):
+        frame = self.camera.grab(region=region)
+        return None if frame is None else self.buffers.copy(frame)
+
+    def close(self):
+        if self.camera.is_capturing:
+            self.camera.stop()
+
+
+class MssSource(CaptureSource):
+    """
+    Chụp màn hình qua mss (Windows, Linux, macOS).
+    bgra=True: trả về view NumPy trên ảnh BGRA mss vừa cấp (mỗi lần chụp một
+    vùng nhớ mới), không sao chép; False: chuyển sang BGR vào buffer cấp sẵn.
+    """
+
+    def __init__(self, buffers=FRAME_BUFFERS, bgra=True):
+        from mss import mss
+        super().__init__(buffers)
+        self.sct = mss()
+        self.bgra = bgra
+
+    def grab(self, region=None):
+        if region is None:
+            monitor = self.sct.monitors[1]
+        else:
+            left, top, right, bottom = region
+            monitor = {"top": top, "left": left, "width": right - left, "height": bottom - top}
+        img = np.asarray(self.sct.grab(monitor))
+        if self.bgra:
+            return img
+        # Chuyển BGRA -> BGR thẳng vào buffer cấp sẵn
+        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR, dst=self.buffers.get(img.shape[:2] + (3,)))
+
+    def close(self):
+        self.sct.close()
+
+
+class FallbackSource(CaptureSource):
+    """Dùng `primary`, chuyển sang `fallback` cho khung hình nào primary không chụp được."""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def start(self, target_fps=None):
+        self.primary.start(target_fps)
+        self.fallback.start(target_fps)
+
+    def grab(self, region=None):
+        frame = self.primary.grab(region)
+        if frame is None:
+            print(f"Cảnh báo: {type(self.primary).__name__} thất bại. "
+                  f"Chuyển sang phương pháp thay thế ({type(self.fallback).__name__})...")
+            frame = self.fallback.grab(region)
+        return frame
+
+    def close(self):
+        self.primary.close()
+        self.fallback.close()
+
+
+def _capture_timestamp(path, index):
+    match = _TIMESTAMP_PATTERN.search(os.path.splitext(os.path.basename(path))[0])
+    return float(match.group(1)) if match else index / DEFAULT_REPLAY_FPS
+
+
+class ReplaySource(CaptureSource):
+    """
+    Phát lại một phiên đã ghi: thư mục ảnh (thời điểm lấy từ số cuối trong tên
+    file, ví dụ capture_1712345678.png) hoặc file video (thời điểm theo video).
+    realtime=True giữ đúng khoảng cách thời gian như lúc ghi; False phát nhanh
+    nhất có thể. Hết khung hình thì grab() trả về None và finished = True.
+    """
+
+    windowed = False
+
+    def __init__(self, path, realtime=True, loop=False, buffers=FRAME_BUFFERS):
+        super().__init__(buffers)
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.realtime = realtime
+        self.loop = loop
+        self.video = None
+        self.frames = []
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in os.listdir(path)
+                     if name.lower().endswith(REPLAY_IMAGE_EXTENSIONS)]
+            timed = [(_capture_timestamp(file, i), file) for i, file in enumerate(sorted(files))]
+            self.frames = sorted(timed)
+            if not self.frames:
+                raise ValueError(f"Không có ảnh nào trong {path}")
+        else:
+            self.video = cv2.VideoCapture(path)
+            if not self.video.isOpened():
+                raise ValueError(f"Không mở được video {path}")
+        self._shape = None
+        self._index = 0
+        self._first_timestamp = None
+        self._started_at = None
+        self.finished = False
+
+    def __len__(self):
+        return len(self.frames) if self.video is None else int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def _rewind(self):
+        self._index = 0
+        self._first_timestamp = None
+        if self.video is not None:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _next_frame(self):
+        """(thời điểm ghi tính bằng giây, ảnh) của khung kế tiếp, hoặc None nếu đã hết."""
+        if self.video is not None:
+            # Giải mã thẳng vào buffer xoay vòng kế tiếp (lần đầu để OpenCV tự cấp, vì chưa biết kích thước)
+            buffer = self.buffers.get(self._shape) if self._shape else None
+            ok, frame = self.video.read(buffer)
+            if not ok:
+                return None
+            self._shape = frame.shape
+            return self.video.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame
+        while self._index < len(self.frames):
+            timestamp, file = self.frames[self._index]
+            self._index += 1
+            frame = cv2.imread(file)
+            if frame is not None:
+                return timestamp, self.buffers.copy(frame)
+            print(f"Bỏ qua {file}: không đọc được ảnh")
+        return None
+
+    def grab(self, region=None):
+        item = self._next_frame()
+        if item is None and self.loop:
+            self._rewind()
+            item = self._next_frame()
+        if item is None:
+            self.finished = True
+            return None
+        timestamp, frame = item
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+            self._started_at = time.perf_counter()
+        elif self.realtime:
+            delay = self._started_at + (timestamp - self._first_timestamp) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return frame
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+
+
+def create_capture_source(backend="auto", replay=None, realtime=True, loop=False, buffers=FRAME_BUFFERS):
+    """
+    backend: "dxcam", "mss", "replay" hoặc "auto" (dxcam, mss dự phòng; chỉ mss nếu không có dxcam).
+    """
+    if replay is not None or backend == "replay":
+        if replay is None:
+            raise ValueError("Nguồn replay cần đường dẫn tới thư mục ảnh hoặc file video")
+        return ReplaySource(replay, realtime=realtime, loop=loop, buffers=buffers)
+    if backend == "dxcam":
+        return DxcamSource(buffers)
+    if backend == "mss":
+        return MssSource(buffers)
+    if backend != "auto":
+        raise ValueError(f"Không có nguồn chụp '{backend}'")
+    try:
+        primary = DxcamSource(buffers)
+    except Exception as e:
+        print(f"Không dùng được dxcam ({e}), chụp màn hình bằng mss.")
+        return MssSource(buffers)
+    return FallbackSource(primary, MssSource(buffers))
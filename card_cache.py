@@ -0,0 +1,212 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# --- CACHE NHẬN DIỆN QUÂN BÀI THEO PERCEPTUAL HASH ---
+# Cùng 52 mặt bài xuất hiện lại ở mọi ván, mọi phiên. Vùng ảnh của một lá bài
+# được rút gọn thành dHash (gradient ngang trên ảnh xám thu nhỏ), không đổi khi
+# ảnh nhiễu nhẹ hay bị nén lại. Cache LRU ánh xạ hash -> (quân bài, điểm khớp
+# template) và được lưu ra đĩa, nạp lại khi khởi động. Khi trùng hash, người
+# gọi kiểm tra lại điểm template của đúng quân bài đã lưu trước khi tin kết quả.
+
+CARD_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'card_hash_cache.json')
+CACHE_VERSION = 1
+
+# Kích thước lưới dHash: (HASH_SIZE + 1) x HASH_SIZE điểm -> HASH_SIZE² bit
+HASH_SIZE = 16
+# Chênh lệch mức xám tối thiểu để một bit là 1; vùng phẳng (nền lá bài) luôn
+# cho bit 0 thay vì lật theo nhiễu
+HASH_DEADBAND = 6
+# Số bit khác nhau tối đa để coi hai hash là cùng một mặt bài (kết quả vẫn được
+# kiểm tra lại bằng điểm template, vì hai mặt bài khác nhau có thể chỉ lệch vài bit)
+MAX_HASH_DISTANCE = 4
+
+
+def dhash(card_area, size=HASH_SIZE):
+    """
+    Perceptual hash (dHash) của vùng ảnh một lá bài.
+
+    Returns:
+        Chuỗi hex của size*size bit, so sánh từng bit giữa hai điểm ảnh kề nhau theo chiều ngang
+    """
+    gray = cv2.cvtColor(card_area, cv2.COLOR_BGR2GRAY) if len(card_area.shape) > 2 else card_area
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = small[:, 1:] > small[:, :-1] + HASH_DEADBAND
+    return np.packbits(bits).tobytes().hex()
+
+
+class CardCache:
+    """
+    LRU hash -> (quân bài, điểm khớp) có lưu ra đĩa.
+    Khóa gồm cả dHash và kích thước ROI, vì điểm khớp phụ thuộc tỉ lệ template.
+    Không có khóa trùng khớp thì lấy khóa cùng kích thước gần nhất theo
+    khoảng cách Hamming (tối đa max_distance bit).
+    readonly=True: nạp từ đĩa nhưng không bao giờ ghi (tiến trình con dùng chung file với tiến trình chính).
+    """
+
+    def __init__(self, path=CARD_CACHE_PATH, max_entries=1024, autosave_every=32, max_distance=MAX_HASH_DISTANCE,
+                 readonly=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.autosave_every = autosave_every
+        self.readonly = readonly
+        self._entries = OrderedDict()  # key -> (card, score)
+        # Ma trận bit của mọi khóa để tìm hash gần nhất: mỗi khóa một hàng cố định,
+        # hàng của khóa bị xóa được dùng lại cho khóa mới (không dựng lại cả ma trận)
+        self._rows = {}                # key -> hàng
+        self._row_keys = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._bits = np.zeros((max_entries, HASH_SIZE * HASH_SIZE), np.uint8)
+        self._sizes = np.zeros((max_entries, 2), np.int32)
+        self._used = np.zeros(max_entries, bool)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    @staticmethod
+    def key(card_area):
+        return f"{card_area.shape[1]}x{card_area.shape[0]}:{dhash(card_area)}"
+
+    def load(self):
+        """Nạp cache từ đĩa (một lần); file hỏng hoặc khác phiên bản thì bỏ qua."""
+        with self._lock:
+            if self._loaded:
+                return self
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return self
+            try:
+                with open(self.path, "r", encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == CACHE_VERSION:
+                    for key, card, score in data.get("entries", [])[-self.max_entries:]:
+                        self._entries[key] = (card, float(score))
+                        self._add_row(key)
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Không thể đọc cache quân bài {self.path}: {e}")
+        return self
+
+    @staticmethod
+    def _parse(key):
+        """((rộng, cao), mảng bit) của một khóa, hoặc None nếu khóa không đúng dạng."""
+        size, _, digest = key.partition(":")
+        try:
+            width, height = (int(v) for v in size.split("x"))
+            bits = np.unpackbits(np.frombuffer(bytes.fromhex(digest), np.uint8))
+        except ValueError:
+            return None
+        return ((width, height), bits) if bits.size == HASH_SIZE * HASH_SIZE else None
+
+    def _add_row(self, key):
+        parsed = self._parse(key)
+        if parsed is None or key in self._rows or not self._free_rows:
+            return
+        row = self._free_rows.pop()
+        self._sizes[row], self._bits[row] = parsed
+        self._used[row] = True
+        self._rows[key] = row
+        self._row_keys[row] = key
+
+    def _remove_row(self, key):
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._used[row] = False
+            self._row_keys[row] = None
+            self._free_rows.append(row)
+
+    def _nearest(self, key):
+        parsed = self._parse(key)
+        if parsed is None or not self._rows:
+            return None
+        size, bits = parsed
+        distances = (self._bits != bits).sum(axis=1)
+        candidates = self._used & (self._sizes == size).all(axis=1)
+        distances = np.where(candidates, distances, bits.size + 1)
+        best = int(distances.argmin())
+        return self._row_keys[best] if distances[best] <= self.max_distance else None
+
+    def get(self, key):
+        """
+        (card, score) đã lưu cho key hoặc cho hash gần nhất, hoặc None.
+        Kết quả gần đúng được ghi thêm dưới key để lần sau trùng khớp ngay.
+        """
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                near = self._nearest(key)
+                if near is None:
+                    self.misses += 1
+                    return None
+                entry = self._entries[near]
+                self._store(key, entry)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _store(self, key, entry):
+        is_new = key not in self._entries
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._remove_row(evicted)
+        if is_new:
+            self._add_row(key)
+        self._unsaved += 1
+
+    def put(self, key, card, score):
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            self._store(key, (card, float(score)))
+            autosave = self.autosave_every and self._unsaved >= self.autosave_every
+        if autosave:
+            self.save()
+
+    def invalidate(self, key=None):
+        """Xóa một khóa (ví dụ khi phát hiện trùng hash) hoặc toàn bộ cache."""
+        with self._lock:
+            if key is None:
+                for old in list(self._rows):
+                    self._remove_row(old)
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+                self._remove_row(key)
+                self.collisions += 1
+            self._unsaved += 1
+
+    def save(self):
+        """Ghi cache ra đĩa (ghi file tạm rồi thay thế, không để lại file dở dang)."""
+        with self._lock:
+            if self.readonly or not self.path or not self._unsaved:
+                return
+            raw = json.dumps({"version": CACHE_VERSION,
+                              "entries": [[k, card, round(score, 4)] for k, (card, score) in self._entries.items()]})
+            self._unsaved = 0
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(os.path.abspath(self.path)))
+        try:
+            with os.fdopen(fd, "w", encoding='utf-8') as f:
+                f.write(raw)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Không thể lưu cache quân bài {self.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._entries)
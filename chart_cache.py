@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import chart_journal
+
+# --- PARSED CHART CACHE ---
+# Bounded LRU of parsed chart files keyed by absolute path. Each entry remembers
+# the (mtime, size) stamps of the file and its patch journal plus a content hash:
+#   - same stamps           -> cached dict, no I/O beyond os.stat
+#   - new stamps, same hash -> files were touched but not changed, no re-parse
+#   - new hash              -> parse again (base file + journal replay)
+# Entries also keep the running SHA-1 state, so after an editor save (journal
+# appended, base untouched) put() hashes only the appended bytes.
+# Cached dicts are shared; callers must copy before mutating.
+
+
+def _hasher(base_raw, journal_raw=b""):
+    hasher = hashlib.sha1(base_raw)
+    hasher.update(b"\0")
+    hasher.update(journal_raw)
+    return hasher
+
+
+def content_hash(base_raw, journal_raw=b""):
+    return _hasher(base_raw, journal_raw).hexdigest()
+
+
+def _journal_size(stamp):
+    return stamp[1][1] if stamp[1] else 0
+
+
+def _read_journal_tail(path, start, end):
+    with open(chart_journal.journal_path(path), "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+class ChartCache:
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> (stamp, digest, data, hasher)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_path):
+        """Parsed chart at file_path, re-reading it only if it or its journal changed on disk."""
+        path = os.path.abspath(file_path)
+        stamp = chart_journal.files_stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+
+        base_raw, journal_raw = chart_journal.read_raw(path)
+        hasher = _hasher(base_raw, journal_raw)
+        digest = hasher.hexdigest()
+
+        with self._lock:
+            if entry and entry[1] == digest:
+                self._entries[path] = (stamp, digest, entry[2], hasher)
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+
+        data = chart_journal.parse(base_raw, journal_raw)
+        self._store(path, stamp, hasher, data)
+        self.misses += 1
+        return data
+
+    def put(self, file_path, data):
+        """
+        Record data that was just saved to file_path, so the next get() does not re-parse it.
+        If only the journal grew since the cached entry, just the appended bytes are read and hashed.
+        """
+        path = os.path.abspath(file_path)
+        stamp = chart_journal.files_stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        hasher = None
+        if entry and entry[0][0] == stamp[0] and _journal_size(entry[0]) <= _journal_size(stamp):
+            try:
+                tail = _read_journal_tail(path, _journal_size(entry[0]), _journal_size(stamp))
+            except FileNotFoundError:
+                tail = None
+            if tail is not None:
+                hasher = entry[3].copy()
+                hasher.update(tail)
+        if hasher is None:
+            hasher = _hasher(*chart_journal.read_raw(path))
+        self._store(path, stamp, hasher, data)
+
+    def _store(self, path, stamp, hasher, data):
+        with self._lock:
+            self._entries[path] = (stamp, hasher.hexdigest(), data, hasher)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, file_path=None):
+        with self._lock:
+            if file_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(file_path), None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import chart_journal
+import chart_store
+from hand_index import canonical_hand
+
+# --- CHART COMPILER ---
+# Validates every chart referenced by index.json, normalises hand keys
+# ("KAs" -> "AKs") and action labels ("3-Bet" -> "3-bet", "Raise/4-Bet" ->
+# "Raise/4-bet"), and writes the compiled chart store. Problems are reported as
+# "path:line:col: message" so a bad file fails here instead of at click time.
+#
+# Per-file results are cached by content hash (base file + journal + compiler
+# version) in poker_charts/.build_cache, so a startup or CI build only
+# re-validates the files that changed. Cache misses run in a process pool.
+#
+#   python chart_compiler.py [--index index.json] [--jobs N] [--no-cache] [--force]
+
+COMPILER_VERSION = 1
+CACHE_DIR = os.path.join("poker_charts", ".build_cache")
+
+
+def normalize_label(label):
+    """Canonical spelling of an action label: each "/" part capitalised once, the rest lower case."""
+    parts = [" ".join(part.split()).lower() for part in label.split("/")]
+    return "/".join(part[:1].upper() + part[1:] for part in parts)
+
+
+def _locate(raw_text, *keys):
+    """(line, column) of the last key in a path of JSON object keys, or (1, 1) if not found."""
+    pos = 0
+    for key in keys:
+        found = raw_text.find(json.dumps(key, ensure_ascii=False), pos)
+        if found < 0:
+            found = raw_text.find(json.dumps(key), pos)
+        if found < 0:
+            break
+        pos = found
+    line = raw_text.count("\n", 0, pos) + 1
+    return line, pos - raw_text.rfind("\n", 0, pos)
+
+
+def _normalize_cell(cell):
+    """Normalised cell value, or raises ValueError describing what is wrong with it."""
+    if isinstance(cell, str):
+        if not cell.strip():
+            raise ValueError("nhãn hành động rỗng")
+        return normalize_label(cell)
+    if isinstance(cell, dict):
+        mix = {}
+        for label, freq in cell.items():
+            if isinstance(freq, bool) or not isinstance(freq, (int, float)) or not 0 <= freq <= 1:
+                raise ValueError(f"tần suất của '{label}' phải là số trong [0, 1]")
+            mix[normalize_label(label)] = mix.get(normalize_label(label), 0) + freq
+        if sum(mix.values()) > 1.001:
+            raise ValueError(f"tổng tần suất vượt quá 1 ({sum(mix.values()):.3f})")
+        return mix
+    raise ValueError(f"giá trị ô phải là nhãn hoặc bảng tần suất, không phải {type(cell).__name__}")
+
+
+def check_chart(path, base_raw, journal_raw=b""):
+    """
+    Validate and normalise one chart file. Runs in worker processes, so it only
+    takes and returns plain data:
+    {"path", "data" (normalised chart or None), "errors", "warnings"} with
+    errors/warnings as lists of (line, column, message).
+    """
+    errors = []
+    warnings = []
+    result = {"path": path, "data": None, "errors": errors, "warnings": warnings}
+    try:
+        raw_text = base_raw.decode('utf-8')
+        chart_data = json.loads(raw_text)
+    except UnicodeDecodeError as e:
+        errors.append((1, e.start + 1, "file không phải UTF-8"))
+        return result
+    except json.JSONDecodeError as e:
+        errors.append((e.lineno, e.colno, e.msg))
+        return result
+    if not isinstance(chart_data, dict) or not isinstance(chart_data.get("charts"), dict):
+        errors.append((1, 1, 'thiếu đối tượng "charts"'))
+        return result
+    chart_journal.apply_records(chart_data, chart_journal.parse_records(journal_raw))
+
+    charts = {}
+    for situation, scenarios in chart_data["charts"].items():
+        if not isinstance(scenarios, dict):
+            errors.append((*_locate(raw_text, situation), f"'{situation}' phải là một đối tượng"))
+            continue
+        charts[situation] = {}
+        for scenario, state in scenarios.items():
+            if not isinstance(state, dict):
+                errors.append((*_locate(raw_text, situation, scenario), f"'{scenario}' phải là một đối tượng"))
+                continue
+            normalized = {}
+            for hand, cell in state.items():
+                where = _locate(raw_text, situation, scenario, hand)
+                canonical = canonical_hand(hand)
+                if canonical is None:
+                    errors.append((*where, f"hand không hợp lệ '{hand}' trong '{scenario}'"))
+                    continue
+                try:
+                    value = _normalize_cell(cell)
+                except ValueError as e:
+                    errors.append((*where, f"'{hand}' trong '{scenario}': {e}"))
+                    continue
+                if canonical != hand:
+                    warnings.append((*where, f"hand '{hand}' -> '{canonical}'"))
+                if isinstance(cell, str) and value != cell:
+                    warnings.append((*where, f"nhãn '{cell}' -> '{value}'"))
+                if canonical in normalized and normalized[canonical] != value:
+                    errors.append((*where, f"'{canonical}' xuất hiện nhiều lần với hành động khác nhau trong '{scenario}'"))
+                    continue
+                normalized[canonical] = value
+            charts[situation][scenario] = normalized
+
+    if not errors:
+        for action in chart_data.get("actions", []):
+            action["label"] = normalize_label(action["label"])
+        result["data"] = dict(chart_data, charts=charts)
+    return result
+
+
+def _check_job(job):
+    path, base_raw, journal_raw = job
+    return check_chart(path, base_raw, journal_raw)
+
+
+def content_digest(base_raw, journal_raw):
+    digest = hashlib.sha1(f"chart-compiler-{COMPILER_VERSION}".encode())
+    digest.update(base_raw)
+    digest.update(b"\0")
+    digest.update(journal_raw)
+    return digest.hexdigest()
+
+
+def _load_cached(cache_dir, digest):
+    try:
+        with open(os.path.join(cache_dir, digest + ".pickle"), "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save_cached(cache_dir, digest, result):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, digest + ".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(cache_dir, digest + ".pickle"))
+
+
+def build(index_path="index.json", store_path=None, workers=None, use_cache=True, force=False):
+    """
+    Validate every chart in index_path and (re)write the compiled store.
+    workers=0 validates in this process; otherwise a process pool of `workers`
+    (default: CPU count) handles the files missing from the cache.
+    Returns one result dict per chart file (see check_chart), plus "digest"
+    and "cached".
+    """
+    with open(index_path, "r", encoding='utf-8') as f:
+        index_data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(index_path))
+    store_path = store_path or os.path.join(base_dir, chart_store.STORE_PATH)
+    cache_dir = os.path.join(base_dir, CACHE_DIR)
+    entries = list(chart_store.iter_chart_files(index_data, base_dir))
+
+    results = {}
+    sources = {}
+    jobs = {}
+    for _, _, path in entries:
+        if path in results or path in jobs:
+            continue
+        try:
+            sources[path] = chart_store.source_stamp(path)
+            base_raw, journal_raw = chart_journal.read_raw(path)
+        except OSError as e:
+            results[path] = {"path": path, "data": None, "errors": [(1, 1, str(e))], "warnings": [],
+                             "digest": None, "cached": False}
+            continue
+        digest = content_digest(base_raw, journal_raw)
+        cached = _load_cached(cache_dir, digest) if use_cache else None
+        if cached is not None:
+            results[path] = dict(cached, path=path, digest=digest, cached=True)
+        else:
+            jobs[path] = (digest, base_raw, journal_raw)
+
+    if jobs:
+        job_args = [(path, base_raw, journal_raw) for path, (_, base_raw, journal_raw) in jobs.items()]
+        if workers == 0 or len(jobs) == 1:
+            checked = map(_check_job, job_args)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                checked = list(pool.map(_check_job, job_args))
+        for result in checked:
+            digest = jobs[result["path"]][0]
+            if use_cache:
+                _save_cached(cache_dir, digest, result)
+            results[result["path"]] = dict(result, digest=digest, cached=False)
+
+    digests = {path: r["digest"] for path, r in results.items()}
+    if not force and os.path.exists(store_path):
+        try:
+            with chart_store.ChartStore(store_path) as store:
+                if store.digests == digests and store.sources == sources:
+                    return [results[path] for path in dict.fromkeys(p for _, _, p in entries)]
+        except Exception:
+            pass
+
+    charts = [(game_type, chart_name, results[path]["data"])
+              for game_type, chart_name, path in entries if results[path]["data"] is not None]
+    chart_store.write_store(store_path, charts, sources, digests)
+    return [results[path] for path in dict.fromkeys(p for _, _, p in entries)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra và biên dịch toàn bộ chart trong index.json.")
+    parser.add_argument("--index", default="index.json")
+    parser.add_argument("--out", help="Đường dẫn file store (mặc định poker_charts/charts.bin)")
+    parser.add_argument("--jobs", type=int, default=None, help="Số tiến trình (0 = chạy tuần tự)")
+    parser.add_argument("--no-cache", action="store_true", help="Bỏ qua cache theo content hash")
+    parser.add_argument("--force", action="store_true", help="Luôn ghi lại file store")
+    parser.add_argument("--quiet", action="store_true", help="Không in cảnh báo chuẩn hóa")
+    args = parser.parse_args(argv)
+
+    results = build(args.index, args.out, args.jobs, use_cache=not args.no_cache, force=args.force)
+    n_errors = 0
+    for r in results:
+        rel = os.path.relpath(r["path"])
+        for line, col, msg in r["errors"]:
+            print(f"{rel}:{line}:{col}: lỗi: {msg}")
+            n_errors += 1
+        if not args.quiet:
+            for line, col, msg in r["warnings"]:
+                print(f"{rel}:{line}:{col}: chuẩn hóa: {msg}")
+    n_cached = sum(r["cached"] for r in results)
+    print(f"{len(results)} file chart ({n_cached} từ cache), {n_errors} lỗi.")
+    return 1 if n_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
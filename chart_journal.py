@@ -0,0 +1,239 @@
+import atexit
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+# --- CHART PATCH JOURNAL ---
+# Editor saves append one small JSON line per changed cell to "<chart>.journal":
+#
+#   {"path": ["charts", "<situation>", "<scenario>"], "hand": "AKs", "action": "Raise"}
+#
+# "action": null removes the cell. Loads replay the journal on top of the base
+# file; a torn last line from a crash is ignored. Compaction folds the journal
+# into the base file in the background, writing a temp file and renaming it over
+# the original so the chart is never left half-written.
+
+JOURNAL_SUFFIX = ".journal"
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+
+def journal_path(chart_path):
+    return chart_path + JOURNAL_SUFFIX
+
+
+def _lock_for(chart_path):
+    path = os.path.abspath(chart_path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+def files_stamp(chart_path):
+    """(mtime_ns, size) of the base file and of its journal (None if there is none)."""
+    st = os.stat(chart_path)
+    try:
+        jst = os.stat(journal_path(chart_path))
+        journal = (jst.st_mtime_ns, jst.st_size)
+    except FileNotFoundError:
+        journal = None
+    return (st.st_mtime_ns, st.st_size), journal
+
+
+def read_raw(chart_path):
+    """Raw bytes of the base file and of its journal (b"" if there is none)."""
+    with open(chart_path, "rb") as f:
+        base_raw = f.read()
+    try:
+        with open(journal_path(chart_path), "rb") as f:
+            journal_raw = f.read()
+    except FileNotFoundError:
+        journal_raw = b""
+    return base_raw, journal_raw
+
+
+def parse_records(journal_raw):
+    records = []
+    for line in journal_raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Torn write from a crash: everything before it is still valid.
+            break
+    return records
+
+
+def apply_records(chart_data, records):
+    """Replay journal records onto parsed chart data in place."""
+    for record in records:
+        node = chart_data
+        for key in record["path"]:
+            node = node.setdefault(key, {})
+        if record["action"] is None:
+            node.pop(record["hand"], None)
+        else:
+            node[record["hand"]] = record["action"]
+    return chart_data
+
+
+def parse(base_raw, journal_raw=b""):
+    return apply_records(json.loads(base_raw.decode('utf-8')), parse_records(journal_raw))
+
+
+def load_chart(chart_path):
+    """Parsed chart with any pending journal records applied."""
+    return parse(*read_raw(chart_path))
+
+
+def diff_states(old_state, new_state):
+    """Per-cell changes turning old_state into new_state, as [(hand, action or None)]."""
+    changes = [(hand, action) for hand, action in new_state.items() if old_state.get(hand) != action]
+    changes += [(hand, None) for hand in old_state if hand not in new_state]
+    return changes
+
+
+def append_changes(chart_path, key_path, changes):
+    """Append one record per changed cell and fsync; returns the number of records written."""
+    if not changes:
+        return 0
+    lines = "".join(
+        json.dumps({"path": list(key_path), "hand": hand, "action": action}, ensure_ascii=False) + "\n"
+        for hand, action in changes
+    ).encode('utf-8')
+    with _lock_for(chart_path):
+        with open(journal_path(chart_path), "ab") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+    return len(changes)
+
+
+def _atomic_write(path, raw):
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def compact(chart_path):
+    """Fold the journal into the base file atomically. Returns the number of records applied."""
+    jpath = journal_path(chart_path)
+    with _lock_for(chart_path):
+        base_raw, journal_raw = read_raw(chart_path)
+        records = parse_records(journal_raw)
+        if not records:
+            if journal_raw:
+                os.remove(jpath)
+            return 0
+        chart_data = apply_records(json.loads(base_raw.decode('utf-8')), records)
+        _atomic_write(chart_path, json.dumps(chart_data, indent=4).encode('utf-8'))
+        # Appends hold the same lock, so nothing was added since read_raw.
+        os.remove(jpath)
+    return len(records)
+
+
+def compact_all(chart_paths):
+    """
+    Compact every chart that still has a journal, e.g. left over from a session
+    that exited before its compaction ran. Returns the number of records applied.
+    """
+    total = 0
+    for path in chart_paths:
+        if not os.path.exists(journal_path(path)):
+            continue
+        try:
+            total += compact(path)
+        except Exception as e:
+            print(f"Không thể gộp journal vào '{path}': {e}")
+    return total
+
+
+def replace_chart(chart_path, chart_data):
+    """Write a whole chart atomically and drop its journal (chart_data already includes it)."""
+    with _lock_for(chart_path):
+        _atomic_write(chart_path, json.dumps(chart_data, indent=4).encode('utf-8'))
+        try:
+            os.remove(journal_path(chart_path))
+        except FileNotFoundError:
+            pass
+
+
+class JournalCompactor:
+    """
+    Background thread that compacts journals shortly after they were written.
+    The thread is a daemon, so call flush() before exiting (schedule_compaction
+    registers it with atexit) or pending journals stay uncompacted.
+    """
+
+    def __init__(self, delay=2.0):
+        self.delay = delay
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="chart-journal-compactor", daemon=True)
+        self._thread.start()
+
+    def request(self, chart_path):
+        path = os.path.abspath(chart_path)
+        with self._pending_lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._queue.put(path)
+
+    def flush(self):
+        """Compact every pending journal now, without waiting for the delay."""
+        with self._pending_lock:
+            paths = list(self._pending)
+            self._pending.clear()
+        compact_all(paths)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            # Let a burst of saves land in the journal before rewriting the base file.
+            time.sleep(self.delay)
+            with self._pending_lock:
+                self._pending.discard(path)
+            try:
+                compact(path)
+            except Exception as e:
+                print(f"Không thể gộp journal vào '{path}': {e}")
+
+
+_default_compactor = None
+
+
+def schedule_compaction(chart_path):
+    global _default_compactor
+    if _default_compactor is None:
+        _default_compactor = JournalCompactor()
+        atexit.register(flush_compactions)
+    _default_compactor.request(chart_path)
+
+
+def flush_compactions():
+    """Compact everything schedule_compaction is still waiting on (on exit or window close)."""
+    if _default_compactor is not None:
+        _default_compactor.flush()
+
+
+if __name__ == "__main__":
+    import sys
+    for path in sys.argv[1:]:
+        print(f"{path}: đã gộp {compact(path)} thay đổi")
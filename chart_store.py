@@ -0,0 +1,320 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+import chart_journal
+from hand_index import HAND_SLOTS, class_actions
+from strategy import cell_mix, cumulative_table, dominant_codes, sample_from_cumulative
+
+# --- COMPILED BINARY CHART STORE ---
+# Every chart file referenced by index.json is compiled into one binary file:
+#
+#   header   : magic (4 bytes) | version (uint32) | meta length (uint32)
+#   meta     : UTF-8 JSON (label/colour table, scenario keys, source stamps)
+#   padding  : up to a 16-byte boundary
+#   codes    : n_scenarios x 169 uint8, one action code per grid cell
+#   padding  : up to a 16-byte boundary
+#   freqs    : n_mixed x 169 x n_labels float16, only for scenarios with mixed cells
+#
+# Code 0 means "no entry" (the lookup tool treats it as Fold), codes 1..N
+# point into the label table; a mixed cell stores its most frequent action,
+# with the unassigned remainder counted as the default (strategy.dominant_codes),
+# so {"Raise": 0.2} stores code 0 exactly as the stack-depth lookup decides.
+# The file is memory-mapped read-only so several processes share the same
+# pages and a decision is a single array index.
+
+STORE_MAGIC = b"PCHS"
+STORE_VERSION = 3
+STORE_PATH = os.path.join("poker_charts", "charts.bin")
+_HEADER = struct.Struct("<4sII")
+_ALIGN = 16
+
+# Colour-coded action list used when a chart file carries no "actions" table.
+DEFAULT_ACTIONS = [
+    {'label': 'Raise', 'color': '#f87171'},
+    {'label': 'Raise for value', 'color': '#dc2626'},
+    {'label': 'Raise as a bluff', 'color': '#9333ea'},
+    {'label': '3-bet for value', 'color': '#ef4444'},
+    {'label': '3-bet as a bluff', 'color': '#8b5cf6'},
+    {'label': '4-bet for value', 'color': '#b91c1c'},
+    {'label': '4-bet as a bluff', 'color': '#7e22ce'},
+    {'label': 'Call', 'color': '#22c55e'},
+    {'label': 'Limp', 'color': '#22c55e'},
+    {'label': 'Fold', 'color': '#a1a1aa'}
+]
+FALLBACK_COLOR = '#71717a'
+
+
+def source_stamp(path):
+    # Pending journal records are part of the chart, so they count as a change too.
+    base, journal = chart_journal.files_stamp(path)
+    return list(base) + list(journal or ())
+
+
+def iter_chart_files(index_data, base_dir="."):
+    """Yield (game_type, chart_name, path) for every chart listed in index.json."""
+    for game_type, charts in index_data.items():
+        for chart_name, rel_path in charts.items():
+            yield game_type, chart_name, os.path.join(base_dir, rel_path)
+
+
+def compile_chart_data(chart_data):
+    """
+    Turn one parsed chart file into {(situation, scenario): {hand_slot: cell}},
+    where a cell is a label or a {label: frequency} mix.
+    Unknown hand keys are skipped; they cannot be addressed from the grid anyway.
+    """
+    compiled = {}
+    for situation, scenarios in chart_data.get("charts", {}).items():
+        for scenario, state in scenarios.items():
+            if not isinstance(state, dict):
+                continue
+            compiled[(situation, scenario)] = {
+                HAND_SLOTS[hand]: cell for hand, cell in state.items() if hand in HAND_SLOTS
+            }
+    return compiled
+
+
+def compile_store(index_path="index.json", store_path=STORE_PATH, workers=0):
+    """
+    Compile every chart referenced by index_path into store_path.
+    Files that fail validation are reported and left out of the store.
+    Returns a list of (path, error message) for the skipped files.
+    """
+    # The compiler validates/normalises files (in parallel, with a content-hash
+    # cache) and calls write_store with the results.
+    from chart_compiler import build
+    results = build(index_path, store_path, workers=workers)
+    return [(r["path"], r["errors"][0][2]) for r in results if r["errors"]]
+
+
+def write_store(store_path, charts, sources, digests=None):
+    """
+    Write a store from already validated charts.
+    charts: list of (game_type, chart_name, chart_data); sources: {path: stamp}
+    for staleness checks (see source_stamp); digests: {path: content hash}.
+    """
+    labels = []
+    label_codes = {}
+    colors = {a['label']: a['color'] for a in DEFAULT_ACTIONS}
+    scenario_keys = []
+    rows = []
+    mixed_cells = {}  # row -> {slot: {label: freq}}
+    charts_meta = {}
+
+    for game_type, chart_name, chart_data in charts:
+        for action in chart_data.get("actions", []):
+            colors[action['label']] = action['color']
+        charts_meta.setdefault(game_type, {})[chart_name] = {
+            key: chart_data[key] for key in ("table_size", "stack_depth", "ante") if key in chart_data
+        }
+
+        for (situation, scenario), cells in compile_chart_data(chart_data).items():
+            row = np.zeros(169, dtype=np.uint8)
+            for slot, cell in cells.items():
+                mix = cell_mix(cell)
+                for label in mix:
+                    if label not in label_codes:
+                        labels.append(label)
+                        label_codes[label] = len(labels)
+                if isinstance(cell, dict):
+                    # Code set below from the stored frequencies, remainder included
+                    mixed_cells.setdefault(len(rows), {})[slot] = mix
+                elif mix:
+                    row[slot] = label_codes[cell]
+            scenario_keys.append([game_type, chart_name, situation, scenario])
+            rows.append(row)
+
+    if len(labels) > 255:
+        raise ValueError(f"Quá nhiều nhãn hành động ({len(labels)}), tối đa 255.")
+
+    # Frequency tensors for mixed scenarios; pure cells are one-hot rows.
+    mixed_rows = sorted(mixed_cells)
+    freqs = np.zeros((len(mixed_rows), 169, len(labels)), dtype=np.float16)
+    for m, row_index in enumerate(mixed_rows):
+        codes_row = rows[row_index]
+        for slot in np.flatnonzero(codes_row):
+            freqs[m, slot, codes_row[slot] - 1] = 1.0
+        for slot, mix in mixed_cells[row_index].items():
+            freqs[m, slot] = 0
+            for label, freq in mix.items():
+                freqs[m, slot, label_codes[label] - 1] = freq
+        # Codes of a mixed scenario come from its stored (float16) frequencies
+        rows[row_index][:] = dominant_codes(freqs[m])
+
+    meta = {
+        "labels": labels,
+        "colors": [colors.get(label, FALLBACK_COLOR) for label in labels],
+        "scenarios": scenario_keys,
+        "mixed_rows": mixed_rows,
+        "charts": charts_meta,
+        "sources": sources,
+        "digests": digests or {},
+    }
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    data_offset = _HEADER.size + len(meta_bytes)
+    padding = (-data_offset) % _ALIGN
+    codes = np.stack(rows) if rows else np.zeros((0, 169), dtype=np.uint8)
+
+    # Write to a unique temp file and rename so readers never map a half-written
+    # store, and two writers (editor recompile, server reload) never share a temp file.
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(store_path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(store_path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(STORE_MAGIC, STORE_VERSION, len(meta_bytes)))
+            f.write(meta_bytes)
+            f.write(b"\0" * padding)
+            f.write(codes.tobytes())
+            f.write(b"\0" * ((-(data_offset + padding + codes.nbytes)) % _ALIGN))
+            f.write(freqs.tobytes())
+        # On Windows this fails while another process still maps the old store.
+        os.replace(tmp_path, store_path)
+    except OSError as e:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise OSError(f"Không thể ghi chart store {store_path}: {e}") from e
+
+
+class ChartStore:
+    """Read-only, memory-mapped view of a compiled chart store."""
+
+    def __init__(self, store_path=STORE_PATH):
+        self.store_path = store_path
+        self._file = open(store_path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, version, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError(f"File store không hợp lệ hoặc sai phiên bản: {store_path}")
+
+        meta = json.loads(self._mm[_HEADER.size:_HEADER.size + meta_len].decode('utf-8'))
+        data_offset = _HEADER.size + meta_len
+        data_offset += (-data_offset) % _ALIGN
+
+        self.labels = meta["labels"]
+        self.colors = meta["colors"]
+        self.charts = meta["charts"]
+        self.sources = meta["sources"]
+        self.digests = meta.get("digests", {})
+        # Code -> label; slot 0 is "no entry".
+        self.code_labels = [None] + self.labels
+        self.label_codes = {label: code for code, label in enumerate(self.labels, start=1)}
+        self.scenario_rows = {tuple(key): row for row, key in enumerate(meta["scenarios"])}
+        self.codes = np.frombuffer(self._mm, dtype=np.uint8, count=len(self.scenario_rows) * 169,
+                                   offset=data_offset).reshape(-1, 169)
+        freqs_offset = data_offset + self.codes.nbytes
+        freqs_offset += (-freqs_offset) % _ALIGN
+        self.mixed_rows = {row: m for m, row in enumerate(meta["mixed_rows"])}
+        self.freqs = np.frombuffer(self._mm, dtype=np.float16,
+                                   count=len(self.mixed_rows) * 169 * len(self.labels),
+                                   offset=freqs_offset).reshape(-1, 169, len(self.labels))
+        self._cumulative = {}
+
+    def close(self):
+        self.codes = None
+        self.freqs = None
+        if getattr(self, "_mm", None) is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # A caller still holds a view into the mapping; let GC release it.
+                pass
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_stale(self):
+        """True if any compiled source file changed (or vanished) since compilation."""
+        for path, stamp in self.sources.items():
+            try:
+                if source_stamp(path) != stamp:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def has_scenario(self, game_type, chart_name, situation, scenario):
+        return (game_type, chart_name, situation, scenario) in self.scenario_rows
+
+    def scenario_codes(self, game_type, chart_name, situation, scenario):
+        """The 169-slot uint8 code row of a scenario (a view into the mapped file)."""
+        return self.codes[self.scenario_rows[(game_type, chart_name, situation, scenario)]]
+
+    def lookup(self, game_type, chart_name, situation, scenario, hand, default="Fold"):
+        """Action label for a canonical hand name such as "AKs", "77" or "T9o"."""
+        code = self.scenario_codes(game_type, chart_name, situation, scenario)[HAND_SLOTS[hand]]
+        return self.code_labels[code] or default
+
+    def lookup_classes(self, game_type, chart_name, situation, scenario, classes, default="Fold"):
+        """
+        Action labels for an array of grid classes (see hand_index) in one call.
+        Invalid classes (-1) and empty cells come back as `default`.
+        """
+        codes = class_actions(self.scenario_codes(game_type, chart_name, situation, scenario), classes)
+        label_table = np.array([default] + self.labels, dtype=object)
+        return label_table[codes]
+
+    def scenario_freqs(self, game_type, chart_name, situation, scenario):
+        """(169, n_labels) frequencies of a scenario; label-only scenarios come back one-hot."""
+        row = self.scenario_rows[(game_type, chart_name, situation, scenario)]
+        if row in self.mixed_rows:
+            return self.freqs[self.mixed_rows[row]]
+        return np.eye(len(self.labels) + 1, dtype=np.float16)[self.codes[row]][:, 1:]
+
+    def lookup_mix(self, game_type, chart_name, situation, scenario, hand):
+        """{label: frequency} of one hand; empty if the chart has no entry for it."""
+        freqs = self.scenario_freqs(game_type, chart_name, situation, scenario)[HAND_SLOTS[hand]]
+        return {self.labels[a]: float(freqs[a]) for a in np.flatnonzero(freqs > 0)}
+
+    def sample_classes(self, game_type, chart_name, situation, scenario, classes, rng=None, default="Fold"):
+        """Randomized actions for an array of grid classes, following the mixed frequencies."""
+        key = (game_type, chart_name, situation, scenario)
+        cumulative = self._cumulative.get(key)
+        if cumulative is None:
+            cumulative = self._cumulative[key] = cumulative_table(self.scenario_freqs(*key))
+        return sample_from_cumulative(cumulative, self.labels, classes, rng or np.random.default_rng(), default)
+
+    def color_of(self, label):
+        code = self.label_codes.get(label)
+        return self.colors[code - 1] if code else FALLBACK_COLOR
+
+
+def load_or_compile(index_path="index.json", store_path=STORE_PATH):
+    """Open the store, recompiling it first if it is missing or out of date."""
+    if os.path.exists(store_path):
+        try:
+            store = ChartStore(store_path)
+            if not store.is_stale():
+                return store
+            store.close()
+        except Exception as e:
+            print(f"Không thể mở chart store, biên dịch lại: {e}")
+
+    for path, error in compile_store(index_path, store_path):
+        print(f"Bỏ qua file chart lỗi '{path}': {error}")
+    return ChartStore(store_path)
+
+
+if __name__ == "__main__":
+    skipped = compile_store()
+    for path, error in skipped:
+        print(f"Bỏ qua file chart lỗi '{path}': {error}")
+    with ChartStore() as store:
+        print(f"Đã biên dịch {len(store.scenario_rows)} kịch bản, {len(store.labels)} hành động vào {STORE_PATH}")
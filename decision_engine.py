@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import chart_store
+import hand_index
+from scenario_resolver import RFI, ScenarioIndex, ScenarioKey, normalize_position, normalize_table_size
+from stack_depth import StackDepthTable
+
+# --- HEADLESS DECISION ENGINE ---
+# DecisionEngine answers (game type, chart, situation, scenario, hands[]) -> actions
+# without any Tk widgets. DecisionServer loads index.json and every chart once
+# and serves many tables/agents over a local socket with a JSON-lines protocol:
+#
+#   -> {"op": "decide" | "sample", "game_type": ..., "chart": ..., "situation": ..., "scenario": ..., "hands": [...]}
+#   -> {"op": "situation", "table_size": 6, "hero": "BTN", "opener": "CO", "action": "vs_RFI", "hands": [...]}
+#   -> {"op": "stack", "game_type": "Tournament", "stack_bb": 31.5, "table_size": 9, "hero": ..., ...}
+#   <- {"actions": [...]}            or   {"error": "...", "kind": "not_found" | "bad_request" | "internal"}
+#
+# Invalid hands come back as null so one bad read does not fail the batch.
+# The server checks the chart files (and their journals) for edits at most once
+# per RELOAD_CHECK_INTERVAL seconds, so saves in the editor reach every table.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class DecisionRequestError(ValueError):
+    """The server rejected a request as malformed or unsupported (not a missing scenario)."""
+
+
+class DecisionEngine:
+    def __init__(self, index_path="index.json", store_path=None, default_action="Fold"):
+        self.index_path = index_path
+        # The compiled store lives next to the charts, wherever the caller runs from.
+        self.store_path = store_path or os.path.join(os.path.dirname(os.path.abspath(index_path)), chart_store.STORE_PATH)
+        self.default_action = default_action
+        self._lock = threading.Lock()
+        store = chart_store.load_or_compile(index_path, self.store_path)
+        # (store, scenario index, depth tables) are replaced together by one assignment,
+        # so a request always sees a matching set, even during a reload.
+        self._loaded = (store, ScenarioIndex.from_store(store), {})
+        self._checked_at = time.monotonic()
+
+    @property
+    def store(self):
+        return self._loaded[0]
+
+    @property
+    def scenarios(self):
+        return self._loaded[1]
+
+    def maybe_reload(self, interval=RELOAD_CHECK_INTERVAL):
+        """reload_if_stale, but stat the chart files at most once per `interval` seconds."""
+        now = time.monotonic()
+        if now - self._checked_at < interval:
+            return
+        self._checked_at = now
+        self.reload_if_stale()
+
+    def reload_if_stale(self):
+        """
+        Recompile and remap the store if a chart file changed on disk. The new
+        store is built before it replaces the old one; if that fails the old store
+        keeps serving. The old store is not closed explicitly: requests that
+        fetched it before the swap keep using it, and its mapping is released
+        once the last of them drops it.
+        """
+        with self._lock:
+            if not self.store.is_stale():
+                return
+            try:
+                store = chart_store.load_or_compile(self.index_path, self.store_path)
+                scenarios = ScenarioIndex.from_store(store)
+            except Exception as e:
+                print(f"Không thể nạp lại chart, tiếp tục dùng bản cũ: {e}")
+                return
+            self._loaded = (store, scenarios, {})
+
+    def depth_table(self, game_type):
+        """StackDepthTable over every depth of a game type, built on first use."""
+        store, scenarios, depth_tables = self._loaded
+        table = depth_tables.get(game_type)
+        if table is None:
+            table = depth_tables[game_type] = StackDepthTable(store, scenarios, game_type, default=self.default_action)
+        return table
+
+    def decide_stack(self, game_type, stack_bb, table_size, hero, opener, action, hands, interpolate=False):
+        """
+        Actions at an arbitrary effective stack (e.g. 31.5 BB) without picking a
+        chart: nearest depth, or interpolated frequencies between the two
+        bracketing depths. Raises KeyError if no depth covers the situation.
+        """
+        key = ScenarioKey(normalize_table_size(table_size), normalize_position(hero) or hero,
+                          opener and (normalize_position(opener) or opener), action)
+        table = self.depth_table(game_type)
+        if not table.has_key(key):
+            raise KeyError(f"Không có chart theo độ sâu stack cho tình huống: {game_type} / {key}")
+        classes = hand_index.texts_to_classes(hands)
+        actions = table.lookup(stack_bb, key, classes, interpolate)
+        return [None if cls < 0 else action for cls, action in zip(classes, actions)]
+
+    def resolve(self, table_size, hero, opener=None, action=RFI, game_type=None, chart_name=None):
+        """ScenarioRef for a structured situation (see scenario_resolver), or None."""
+        return self.scenarios.resolve(table_size, hero, opener, action, game_type, chart_name)
+
+    def decide_situation(self, table_size, hero, opener, action, hands, game_type=None, chart_name=None, sample=False):
+        """
+        decide_batch/sample_batch for a situation read off the table, e.g.
+        (6, "BTN", "CO", VS_RFI). Raises KeyError if no chart covers it.
+        """
+        store, scenarios, _ = self._loaded
+        ref = scenarios.resolve(table_size, hero, opener, action, game_type, chart_name)
+        if ref is None:
+            raise KeyError(f"Không có chart cho tình huống: {table_size} / {hero} / {opener} / {action}")
+        return self._lookup(store, ref.game_type, ref.chart, ref.situation, ref.scenario, hands, sample)
+
+    def charts(self):
+        """{game_type: {chart_name: {situation: [scenario, ...]}}} of everything loaded."""
+        listing = {}
+        for game_type, chart_name, situation, scenario in self.store.scenario_rows:
+            listing.setdefault(game_type, {}).setdefault(chart_name, {}).setdefault(situation, []).append(scenario)
+        return listing
+
+    def decide(self, game_type, chart_name, situation, scenario, hand):
+        return self.decide_batch(game_type, chart_name, situation, scenario, [hand])[0]
+
+    def decide_batch(self, game_type, chart_name, situation, scenario, hands):
+        """
+        Actions for many hands in one scenario. Hands may be chart keys ("AKs") or
+        exact cards ("AhKd"); invalid hands map to None.
+        Raises KeyError if the scenario is not in the store.
+        """
+        return self._lookup(self.store, game_type, chart_name, situation, scenario, hands)
+
+    def sample_batch(self, game_type, chart_name, situation, scenario, hands, rng=None):
+        """
+        Like decide_batch, but mixed-frequency cells are played at random with their
+        frequencies (one vectorized draw for the whole batch).
+        """
+        return self._lookup(self.store, game_type, chart_name, situation, scenario, hands, True, rng)
+
+    def _lookup(self, store, game_type, chart_name, situation, scenario, hands, sample=False, rng=None):
+        if not store.has_scenario(game_type, chart_name, situation, scenario):
+            raise KeyError(f"Không tìm thấy kịch bản: {game_type} / {chart_name} / {situation} / {scenario}")
+        classes = hand_index.texts_to_classes(hands)
+        if sample:
+            actions = store.sample_classes(game_type, chart_name, situation, scenario, classes, rng, self.default_action)
+        else:
+            actions = store.lookup_classes(game_type, chart_name, situation, scenario, classes, self.default_action)
+        return [None if cls < 0 else action for cls, action in zip(classes, actions)]
+
+
+class _BadRequest(Exception):
+    pass
+
+
+class _Request(dict):
+    def __missing__(self, name):
+        raise _BadRequest(f"Thiếu trường dữ liệu: {name}")
+
+
+class _DecisionRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        engine = self.server.engine
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                try:
+                    request = _Request(json.loads(line))
+                except (ValueError, TypeError) as e:
+                    raise _BadRequest(f"Yêu cầu không hợp lệ: {e}")
+                engine.maybe_reload()
+                op = request.get("op", "decide")
+                if op == "decide":
+                    response = {"actions": engine.decide_batch(
+                        request["game_type"], request["chart"], request["situation"],
+                        request["scenario"], request["hands"])}
+                elif op == "sample":
+                    response = {"actions": engine.sample_batch(
+                        request["game_type"], request["chart"], request["situation"],
+                        request["scenario"], request["hands"])}
+                elif op == "situation":
+                    response = {"actions": engine.decide_situation(
+                        request["table_size"], request["hero"], request.get("opener"),
+                        request.get("action", RFI), request["hands"], request.get("game_type"),
+                        request.get("chart"), request.get("sample", False))}
+                elif op == "stack":
+                    response = {"actions": engine.decide_stack(
+                        request["game_type"], request["stack_bb"], request["table_size"], request["hero"],
+                        request.get("opener"), request.get("action", RFI), request["hands"],
+                        request.get("interpolate", False))}
+                elif op == "charts":
+                    response = {"charts": engine.charts()}
+                elif op == "ping":
+                    response = {"ok": True}
+                else:
+                    raise _BadRequest(f"Không hỗ trợ op: {op}")
+            except _BadRequest as e:
+                response = {"error": str(e), "kind": "bad_request"}
+            except KeyError as e:
+                response = {"error": str(e.args[0]) if e.args else "Không tìm thấy kịch bản", "kind": "not_found"}
+            except Exception as e:
+                response = {"error": str(e), "kind": "internal"}
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+
+
+class _TCPDecisionServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixDecisionServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixDecisionServer = None
+
+
+def create_server(engine, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    """A threaded server sharing one engine; each connection gets its own thread."""
+    if unix_path:
+        if _UnixDecisionServer is None:
+            raise OSError("Unix socket không được hỗ trợ trên hệ điều hành này.")
+        if os.path.exists(unix_path):
+            os.remove(unix_path)  # Stale socket from a previous run
+        server = _UnixDecisionServer(unix_path, _DecisionRequestHandler)
+    else:
+        server = _TCPDecisionServer((host, port), _DecisionRequestHandler)
+    server.engine = engine
+    return server
+
+
+class DecisionClient:
+    """Persistent connection to a DecisionServer with the same API as DecisionEngine."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, timeout=2.0):
+        if unix_path:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(unix_path)
+        else:
+            self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def _call(self, request):
+        with self._lock:
+            self._file.write(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("Máy chủ quyết định đã đóng kết nối.")
+        response = json.loads(line)
+        if "error" in response:
+            kind = response.get("kind", "not_found")
+            if kind == "not_found":
+                raise KeyError(response["error"])
+            if kind == "bad_request":
+                raise DecisionRequestError(response["error"])
+            raise RuntimeError(f"Lỗi máy chủ quyết định: {response['error']}")
+        return response
+
+    def charts(self):
+        return self._call({"op": "charts"})["charts"]
+
+    def decide(self, game_type, chart_name, situation, scenario, hand):
+        return self.decide_batch(game_type, chart_name, situation, scenario, [hand])[0]
+
+    def decide_batch(self, game_type, chart_name, situation, scenario, hands):
+        return self._call({"op": "decide", "game_type": game_type, "chart": chart_name,
+                           "situation": situation, "scenario": scenario, "hands": list(hands)})["actions"]
+
+    def decide_situation(self, table_size, hero, opener, action, hands, game_type=None, chart_name=None, sample=False):
+        return self._call({"op": "situation", "table_size": table_size, "hero": hero, "opener": opener,
+                           "action": action, "hands": list(hands), "game_type": game_type,
+                           "chart": chart_name, "sample": sample})["actions"]
+
+    def decide_stack(self, game_type, stack_bb, table_size, hero, opener, action, hands, interpolate=False):
+        return self._call({"op": "stack", "game_type": game_type, "stack_bb": stack_bb,
+                           "table_size": table_size, "hero": hero, "opener": opener, "action": action,
+                           "hands": list(hands), "interpolate": interpolate})["actions"]
+
+    def sample_batch(self, game_type, chart_name, situation, scenario, hands):
+        return self._call({"op": "sample", "game_type": game_type, "chart": chart_name,
+                           "situation": situation, "scenario": scenario, "hands": list(hands)})["actions"]
+
+
+def connect_or_load(index_path="index.json", host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    """Use the shared decision server if one is running, otherwise load the charts locally."""
+    try:
+        return DecisionClient(host, port, unix_path)
+    except OSError:
+        print("Không kết nối được máy chủ quyết định, tải chart trong tiến trình này.")
+        return DecisionEngine(index_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Máy chủ quyết định preflop dùng chung cho nhiều bàn.")
+    parser.add_argument("--index", default="index.json")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="Đường dẫn Unix socket (thay cho TCP localhost)")
+    args = parser.parse_args()
+
+    engine = DecisionEngine(args.index)
+    server = create_server(engine, args.host, args.port, args.unix)
+    print(f"Máy chủ quyết định đang chạy tại {args.unix or f'{args.host}:{args.port}'} "
+          f"({len(engine.store.scenario_rows)} kịch bản)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,281 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from capture_sources import FrameBuffers
+
+# --- GHI KHUNG HÌNH BẤT ĐỒNG BỘ ---
+# Thay vì nén PNG cho từng ảnh chụp ngay trên vòng lặp chính, FrameRecorder
+# chép khung hình vào buffer cấp sẵn và đưa vào hàng đợi; một luồng nền ghi
+# dữ liệu thô (không nén) vào một file vòng (ring file) được ánh xạ bộ nhớ.
+# File chứa `retention` ô cố định, khung mới ghi đè khung cũ nhất, kèm bảng
+# chỉ mục (số thứ tự, thời điểm, kích thước, bàn). Khi cần xem lại, xuất các
+# khung đã chọn ra PNG:
+#
+#   python frame_recorder.py list test_captures/frames.ring
+#   python frame_recorder.py export test_captures/frames.ring --out test_captures/export [--table T] [--last 20]
+#
+# Tên file PNG xuất ra có dạng capture_<thời điểm>.png nên ReplaySource
+# (capture_sources.py) phát lại được đúng nhịp như lúc ghi.
+
+RING_MAGIC = b"FRMRING1"
+# Số khung giữ lại mặc định: 20 giây ở 5 khung/giây. File được cấp trước đủ
+# retention ô, mỗi ô bằng một khung thô (bàn 1000x700 BGRA ≈ 2.8 MB, toàn màn
+# hình 1920x1080 BGRA ≈ 8.3 MB), nên 100 khung chiếm khoảng 280 MB - 830 MB đĩa
+RECORDER_RETENTION = 100
+RECORDER_QUEUE_SIZE = 8
+_HEADER_BYTES = 64
+_DATA_ALIGN = 4096
+INDEX_DTYPE = np.dtype([("seq", "<i8"), ("timestamp", "<f8"), ("height", "<i4"), ("width", "<i4"),
+                        ("channels", "<i4"), ("table", "S52")])
+
+
+def _align(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+
+class RingFile:
+    """
+    File vòng ánh xạ bộ nhớ: header (magic, số ô, số byte mỗi ô, số thứ tự kế
+    tiếp), bảng chỉ mục INDEX_DTYPE rồi tới `slots` ô dữ liệu ảnh thô.
+    """
+
+    def __init__(self, path, slots=None, slot_bytes=None):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= _HEADER_BYTES
+        if exists:
+            header = np.fromfile(path, dtype="<i8", count=_HEADER_BYTES // 8)
+            same_magic = header[:1].tobytes() == RING_MAGIC
+            if slots is None or slot_bytes is None:
+                if not same_magic:
+                    raise ValueError(f"{path} không phải file ghi khung hình")
+                slots, slot_bytes = int(header[1]), int(header[2])
+            # File cũ có cấu hình khác thì tạo lại từ đầu
+            exists = same_magic and (int(header[1]), int(header[2])) == (slots, slot_bytes)
+        elif slots is None or slot_bytes is None:
+            raise FileNotFoundError(path)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.data_offset = _align(_HEADER_BYTES + slots * INDEX_DTYPE.itemsize, _DATA_ALIGN)
+        size = self.data_offset + slots * slot_bytes
+        self.mm = np.memmap(path, dtype=np.uint8, mode="r+" if exists else "w+", shape=(size,))
+        self.header = self.mm[:_HEADER_BYTES].view("<i8")
+        self.index = self.mm[_HEADER_BYTES:_HEADER_BYTES + slots * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+        if not exists:
+            self.header[:] = 0
+            self.header[0] = np.frombuffer(RING_MAGIC, dtype="<i8")[0]
+            self.header[1:3] = (slots, slot_bytes)
+            self.index["seq"] = -1
+
+    @property
+    def next_seq(self):
+        return int(self.header[3])
+
+    def write(self, frame, timestamp, table=""):
+        """Ghi frame vào ô kế tiếp (đè lên khung cũ nhất); trả về số thứ tự của khung."""
+        seq = self.next_seq
+        slot = seq % self.slots
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        index = self.index
+        # Đánh dấu ô đang ghi dở trước, nếu dừng giữa chừng ô sẽ bị bỏ qua khi đọc
+        index["seq"][slot] = -1
+        start = self.data_offset + slot * self.slot_bytes
+        self.mm[start:start + frame.nbytes].reshape(frame.shape)[:] = frame
+        index["timestamp"][slot] = timestamp
+        index["height"][slot], index["width"][slot], index["channels"][slot] = height, width, channels
+        index["table"][slot] = str(table).encode("utf-8")[:INDEX_DTYPE["table"].itemsize]
+        index["seq"][slot] = seq
+        self.header[3] = seq + 1
+        return seq
+
+    def entries(self):
+        """Chỉ mục các khung còn giữ, theo thứ tự ghi."""
+        valid = self.index[self.index["seq"] >= 0]
+        return valid[np.argsort(valid["seq"])]
+
+    def read(self, entry):
+        """Mảng trỏ thẳng vào dữ liệu của khung `entry` (không sao chép)."""
+        slot = int(entry["seq"]) % self.slots
+        height, width, channels = int(entry["height"]), int(entry["width"]), int(entry["channels"])
+        start = self.data_offset + slot * self.slot_bytes
+        frame = self.mm[start:start + height * width * channels].reshape(height, width, channels)
+        return frame[:, :, 0] if channels == 1 else frame
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.flush()
+        self.header = self.index = None
+        self.mm = None
+
+
+class FrameRecorder:
+    """
+    Ghi khung hình ở luồng nền. record() chỉ chép ảnh vào buffer cấp sẵn rồi
+    trả về ngay; khi hàng đợi đầy (đĩa không theo kịp), khung mới bị bỏ và
+    được đếm trong stats["dropped"].
+    File vòng được tạo ở khung đầu tiên, mỗi ô `slot_bytes` byte (mặc định:
+    kích thước khung đầu tiên). Khung lớn hơn (cửa sổ được phóng to) khiến file
+    được tạo lại với ô lớn hơn, các khung đã ghi trước đó bị bỏ.
+    """
+
+    def __init__(self, path, retention=RECORDER_RETENTION, slot_bytes=None, queue_size=RECORDER_QUEUE_SIZE):
+        self.path = path
+        self.retention = retention
+        self.slot_bytes = slot_bytes
+        self.queue_size = queue_size
+        self.ring = None
+        # Các khung trong hàng đợi (kể cả khung đang ghi) + một buffer cho khung kế tiếp
+        self._buffers = FrameBuffers(queue_size + 1)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+        self.stats = {"recorded": 0, "dropped": 0, "resized": 0}
+
+    def record(self, table_id, frame, timestamp=None):
+        """Xếp một khung hình vào hàng đợi ghi; trả về False nếu khung bị bỏ."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._queue) >= self.queue_size:
+                self.stats["dropped"] += 1
+                return False
+            copy = self._buffers.copy(frame)
+            self._queue.append((table_id, timestamp, copy))
+            self._cond.notify()
+        return True
+
+    def _open(self, frame):
+        slot_bytes = max(self.slot_bytes or 0, _align(frame.nbytes, _DATA_ALIGN))
+        if self.ring is not None:
+            print(f"Khung hình {frame.shape[1]}x{frame.shape[0]} lớn hơn ô ghi: tạo lại {self.path}")
+            self.ring.close()
+            self.stats["resized"] += 1
+        else:
+            # Ghi tiếp vào file của phiên trước nếu cấu hình vẫn phù hợp
+            try:
+                existing = RingFile(self.path)
+            except (OSError, ValueError):
+                existing = None
+            if existing is not None and existing.slots == self.retention and existing.slot_bytes >= slot_bytes:
+                self.ring = existing
+                self.slot_bytes = existing.slot_bytes
+                return
+            if existing is not None:
+                existing.close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        print(f"Tạo file ghi {self.path}: {self.retention} khung x {slot_bytes / 1e6:.1f} MB "
+              f"= {self.retention * slot_bytes / 1e9:.2f} GB")
+        self.ring = RingFile(self.path, self.retention, slot_bytes)
+        self.slot_bytes = self.ring.slot_bytes
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                table_id, timestamp, frame = self._queue[0]
+            try:
+                if self.ring is None or frame.nbytes > self.ring.slot_bytes:
+                    self._open(frame)
+                self.ring.write(frame, timestamp, table_id)
+                self.stats["recorded"] += 1
+            except (OSError, ValueError) as e:
+                print(f"Không thể ghi khung hình vào {self.path}: {e}")
+                self.stats["dropped"] += 1
+            with self._cond:
+                # Chỉ bỏ khỏi hàng đợi sau khi ghi xong để buffer không bị dùng lại giữa chừng
+                self._queue.popleft()
+
+    def close(self):
+        """Ghi nốt các khung còn trong hàng đợi rồi đóng file."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+def export_frames(path, out_dir, table=None, last=None, seqs=None, since=None):
+    """
+    Xuất các khung đã chọn trong file vòng ra PNG.
+
+    Args:
+        table: chỉ lấy khung của bàn này
+        last: chỉ lấy `last` khung mới nhất (sau khi lọc)
+        seqs: (đầu, cuối) khoảng số thứ tự, tính cả hai đầu
+        since: chỉ lấy khung ghi từ thời điểm này (time.time())
+    Returns:
+        Danh sách đường dẫn file PNG đã ghi
+    """
+    ring = RingFile(path)
+    entries = ring.entries()
+    if table is not None:
+        entries = entries[entries["table"] == str(table).encode("utf-8")]
+    if seqs is not None:
+        entries = entries[(entries["seq"] >= seqs[0]) & (entries["seq"] <= seqs[1])]
+    if since is not None:
+        entries = entries[entries["timestamp"] >= since]
+    if last:
+        entries = entries[-last:]
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for entry in entries:
+        file = os.path.join(out_dir, f"capture_{entry['timestamp']:.3f}.png")
+        cv2.imwrite(file, ring.read(entry))
+        written.append(file)
+    ring.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Xem và xuất khung hình từ file ghi của RealTimeAgent.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="Liệt kê các khung còn giữ trong file")
+    listing.add_argument("ring")
+    export = commands.add_parser("export", help="Xuất khung hình ra PNG")
+    export.add_argument("ring")
+    export.add_argument("--out", required=True, help="Thư mục ghi PNG")
+    export.add_argument("--table", help="Chỉ xuất khung của bàn này")
+    export.add_argument("--last", type=int, help="Chỉ xuất N khung mới nhất")
+    export.add_argument("--seq", help="Khoảng số thứ tự, ví dụ 120-180")
+    export.add_argument("--since", type=float, help="Chỉ xuất khung từ thời điểm này (giây, time.time())")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        ring = RingFile(args.ring)
+        entries = ring.entries()
+        print(f"{len(entries)}/{ring.slots} khung, mỗi ô {ring.slot_bytes} byte")
+        for entry in entries:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["timestamp"]))
+            print(f"  {entry['seq']:>8}  {stamp}  {entry['width']}x{entry['height']}  "
+                  f"{entry['table'].decode('utf-8', 'replace')}")
+        ring.close()
+        return 0
+
+    seqs = None
+    if args.seq:
+        first, _, last = args.seq.partition("-")
+        seqs = (int(first), int(last or first))
+    written = export_frames(args.ring, args.out, args.table, args.last, seqs, args.since)
+    print(f"Đã xuất {len(written)} khung hình vào {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
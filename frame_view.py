@@ -0,0 +1,63 @@
+import cv2
+
+# --- MỘT KHUNG HÌNH, NHIỀU ROI ---
+# Khung hình đi từ bước chụp tới bước nhận diện dưới dạng một buffer duy nhất
+# (BGRA từ mss/dxcam, BGR từ replay, hoặc ảnh xám). Mọi ROI là view NumPy trên
+# buffer đó; mỗi ROI được chuyển sang BGR hoặc sang ảnh xám nhiều nhất một lần
+# và kết quả được dùng chung cho mọi bước (phát hiện thay đổi, hash quân bài,
+# đọc số, so khớp template). FrameView.stats đếm số lần cấp phát mỗi khung hình.
+
+_TO_COLOR = {4: cv2.COLOR_BGRA2BGR, 1: cv2.COLOR_GRAY2BGR}
+_TO_GRAY = {4: cv2.COLOR_BGRA2GRAY, 3: cv2.COLOR_BGR2GRAY}
+
+
+class FrameView:
+    """
+    Một khung hình và các ROI đã chuyển đổi của nó.
+    rect = (x, y, width, height) hoặc None cho toàn bộ khung hình.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.channels = image.shape[2] if image.ndim == 3 else 1
+        self._color = {}
+        self._gray = {}
+        self.stats = {"conversions": 0, "allocated_bytes": 0}
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def roi(self, rect=None):
+        """View (không sao chép) của vùng rect trên buffer gốc."""
+        if rect is None:
+            return self.image
+        x, y, w, h = rect
+        return self.image[y:y+h, x:x+w]
+
+    def _convert(self, cache, codes, rect):
+        area = self.roi(rect)
+        code = codes.get(self.channels)
+        if code is None or area.size == 0:
+            return area
+        if rect not in cache:
+            converted = cv2.cvtColor(area, code)
+            cache[rect] = converted
+            self.stats["conversions"] += 1
+            self.stats["allocated_bytes"] += converted.nbytes
+        return cache[rect]
+
+    def color(self, rect=None):
+        """ROI dạng BGR 3 kênh: view nếu khung hình đã là BGR, nếu không thì chuyển đổi một lần."""
+        if self.channels == 3:
+            return self.roi(rect)
+        return self._convert(self._color, _TO_COLOR, rect)
+
+    def gray(self, rect=None):
+        """ROI dạng ảnh xám, chuyển đổi một lần rồi dùng chung."""
+        return self._convert(self._gray, _TO_GRAY, rect)
+
+
+def as_frame(image):
+    """FrameView của image (giữ nguyên nếu đã là FrameView)."""
+    return image if isinstance(image, FrameView) else FrameView(image)
@@ -0,0 +1,143 @@
+import numpy as np
+
+# --- HAND INDEXING ---
+# Precomputed tables between the three ways a hand shows up in this project:
+#
+#   card     : 0..51, rank * 4 + suit ("Ah" -> 0 * 4 + 0)
+#   combo    : 0..1325, one per unordered pair of distinct cards
+#   class    : 0..168, a cell of the 13x13 chart grid (row i, column j -> i * 13 + j)
+#
+# Text forms ("AKs", "KAs", "ak", "AhKd", "Kd Ah", ...) are resolved with a
+# single dict lookup, and NumPy arrays of combos map to classes with one fancy
+# index, so scoring thousands of hands against a chart is one vectorized call.
+
+RANKS = ['A', 'K', 'Q', 'J', 'T', '9', '8', '7', '6', '5', '4', '3', '2']
+SUITS = ['h', 'd', 's', 'c']
+RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+CARD_NAMES = [rank + suit for rank in RANKS for suit in SUITS]
+CARD_INDEX = {name: i for i, name in enumerate(CARD_NAMES)}
+
+# Same layout as the 13x13 editor grid.
+HAND_NAMES = []
+for i, rank1 in enumerate(RANKS):
+    for j, rank2 in enumerate(RANKS):
+        if i < j: HAND_NAMES.append(f"{rank1}{rank2}s")
+        elif i > j: HAND_NAMES.append(f"{rank2}{rank1}o")
+        else: HAND_NAMES.append(f"{rank1}{rank2}")
+HAND_SLOTS = {hand: slot for slot, hand in enumerate(HAND_NAMES)}
+
+# Number of exact combos in each class: 6 for pairs, 4 suited, 12 offsuit.
+CLASS_COMBOS = np.array([6 if len(h) == 2 else 4 if h[2] == 's' else 12 for h in HAND_NAMES], dtype=np.uint8)
+
+
+def _class_of_cards(card1, card2):
+    r1, s1 = divmod(card1, 4)
+    r2, s2 = divmod(card2, 4)
+    if r1 > r2:
+        r1, r2 = r2, r1
+    if r1 == r2:
+        return r1 * 13 + r1
+    # Suited hands sit above the diagonal, offsuit hands below it.
+    return r1 * 13 + r2 if s1 == s2 else r2 * 13 + r1
+
+
+def _build_tables():
+    combo_cards = np.zeros((1326, 2), dtype=np.uint8)
+    combo_index = np.full((52, 52), -1, dtype=np.int16)
+    combo_class = np.zeros(1326, dtype=np.uint8)
+    combo = 0
+    for card1 in range(52):
+        for card2 in range(card1 + 1, 52):
+            combo_cards[combo] = (card1, card2)
+            combo_index[card1, card2] = combo_index[card2, card1] = combo
+            combo_class[combo] = _class_of_cards(card1, card2)
+            combo += 1
+    return combo_cards, combo_index, combo_class
+
+
+COMBO_CARDS, COMBO_INDEX, COMBO_CLASS = _build_tables()
+
+
+def _build_text_table():
+    # Keys are upper-cased with whitespace removed; see _text_key.
+    table = {}
+    for slot, hand in enumerate(HAND_NAMES):
+        r1, r2 = hand[0], hand[1]
+        forms = [hand, r2 + r1 + hand[2:]]
+        if len(hand) == 3 and hand[2] == 'o':
+            # A bare "AK" means offsuit, as the lookup tool always accepted.
+            forms += [r1 + r2, r2 + r1]
+        for form in forms:
+            table[form.upper()] = slot
+    for card1 in range(52):
+        for card2 in range(52):
+            if card1 != card2:
+                table[(CARD_NAMES[card1] + CARD_NAMES[card2]).upper()] = COMBO_CLASS[COMBO_INDEX[card1, card2]]
+    return table
+
+
+TEXT_TO_CLASS = _build_text_table()
+
+
+def _text_key(text):
+    return "".join(text.split()).upper()
+
+
+def hand_class(text):
+    """Grid class (0..168) of a typed or recognised hand, or None if it is not valid."""
+    slot = TEXT_TO_CLASS.get(_text_key(text))
+    return None if slot is None else int(slot)
+
+
+def canonical_hand(text):
+    """Chart key for any accepted text form ("KAs" -> "AKs", "AhKd" -> "AKo"), or None."""
+    slot = TEXT_TO_CLASS.get(_text_key(text))
+    return None if slot is None else HAND_NAMES[slot]
+
+
+def combo_index(cards):
+    """Combo index (0..1325) of an exact two-card hand such as "AhKd", or None."""
+    key = "".join(cards.split())
+    if len(key) != 4:
+        return None
+    card1 = CARD_INDEX.get(key[0].upper() + key[1].lower())
+    card2 = CARD_INDEX.get(key[2].upper() + key[3].lower())
+    if card1 is None or card2 is None or card1 == card2:
+        return None
+    return int(COMBO_INDEX[card1, card2])
+
+
+def combos_to_classes(combos):
+    """Vectorized combo index -> grid class for an array of any shape."""
+    return COMBO_CLASS[np.asarray(combos)]
+
+
+def cards_to_classes(cards):
+    """Vectorized (..., 2) array of card indices -> grid classes."""
+    cards = np.asarray(cards)
+    combos = COMBO_INDEX[cards[..., 0], cards[..., 1]]
+    if (combos < 0).any():
+        raise ValueError("Hai lá bài trong một hand phải khác nhau.")
+    return COMBO_CLASS[combos]
+
+
+def texts_to_classes(texts):
+    """Grid classes for a sequence of text hands; invalid entries become -1."""
+    return np.array([TEXT_TO_CLASS.get(_text_key(t), -1) for t in texts], dtype=np.int16)
+
+
+def class_actions(codes, classes):
+    """
+    Look up many hands in one 169-slot code row (e.g. ChartStore.scenario_codes).
+    Negative classes (invalid hands) come back as code 0, "no entry".
+    """
+    classes = np.asarray(classes)
+    result = np.asarray(codes)[np.clip(classes, 0, 168)]
+    return np.where(classes < 0, 0, result)
+
+
+def combo_actions(codes, combos):
+    """Action codes for an array of combo indices against one 169-slot code row."""
+    return np.asarray(codes)[COMBO_CLASS[np.asarray(combos)]]
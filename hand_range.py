@@ -0,0 +1,162 @@
+import numpy as np
+
+from hand_index import CLASS_COMBOS, HAND_NAMES, HAND_SLOTS, canonical_hand
+from scenario_resolver import RFI
+from strategy import cell_mix
+
+# --- RANGE ALGEBRA ---
+# A HandRange is a 169-bit set over the chart grid (bit i = grid class i, see
+# hand_index), stored in a Python int. Union/intersection/difference are single
+# integer ops and combo counts use popcounts over the pair/suited/offsuit masks
+# (6/4/12 combos per class), so questions across every chart cost microseconds.
+
+TOTAL_COMBOS = 1326
+# Labels that do not put money in the pot voluntarily.
+PASSIVE_LABELS = {"Fold", "Check"}
+
+
+def _mask_of(slots):
+    bits = 0
+    for slot in slots:
+        bits |= 1 << int(slot)
+    return bits
+
+
+_FULL_MASK = (1 << 169) - 1
+_COMBO_MASKS = [(_mask_of(np.flatnonzero(CLASS_COMBOS == weight)), weight) for weight in (6, 4, 12)]
+
+
+class HandRange:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=0):
+        self.bits = bits & _FULL_MASK
+
+    @classmethod
+    def from_hands(cls, hands):
+        """From chart keys or any text hand_index accepts ("AKs", "KAo", "AhKd", ...)."""
+        slots = []
+        for hand in hands:
+            canonical = canonical_hand(hand)
+            if canonical is None:
+                raise ValueError(f"Hand không hợp lệ: {hand}")
+            slots.append(HAND_SLOTS[canonical])
+        return cls(_mask_of(slots))
+
+    @classmethod
+    def from_mask(cls, mask):
+        """From a 169-element boolean array (e.g. codes == code for a store row)."""
+        packed = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+        return cls(int.from_bytes(packed.tobytes(), 'little'))
+
+    @classmethod
+    def from_state(cls, state, labels=None):
+        """
+        Hands of a {hand: cell} scenario dict that play any of `labels` (with any
+        frequency); by default every hand that is not folded or checked.
+        """
+        def wanted(label):
+            return label in labels if labels is not None else label not in PASSIVE_LABELS
+        return cls(_mask_of(HAND_SLOTS[h] for h, cell in state.items()
+                            if h in HAND_SLOTS and any(wanted(l) for l in cell_mix(cell))))
+
+    def __or__(self, other):
+        return HandRange(self.bits | other.bits)
+
+    def __and__(self, other):
+        return HandRange(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return HandRange(self.bits & ~other.bits)
+
+    def __xor__(self, other):
+        return HandRange(self.bits ^ other.bits)
+
+    def __invert__(self):
+        return HandRange(~self.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, HandRange) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __len__(self):
+        """Number of grid classes in the range."""
+        return self.bits.bit_count()
+
+    def __contains__(self, hand):
+        canonical = canonical_hand(hand)
+        return canonical is not None and bool(self.bits >> HAND_SLOTS[canonical] & 1)
+
+    def __iter__(self):
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield HAND_NAMES[low.bit_length() - 1]
+            bits ^= low
+
+    def __repr__(self):
+        return f"HandRange({len(self)} hands, {self.combos()} combos)"
+
+    def combos(self):
+        """Exact combos in the range: 6 per pair, 4 per suited hand, 12 per offsuit hand."""
+        return sum((self.bits & mask).bit_count() * weight for mask, weight in _COMBO_MASKS)
+
+    def percent(self):
+        """Share of all 1326 starting hands, in percent."""
+        return self.combos() * 100.0 / TOTAL_COMBOS
+
+    def to_mask(self):
+        return np.array([(self.bits >> slot) & 1 for slot in range(169)], dtype=bool)
+
+
+def scenario_ranges(store, game_type, chart_name, situation, scenario):
+    """
+    {label: HandRange} for one scenario of a compiled ChartStore. Like from_state, a mixed
+    cell counts in the range of every label it plays with any frequency, so a hand can sit
+    in several ranges; the unassigned remainder (default action) gets no range.
+    """
+    freqs = store.scenario_freqs(game_type, chart_name, situation, scenario)
+    return {label: HandRange.from_mask(freqs[:, a] > 0)
+            for a, label in enumerate(store.labels) if (freqs[:, a] > 0).any()}
+
+
+class ChartRanges:
+    """
+    Every scenario of a ChartStore converted to HandRanges once, for fast range queries.
+    Ranges follow scenario_ranges: a mixed hand is in the range of each action it plays.
+    """
+
+    def __init__(self, store):
+        self.by_scenario = {key: scenario_ranges(store, *key) for key in store.scenario_rows}
+
+    def ranges(self, game_type, chart_name, situation, scenario):
+        return self.by_scenario[(game_type, chart_name, situation, scenario)]
+
+    def action_range(self, game_type, chart_name, situation, scenario, *labels):
+        """Union of the ranges of `labels` in one scenario."""
+        result = HandRange()
+        for label, hand_range in self.ranges(game_type, chart_name, situation, scenario).items():
+            if label in labels:
+                result |= hand_range
+        return result
+
+    def played(self, game_type, chart_name, situation, scenario):
+        """Every hand that voluntarily puts money in (anything but fold/check)."""
+        result = HandRange()
+        for label, hand_range in self.ranges(game_type, chart_name, situation, scenario).items():
+            if label not in PASSIVE_LABELS:
+                result |= hand_range
+        return result
+
+    def percent_by_position(self, scenario_index, action=RFI, game_type=None, chart_name=None):
+        """
+        {ScenarioKey: percent played} for every situation of one action type,
+        e.g. open-raise % per position and table size, via a ScenarioIndex.
+        """
+        return {key: self.played(*scenario_index.resolve_key(key, game_type, chart_name)).percent()
+                for key in scenario_index.keys(game_type, chart_name) if key.action == action}
@@ -0,0 +1,316 @@
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from frame_view import as_frame
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# --- ĐỌC SỐ (BET / STACK) ---
+# Đọc các ô số bằng bộ phân loại ký tự theo template chụp từ font của site,
+# chạy ngay trong tiến trình (vài trăm micro giây mỗi ô). Chỉ khi có ký tự
+# không chắc chắn mới chuyển sang OCR, chạy trong một pool tiến trình giữ
+# sống suốt phiên (tesserocr nếu có, nếu không thì pytesseract).
+# Kết quả được ghi nhớ theo hash điểm ảnh của ROI, nên một ô không đổi giữa
+# các khung hình không bị đọc lại.
+
+# Template ký tự: ảnh cắt từ màn hình của đúng font site dùng (chữ trên nền),
+# có thể tạo bằng extract_glyph_templates() từ một ô đã biết giá trị.
+DIGIT_TEMPLATES = {c: f'templates/digits/digit_{c}.png' for c in '0123456789'}
+DIGIT_TEMPLATES.update({'$': 'templates/digits/digit_dollar.png', 'B': 'templates/digits/digit_B.png'})
+
+OCR_WHITELIST = "0123456789.$BB"
+OCR_CONFIG = f"--psm 7 -c tessedit_char_whitelist={OCR_WHITELIST}"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Kích thước chuẩn hóa (width, height) của một ký tự trước khi so khớp
+GLYPH_SIZE = (16, 24)
+# Ký tự thấp hơn tỉ lệ này so với ký tự cao nhất được coi là dấu chấm thập phân
+DOT_HEIGHT_RATIO = 0.4
+
+
+def parse_amount(text):
+    """
+    Số tiền trong một ô đã đọc: "12.5BB" -> (12.5, True), "$1.50" -> (1.5, False).
+
+    Returns:
+        (giá trị, True nếu tính theo big blind), hoặc None nếu không đọc được số
+    """
+    digits = "".join(c for c in text if c.isdigit() or c == ".")
+    try:
+        return float(digits), "BB" in text.upper()
+    except ValueError:
+        return None
+
+
+def binarize(image):
+    """
+    Ảnh nhị phân của một ô số: chữ = 255, nền = 0.
+    Dùng Otsu như read_text_from_region; chiều chữ/nền được chọn sao cho chữ là phần ít điểm ảnh hơn.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) > 2 else image
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+def segment_glyphs(binary):
+    """
+    Tách ảnh nhị phân thành các ký tự theo thứ tự trái sang phải.
+
+    Returns:
+        Danh sách (x, y, w, h) của từng ký tự; các thành phần chồng nhau theo
+        chiều ngang (ví dụ hai nét của '$') được gộp lại
+    """
+    n, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    boxes = sorted((tuple(int(v) for v in stats[i, :4]) for i in range(1, n) if stats[i, 4] >= 2),
+                   key=lambda b: b[0])
+    merged = []
+    for x, y, w, h in boxes:
+        if merged:
+            mx, my, mw, mh = merged[-1]
+            overlap = min(mx + mw, x + w) - max(mx, x)
+            if overlap > 0.5 * min(mw, w):
+                x0, y0 = min(mx, x), min(my, y)
+                merged[-1] = (x0, y0, max(mx + mw, x + w) - x0, max(my + mh, y + h) - y0)
+                continue
+        merged.append((x, y, w, h))
+    return merged
+
+
+def glyph_vector(binary, box):
+    """Ký tự đã chuẩn hóa về GLYPH_SIZE, trừ trung bình và chuẩn hóa độ dài (để so bằng tích vô hướng)."""
+    x, y, w, h = box
+    glyph = cv2.resize(binary[y:y+h, x:x+w], GLYPH_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    glyph -= glyph.mean()
+    norm = np.linalg.norm(glyph)
+    return glyph / norm if norm > 0 else glyph
+
+
+class DigitClassifier:
+    """
+    Bộ phân loại ký tự số theo template: mọi ký tự của một ô được so với mọi
+    template trong một phép nhân ma trận, chọn template có điểm cao nhất.
+    """
+
+    def __init__(self, templates=None, base_dir=BASE_DIR):
+        self.templates = templates if templates is not None else DIGIT_TEMPLATES
+        self.base_dir = base_dir
+        self.chars = None
+        self.vectors = None
+
+    def load(self):
+        """Nạp template (một lần); trả về False nếu không có template nào dùng được."""
+        if self.chars is not None:
+            return len(self.chars) > 0
+        chars, vectors = [], []
+        for char, path in self.templates.items():
+            image = cv2.imread(path if os.path.isabs(path) else os.path.join(self.base_dir, path), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                continue
+            binary = binarize(image)
+            points = cv2.findNonZero(binary)
+            if points is None:
+                continue
+            chars.append(char)
+            vectors.append(glyph_vector(binary, cv2.boundingRect(points)))
+        if len(chars) < len(self.templates):
+            print(f"Thiếu template ký tự số: nạp được {len(chars)}/{len(self.templates)}")
+        self.chars = chars
+        self.vectors = np.stack(vectors) if vectors else np.zeros((0, GLYPH_SIZE[0] * GLYPH_SIZE[1]), np.float32)
+        return len(chars) > 0
+
+    def read(self, binary):
+        """
+        Đọc một ô số đã nhị phân hóa.
+
+        Returns:
+            (text, confidence) với confidence là điểm thấp nhất trong các ký tự;
+            ("", 0.0) nếu không có template hoặc không tìm thấy ký tự
+        """
+        if not self.load():
+            return "", 0.0
+        boxes = segment_glyphs(binary)
+        if not boxes:
+            return "", 0.0
+        line_height = max(h for _, _, _, h in boxes)
+        glyphs = [box for box in boxes if box[3] >= DOT_HEIGHT_RATIO * line_height]
+        if not glyphs:
+            return "", 0.0
+        scores = np.stack([glyph_vector(binary, box) for box in glyphs]) @ self.vectors.T
+        best = scores.argmax(axis=1)
+
+        text = []
+        labels = iter(best)
+        for box in boxes:
+            if box[3] < DOT_HEIGHT_RATIO * line_height:
+                text.append('.')
+            else:
+                text.append(self.chars[next(labels)])
+        return "".join(text), float(scores[np.arange(len(best)), best].min())
+
+
+# --- POOL OCR DỰ PHÒNG ---
+_ocr_api = None
+
+
+def _init_ocr_worker(tesseract_cmd):
+    """Chạy một lần trong mỗi tiến trình của pool: giữ sẵn một phiên tesseract."""
+    global _ocr_api
+    if tesserocr is not None:
+        _ocr_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_LINE)
+        _ocr_api.SetVariable("tessedit_char_whitelist", OCR_WHITELIST)
+    else:
+        import pytesseract
+        if tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _ocr_job(binary):
+    try:
+        if _ocr_api is not None:
+            from PIL import Image
+            _ocr_api.SetImage(Image.fromarray(binary))
+            return _ocr_api.GetUTF8Text().strip()
+        import pytesseract
+        return pytesseract.image_to_string(binary, config=OCR_CONFIG).strip()
+    except Exception as e:
+        # Một số lỗi của pytesseract không pickle được và sẽ làm hỏng cả pool
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+class OcrPool:
+    """
+    Pool tiến trình OCR sống suốt phiên, chỉ khởi động ở lần cần đến đầu tiên.
+    Với tesserocr mỗi tiến trình giữ một PyTessBaseAPI nên không phải khởi
+    động tesseract cho từng ô; không có tesserocr thì dùng pytesseract.
+    workers=0: chạy OCR ngay trong tiến trình gọi (ví dụ trong tiến trình daemon).
+    """
+
+    def __init__(self, workers=2, tesseract_cmd=None, timeout=2.0):
+        self.workers = workers
+        self.tesseract_cmd = tesseract_cmd
+        self.timeout = timeout
+        self._executor = None
+        self._inline_ready = False
+
+    def read(self, binary):
+        if self.workers == 0:
+            if not self._inline_ready:
+                _init_ocr_worker(self.tesseract_cmd)
+                self._inline_ready = True
+            try:
+                return _ocr_job(binary)
+            except Exception as e:
+                print(f"Lỗi OCR: {e}")
+                return ""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_ocr_worker,
+                                                 initargs=(self.tesseract_cmd,))
+        try:
+            return self._executor.submit(_ocr_job, binary).result(timeout=self.timeout)
+        except BrokenProcessPool as e:
+            # Tiến trình con chết: lần sau tạo pool mới
+            print(f"Lỗi OCR: {e}")
+            self._executor = None
+            return ""
+        except Exception as e:
+            print(f"Lỗi OCR: {e}")
+            return ""
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class NumericReader:
+    """
+    Đọc ô bet/stack: template ký tự trước, OCR pool khi không chắc chắn,
+    kết quả ghi nhớ (LRU) theo hash điểm ảnh của ROI.
+    """
+
+    def __init__(self, digits=None, ocr_pool=None, min_confidence=0.7, cache_size=4096):
+        self.digits = digits if digits is not None else DigitClassifier()
+        self.ocr_pool = ocr_pool if ocr_pool is not None else OcrPool()
+        self.min_confidence = min_confidence
+        self.cache_size = cache_size
+        self._memo = OrderedDict()
+        self.stats = {"memo": 0, "glyphs": 0, "ocr": 0}
+
+    def read(self, image, region):
+        """
+        Đọc text của vùng region = (x, y, width, height) trong image (ndarray hoặc FrameView).
+
+        Returns:
+            Chuỗi đọc được (ví dụ "12.5BB"), "" nếu vùng trống hoặc OCR thất bại
+        """
+        # Ảnh xám của ROI (chuyển đổi một lần, dùng chung với các bước khác trên cùng FrameView)
+        gray = as_frame(image).gray(region)
+        if gray.size == 0:
+            return ""
+        key = hashlib.blake2b(np.ascontiguousarray(gray).data, digest_size=16).digest() + bytes(str(gray.shape), 'ascii')
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            self.stats["memo"] += 1
+            return self._memo[key]
+
+        binary = binarize(gray)
+        text, confidence = self.digits.read(binary)
+        if text and confidence >= self.min_confidence:
+            self.stats["glyphs"] += 1
+        else:
+            # OCR như cũ: chữ đen trên nền trắng
+            text = self.ocr_pool.read(cv2.bitwise_not(binary))
+            self.stats["ocr"] += 1
+
+        self._memo[key] = text
+        if len(self._memo) > self.cache_size:
+            self._memo.popitem(last=False)
+        return text
+
+    def clear(self):
+        """Xóa các kết quả đã ghi nhớ."""
+        self._memo.clear()
+
+    def close(self):
+        self.ocr_pool.close()
+
+
+def extract_glyph_templates(image, region, text, out_dir=os.path.join(BASE_DIR, 'templates', 'digits')):
+    """
+    Tạo template ký tự từ một ô số đã biết giá trị (ví dụ ô stack đang hiện "1234.5BB").
+    Mỗi ký tự trong DIGIT_TEMPLATES xuất hiện trong text được lưu thành một file.
+
+    Returns:
+        Danh sách ký tự đã lưu
+    """
+    x, y, w, h = region
+    binary = binarize(image[y:y+h, x:x+w])
+    boxes = segment_glyphs(binary)
+    line_height = max((b[3] for b in boxes), default=0)
+    boxes = [b for b in boxes if b[3] >= DOT_HEIGHT_RATIO * line_height]
+    chars = [c for c in text if c != '.']
+    if len(boxes) != len(chars):
+        raise ValueError(f"Tách được {len(boxes)} ký tự nhưng text có {len(chars)} ký tự: {text}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    saved = []
+    for char, (gx, gy, gw, gh) in zip(chars, boxes):
+        if char in DIGIT_TEMPLATES and char not in saved:
+            path = os.path.join(out_dir, os.path.basename(DIGIT_TEMPLATES[char]))
+            # Viền nền quanh ký tự để binarize() luôn nhận ra đâu là chữ
+            glyph = cv2.copyMakeBorder(binary[gy:gy+gh, gx:gx+gw], 4, 4, 4, 4, cv2.BORDER_CONSTANT, value=0)
+            cv2.imwrite(path, cv2.bitwise_not(glyph))
+            saved.append(char)
+    return saved
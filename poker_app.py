@@ -3,6 +3,12 @@ from tkinter import colorchooser, filedialog, messagebox
 import json
 import os
 
+import chart_journal
+import chart_store
+import hand_index
+import strategy
+from chart_cache import ChartCache
+
 # --- LỚP CỬA SỔ CHỈNH SỬA BIỂU ĐỒ ---
 class ChartEditorWindow(ctk.CTkToplevel):
     def __init__(self, master, file_path, chart_name, chart_state, actions):
@@ -24,6 +30,7 @@ class ChartEditorWindow(ctk.CTkToplevel):
         self.RANKS = ['A', 'K', 'Q', 'J', 'T', '9', '8', '7', '6', '5', '4', '3', '2']
         self.actions = actions
         self.current_chart_state = chart_state
+        self.original_chart_state = dict(chart_state)
         self.selected_action_label = actions[0]['label'] if actions else None
         self.hand_buttons = {}
 
@@ -45,6 +52,14 @@ class ChartEditorWindow(ctk.CTkToplevel):
         ctk.CTkLabel(actions_frame, text="Hành Động", font=ctk.CTkFont(size=14, weight="bold")).pack(pady=(0, 10))
         self.actions_list_frame = ctk.CTkScrollableFrame(actions_frame, height=250)
         self.actions_list_frame.pack(fill="x", expand=True)
+
+        # Frequency of the selected action; below 100% a click makes the cell a mixed strategy
+        self.frequency_label = ctk.CTkLabel(actions_frame, text="Tần suất: 100%")
+        self.frequency_label.pack(pady=(10, 0))
+        self.frequency_slider = ctk.CTkSlider(actions_frame, from_=0, to=100, number_of_steps=20,
+                                              command=lambda v: self.frequency_label.configure(text=f"Tần suất: {int(v)}%"))
+        self.frequency_slider.set(100)
+        self.frequency_slider.pack(fill="x", pady=5)
         
         # Management Section
         mgmt_frame = ctk.CTkFrame(self.control_frame, fg_color="transparent")
@@ -76,29 +91,32 @@ class ChartEditorWindow(ctk.CTkToplevel):
 
     def _save_and_close(self):
         try:
-            # Read the entire original file
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                full_data = json.load(f)
+            # Start from the cached parse of the file (re-read only if it changed on disk)
+            full_data = self.master_app.chart_cache.get(self.file_path)
 
-            # Find the chart name and update it with the new state
+            # Copy along the edited path only; the cached dict is shared and must stay untouched
+            full_data = dict(full_data)
             if self.chart_name in full_data:
+                key_path = [self.chart_name]
                 full_data[self.chart_name] = self.current_chart_state
             else:
-                 # This case handles different structures, like the nested one.
-                 # We need to find the correct path to update.
-                 # For simplicity, this example assumes a flat structure for the save target.
-                 # A more robust solution would require passing the full key path.
-                 # For this implementation, we will assume the chart_name is a top-level key.
-                 # Let's adjust for the provided example format
+                 # Nested format: "<main situation> | <scenario>" under "charts"
                  main_sit, scenario = self.chart_name.split(" | ")
+                 key_path = ["charts", main_sit, scenario]
+                 full_data["charts"] = dict(full_data["charts"])
+                 full_data["charts"][main_sit] = dict(full_data["charts"][main_sit])
                  full_data["charts"][main_sit][scenario] = self.current_chart_state
             
-            # Write the entire modified data back to the file
-            with open(self.file_path, 'w', encoding='utf-8') as f:
-                json.dump(full_data, f, indent=4)
+            # Append only the changed cells to the journal; the full file is rewritten
+            # atomically in the background by the compactor.
+            changes = chart_journal.diff_states(self.original_chart_state, self.current_chart_state)
+            if changes:
+                chart_journal.append_changes(self.file_path, key_path, changes)
+                self.master_app.chart_cache.put(self.file_path, full_data)
+                chart_journal.schedule_compaction(self.file_path)
             
-            messagebox.showinfo("Thành công", f"Đã lưu thay đổi vào file:\n{self.file_path}", parent=self)
-            self.master_app.load_specific_chart(self.file_path, reload_ui=True) # Reload data in main app
+            messagebox.showinfo("Thành công", f"Đã lưu {len(changes)} thay đổi vào file:\n{self.file_path}", parent=self)
+            self.master_app.load_specific_chart(self.file_path, reload_ui=True) # Reload data in main app (cache hit)
             self.destroy()
 
         except Exception as e:
@@ -122,7 +140,13 @@ class ChartEditorWindow(ctk.CTkToplevel):
 
     def update_grid_ui(self):
         for hand, button in self.hand_buttons.items():
-            action_label = self.current_chart_state.get(hand)
+            cell = self.current_chart_state.get(hand)
+            # Mixed cells are coloured by their most frequent action and show its frequency
+            action_label = strategy.dominant_action(cell)
+            if isinstance(cell, dict) and action_label:
+                button.configure(text=f"{hand}\n{strategy.cell_mix(cell)[action_label] * 100:.0f}%")
+            else:
+                button.configure(text=hand)
             if action_label:
                 action = next((a for a in self.actions if a['label'] == action_label), None)
                 if action:
@@ -138,10 +162,18 @@ class ChartEditorWindow(ctk.CTkToplevel):
 
     def _hand_button_click(self, hand):
         if not self.selected_action_label: return
-        if self.current_chart_state.get(hand) == self.selected_action_label:
-            del self.current_chart_state[hand]
+        freq = self.frequency_slider.get() / 100
+        if freq >= 1:
+            if self.current_chart_state.get(hand) == self.selected_action_label:
+                del self.current_chart_state[hand]
+            else:
+                self.current_chart_state[hand] = self.selected_action_label
         else:
-            self.current_chart_state[hand] = self.selected_action_label
+            cell = strategy.set_frequency(self.current_chart_state.get(hand), self.selected_action_label, freq)
+            if cell is None:
+                self.current_chart_state.pop(hand, None)
+            else:
+                self.current_chart_state[hand] = cell
         self.update_grid_ui()
 
     def _get_contrast_color(self, hex_color):
@@ -160,9 +192,19 @@ class PokerToolSuite(ctk.CTk):
 
         self.loaded_chart_data = None
         self.current_file_path = None
+        self.chart_cache = ChartCache(max_entries=8)
         self.chart_index = self._load_chart_index()
+        # Fold journals a previous session left behind, so every reader sees the edits
+        chart_journal.compact_all(path for _, _, path in chart_store.iter_chart_files(self.chart_index))
+        self.chart_store = self._open_chart_store()
         
         self._init_ui()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _on_close(self):
+        # Compactions run on a daemon thread: finish them before the window (and process) goes away
+        chart_journal.flush_compactions()
+        self.destroy()
 
     def _init_ui(self):
         main_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -216,12 +258,27 @@ class PokerToolSuite(ctk.CTk):
             messagebox.showerror("Lỗi", f"Không thể tải index.json: {e}")
             return {}
 
+    def _open_chart_store(self):
+        # Compiled binary store for decisions; the JSON files stay the source of truth.
+        try:
+            return chart_store.load_or_compile("index.json")
+        except Exception as e:
+            print(f"Không thể biên dịch chart store, dùng JSON trực tiếp: {e}")
+            return None
+
+    def _refresh_chart_store(self):
+        if self.chart_store is not None:
+            if not self.chart_store.is_stale():
+                return
+            self.chart_store.close()
+        self.chart_store = self._open_chart_store()
+
     def load_specific_chart(self, file_path, reload_ui=False):
         try:
-            with open(file_path, "r", encoding='utf-8') as f:
-                self.loaded_chart_data = json.load(f)
+            self.loaded_chart_data = self.chart_cache.get(file_path)
             self.current_file_path = file_path
             if reload_ui:
+                self._refresh_chart_store()
                 self.update_main_situations(self.chart_type_combo.get(), force_reload=True)
             return True
         except Exception as e:
@@ -278,21 +335,11 @@ class PokerToolSuite(ctk.CTk):
             messagebox.showwarning("Thiếu thông tin", "Vui lòng chọn đầy đủ kịch bản trước khi chỉnh sửa.")
             return
 
-        chart_state = self.loaded_chart_data["charts"][main_situation].get(scenario, {})
+        # The editor mutates its state; copy it so the cached chart only changes on save
+        chart_state = dict(self.loaded_chart_data["charts"][main_situation].get(scenario, {}))
         
         # Create a comprehensive, color-coded action list if not present in the main JSON file.
-        actions = self.loaded_chart_data.get("actions", [
-            {'label': 'Raise', 'color': '#f87171'},
-            {'label': 'Raise for value', 'color': '#dc2626'},
-            {'label': 'Raise as a bluff', 'color': '#9333ea'},
-            {'label': '3-bet for value', 'color': '#ef4444'},
-            {'label': '3-bet as a bluff', 'color': '#8b5cf6'},
-            {'label': '4-bet for value', 'color': '#b91c1c'},
-            {'label': '4-bet as a bluff', 'color': '#7e22ce'},
-            {'label': 'Call', 'color': '#22c55e'},
-            {'label': 'Limp', 'color': '#22c55e'},
-            {'label': 'Fold', 'color': '#a1a1aa'}
-        ])
+        actions = self.loaded_chart_data.get("actions", chart_store.DEFAULT_ACTIONS)
         
         chart_name = f"{main_situation} | {scenario}"
         
@@ -316,31 +363,19 @@ class PokerToolSuite(ctk.CTk):
             messagebox.showerror("Lỗi", "Định dạng hand không hợp lệ! (VD: AKs, 77, T9o)")
             return
 
-        action = self.loaded_chart_data["charts"][main_situation][scenario].get(hand, "Fold")
+        game_type = self.game_type_combo.get()
+        chart_type = self.chart_type_combo.get()
+        if self.chart_store and self.chart_store.has_scenario(game_type, chart_type, main_situation, scenario):
+            mix = self.chart_store.lookup_mix(game_type, chart_type, main_situation, scenario, hand)
+        else:
+            mix = strategy.cell_mix(self.loaded_chart_data["charts"][main_situation][scenario].get(hand))
+        action = strategy.format_mix(mix) if mix else "Fold"
         self.result_label.configure(text=f"Hành động: {action}")
         # Add styling based on action... (optional)
 
     def _sanitize_hand(self, hand_text):
-        hand_text = hand_text.strip()
-        if len(hand_text) < 2 or len(hand_text) > 3: return None
-        
-        ranks = "AKQJT98765432"
-        card1 = hand_text[0].upper()
-        card2 = hand_text[1].upper()
-        if card1 not in ranks or card2 not in ranks: return None
-        
-        # Ensure consistent order (e.g., AKs, not KAs)
-        if ranks.find(card1) > ranks.find(card2):
-            card1, card2 = card2, card1
-        
-        if len(hand_text) == 2:
-            return f"{card1}{card2}" if card1 == card2 else f"{card1}{card2}o"
-        
-        suffix = hand_text[2].lower()
-        if suffix == 's' and card1 != card2: return f"{card1}{card2}s"
-        if suffix == 'o' and card1 != card2: return f"{card1}{card2}o"
-        
-        return None
+        # Accepts chart keys in any order/case ("KAs", "77", "t9o") and exact cards ("AhKd").
+        return hand_index.canonical_hand(hand_text)
 
 if __name__ == "__main__":
     ctk.set_appearance_mode("System")
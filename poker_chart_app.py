@@ -2,6 +2,8 @@ import customtkinter as ctk
 from tkinter import colorchooser, filedialog, messagebox
 import json
 
+import chart_journal
+
 class PokerChartApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -210,8 +212,8 @@ class PokerChartApp(ctk.CTk):
         }
 
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(chart_data, f, indent=4)
+            # Whole-file save: a journal left next to the file must not be replayed over it
+            chart_journal.replace_chart(file_path, chart_data)
             messagebox.showinfo("Thành công", f"Chart đã được lưu tại:\n{file_path}")
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể lưu file: {e}")
@@ -225,8 +227,8 @@ class PokerChartApp(ctk.CTk):
             return
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                chart_data = json.load(f)
+            # Pending editor saves may still sit in the chart's journal
+            chart_data = chart_journal.load_chart(file_path)
             
             self.chart_name_entry.delete(0, 'end')
             self.chart_name_entry.insert(0, chart_data.get('chartName', ''))
@@ -1,13 +1,15 @@
-import pygetwindow as gw
+import argparse
 import time
-import json
 import os
 import random
-import numpy as np
 import cv2
 import sys
-import dxcam
-from mss import mss
+
+try:
+    import pygetwindow as gw
+except (ImportError, NotImplementedError):
+    # pygetwindow chỉ hỗ trợ Windows/macOS; trên Linux agent vẫn chạy được với nguồn replay
+    gw = None
 
 # --- CONFIG DEBUG ---
 # Chế độ debug vẫn hữu ích để xem ảnh chụp được là gì
@@ -18,85 +20,225 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(SCRIPT_DIR)
 
 try:
-    from vision import analyze_table, find_template
+    from vision import analyze_table, find_template, TableAnalyzer, TEMPLATE_BANK
 except ImportError:
     print(f"Lỗi: Không tìm thấy file vision.py. Đang tìm kiếm tại: {SCRIPT_DIR}")
     analyze_table = None
     find_template = None
+    TableAnalyzer = None
+    TEMPLATE_BANK = None
+
+from agent_pipeline import Pipeline
+from capture_sources import create_capture_source
+from frame_recorder import FrameRecorder, RECORDER_RETENTION
+from decision_engine import connect_or_load
+from numeric_reader import parse_amount
+from scenario_resolver import RFI, VS_RFI, preflop_order
+from table_workers import TableWorkerPool
+
+# Loại game (khóa trong index.json) theo tiêu đề cửa sổ bàn chơi; "Poker" không rõ loại
+WINDOW_GAME_TYPES = {"Rush & Cash": "CashGame", "Spin & Go": "SpinAndGo", "Tournament": "Tournament"}
+
+def find_opener(result):
+    """
+    Vị trí người mở (open raise) trước Hero, hoặc None nếu chưa ai mở.
+    Chỉ xét người hành động trước Hero theo thứ tự preflop (UTG ... BTN, SB, BB),
+    người đầu tiên có bet lớn hơn big blind là người mở: SB/BB chỉ đặt blind và
+    người limp không tính. Big blind là 1 khi số tiền ghi theo BB, nếu không thì
+    lấy bet của ghế BB; không biết big blind thì bet của SB không được tính.
+    """
+    hero = result["my_position"]
+    order = preflop_order(len(result["positions"]))
+    acted = order[:order.index(hero)] if hero in order else []
+    bets = {}
+    in_bb = False
+    for action in result["actions_before"]:
+        amount = parse_amount(action["size_text"])
+        if amount is not None and action["position"] != hero:
+            bets[action["position"]], unit_bb = amount
+            in_bb = in_bb or unit_bb
+    big_blind = 1.0 if in_bb else bets.get("BB")
+    for position in acted:
+        amount = bets.get(position)
+        if amount is None or (big_blind is None and position == "SB"):
+            continue
+        if big_blind is None or amount > big_blind:
+            return position
+    return None
+
 
 class RealTimeAgent:
-    def __init__(self):
+    def __init__(self, workers=0, target_fps=5.0, latency_budget=1.0, capture_source=None,
+                 record=False, retention=RECORDER_RETENTION, gated=True, game_type=None):
         self.poker_window_titles = ["Rush & Cash", "Spin & Go", "Tournament", "Poker"]
+        # Loại game mặc định (nguồn replay, cửa sổ không rõ loại); None: tìm trong mọi loại
+        self.game_type = game_type
+        self.table_game_types = {}
+        # table_id -> (tình huống, hành động đã bốc) của quyết định gần nhất
+        self.last_decisions = {}
         self.last_active_window_id = None
-        self.action_panel_template = os.path.join(SCRIPT_DIR, 'templates', 'action_panel.png')
         self.test_captures_dir = os.path.join(SCRIPT_DIR, 'test_captures')
-        self.index_data = self.load_index()
+        self.target_fps = target_fps
+        # gated: phân tích đầy đủ chỉ khi panel hành động vừa hiện hoặc ván bài đổi (vision.ActionGate)
+        self.gated = gated
+        self.latency_budget = latency_budget
+        # Dùng chung máy chủ quyết định (decision_engine.py) nếu đang chạy,
+        # thay vì mỗi agent tự tải một bản index.json và các chart.
+        self.decisions = connect_or_load(os.path.join(SCRIPT_DIR, "index.json"))
         
-        self.camera_dxcam = dxcam.create(output_color="BGR")
-        self.camera_mss = mss()
+        # Nạp toàn bộ template một lần, dùng lại cho mọi khung hình và mọi bàn
+        if TEMPLATE_BANK is not None:
+            TEMPLATE_BANK.preload()
+            print(f"Đã nạp sẵn {len(TEMPLATE_BANK)} template.")
+
+        # workers > 0: mỗi bàn được phân tích trong tiến trình riêng, khung hình
+        # đi qua bộ nhớ chung (table_workers.py) thay vì chạy trên vòng lặp này
+        # analyze() không chờ quá latency_budget: khung trễ hơn cũng bị pipeline bỏ
+        self.table_pool = TableWorkerPool(workers, gated=gated, timeout=latency_budget) if workers else None
+        # workers = 0: phân tích ngay trên luồng vision, mỗi bàn một TableAnalyzer
+        self.table_analyzers = {}
+        self.latest_frame = None
+
+        # Mặc định chụp màn hình bằng dxcam (mss dự phòng); ReplaySource để phát lại phiên đã ghi
+        self.capture_source = capture_source if capture_source is not None else create_capture_source()
         
         if not os.path.exists(self.test_captures_dir):
             os.makedirs(self.test_captures_dir)
+        # record=True (--record): mọi khung hình được ghi thô vào file vòng ở luồng nền (không nén
+        # PNG trên vòng lặp chính). File cấp trước retention x kích thước một khung, nên chỉ bật khi cần;
+        # xuất ra PNG bằng: python frame_recorder.py export test_captures/frames.ring --out ...
+        self.recorder = FrameRecorder(os.path.join(self.test_captures_dir, "frames.ring"), retention) if record else None
 
-    def load_index(self):
-        index_path = os.path.join(SCRIPT_DIR, "poker_charts", "index.json")
-        try:
-            with open(index_path, "r", encoding='utf-8') as f: return json.load(f)
-        except Exception as e:
-            print(f"Lỗi nghiêm trọng: Không thể tải file chỉ mục tại '{index_path}'. Lỗi: {e}")
-            return {}
-            
-    def process_table(self, window):
-        print(f"\n--- Bàn chơi được kích hoạt: {window.title} ---")
+    def process_table(self, table_id, screenshot_cv):
+        """Đưa khung hình vào hàng đợi ghi (file vòng test_captures/frames.ring) để kiểm tra sau."""
+        if self.recorder is not None:
+            self.recorder.record(table_id, screenshot_cv)
+
+    def capture_tables(self):
+        """Bước chụp của pipeline: [(hWnd, ảnh)] của bàn poker đang được focus (mỗi nhịp một lần)."""
+        if not self.capture_source.windowed:
+            frame = self.capture_source.grab()
+            if frame is None:
+                return []
+            self.latest_frame = frame
+            self.process_table(self.capture_source.name, frame)
+            return [(self.capture_source.name, frame)]
+        active_window = gw.getActiveWindow()
+        if not active_window or not any(title in active_window.title for title in self.poker_window_titles):
+            return []
+        region = (active_window.left, active_window.top, active_window.right, active_window.bottom)
+        screenshot_cv = self.capture_source.grab(region)
+        if screenshot_cv is None:
+            print("Lỗi nghiêm trọng: Cả hai phương pháp chụp đều thất bại.")
+            return []
+        if active_window._hWnd != self.last_active_window_id:
+            self.last_active_window_id = active_window._hWnd
+            self.table_game_types[active_window._hWnd] = next(
+                (game_type for title, game_type in WINDOW_GAME_TYPES.items() if title in active_window.title),
+                self.game_type)
+            print(f"\n--- Bàn chơi được kích hoạt: {active_window.title} ---")
+        self.process_table(active_window._hWnd, screenshot_cv)
+        self.latest_frame = screenshot_cv
+        return [(active_window._hWnd, screenshot_cv)]
+
+    def analyze(self, table_id, image):
+        """Bước vision của pipeline; None nếu ActionGate cho rằng khung hình không cần phân tích."""
+        if self.table_pool is not None:
+            return self.table_pool.analyze(table_id, image)
+        analyzer = self.table_analyzers.get(table_id)
+        if analyzer is None:
+            analyzer = self.table_analyzers[table_id] = TableAnalyzer()
+        return analyzer.poll(image) if self.gated else analyzer.analyze(image)
+
+    def decide(self, table_id, result):
+        """Bước quyết định của pipeline: hành động cho bài của Hero, hoặc None nếu chưa đủ thông tin."""
+        if not result.get("hero_to_act", True):
+            return None
+        if result["my_position"] == "Unknown" or result["my_hand"] == "Unknown":
+            return None
+        opener = find_opener(result)
+        game_type = self.table_game_types.get(table_id, self.game_type)
+        situation = (game_type, len(result["positions"]) or 6, result["my_position"], opener, result["my_hand"])
+        last = self.last_decisions.get(table_id)
+        if last is not None and last[0] == situation:
+            # Cùng một tình huống qua nhiều khung hình: giữ hành động đã bốc, không bốc lại
+            return last[1]
+        # sample=True: ô chart hỗn hợp (ví dụ Raise 60% / Call 40%) được chơi ngẫu nhiên theo đúng
+        # tần suất, phần còn thiếu là Fold; không luôn chọn hành động chiếm ưu thế
         try:
-            region = (window.left, window.top, window.right, window.bottom)
-            
-            # --- LOGIC CHỤP ẢNH HYBRID ---
-            screenshot_cv = self.camera_dxcam.grab(region=region)
-
-            if screenshot_cv is None:
-                print("Cảnh báo: dxcam thất bại. Chuyển sang phương pháp thay thế (mss)...")
-                monitor = {"top": window.top, "left": window.left, "width": window.width, "height": window.height}
-                sct_img = self.camera_mss.grab(monitor)
-                img = np.array(sct_img)
-                screenshot_cv = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-
-            if screenshot_cv is None:
-                print("Lỗi nghiêm trọng: Cả hai phương pháp chụp đều thất bại.")
-                return
-
-            # *** LOGIC MỚI: LƯU ẢNH NGAY LẬP TỨC ***
-            timestamp = int(time.time())
-            capture_filename = os.path.join(self.test_captures_dir, f"capture_{timestamp}.png")
-            cv2.imwrite(capture_filename, screenshot_cv)
-            print(f"✅ ĐÃ CHỤP VÀ LƯU ẢNH THÀNH CÔNG TẠI: {capture_filename}")
+            actions = self.decisions.decide_situation(situation[1], situation[2], opener, VS_RFI if opener else RFI,
+                                                      [result["my_hand"]], game_type=game_type, sample=True)
+        except KeyError:
+            return None
+        self.last_decisions[table_id] = (situation, actions[0])
+        return actions[0]
 
-            if DEBUG_MODE:
-                # Hiển thị ảnh vừa chụp để bạn xem trực tiếp
-                cv2.imshow('Debug Capture Window', screenshot_cv)
-                cv2.waitKey(1)
-        
-        except Exception as e:
-            print(f"Đã xảy ra lỗi trong quá trình xử lý bàn chơi: {e}")
+    def on_decision(self, table_id, result, decision, latency):
+        if decision is not None:
+            print(f"Bàn {table_id}: {result['my_position']} {result['my_hand']} -> {decision} "
+                  f"({latency * 1000:.0f} ms)")
 
     def run(self):
-        print("Real-Time Agent (Chế độ Test Chụp Ảnh) đang chạy...")
-        self.camera_dxcam.start(target_fps=5)
+        print("Real-Time Agent đang chạy...")
+        if self.capture_source.windowed and gw is None:
+            print("Lỗi: pygetwindow không hỗ trợ hệ điều hành này; hãy dùng nguồn replay (--replay).")
+            return
+        self.capture_source.start(self.target_fps)
+        pipeline = Pipeline(self.capture_tables, self.analyze, self.decide, self.on_decision,
+                            target_fps=self.target_fps, latency_budget=self.latency_budget,
+                            vision_threads=max(1, self.table_pool.n_workers) if self.table_pool else 1)
+        pipeline.start()
+        last_report = time.perf_counter()
         try:
             while True:
-                try:
-                    active_window = gw.getActiveWindow()
-                    if active_window and active_window._hWnd != self.last_active_window_id:
-                        self.last_active_window_id = active_window._hWnd
-                        if any(title in active_window.title for title in self.poker_window_titles):
-                            self.process_table(active_window)
-                except Exception: pass
-                time.sleep(0.5)
+                if DEBUG_MODE and self.latest_frame is not None:
+                    # Hiển thị ảnh vừa chụp để bạn xem trực tiếp (cửa sổ OpenCV chỉ cập nhật ở luồng chính)
+                    cv2.imshow('Debug Capture Window', self.latest_frame)
+                    cv2.waitKey(1)
+                if self.capture_source.finished:
+                    # Hết phiên phát lại: chờ các khung còn trong pipeline xử lý xong
+                    time.sleep(self.latency_budget)
+                    break
+                if time.perf_counter() - last_report >= 10:
+                    last_report = time.perf_counter()
+                    print(f"Pipeline: {pipeline.stats()}")
+                time.sleep(1.0 / self.target_fps if self.target_fps else 0.05)
         finally:
-            self.camera_dxcam.stop()
+            pipeline.stop()
+            print(f"Pipeline: {pipeline.stats()}")
+            self.capture_source.close()
+            if self.recorder is not None:
+                self.recorder.close()
+                print(f"Ghi khung hình: {self.recorder.stats}")
+            if self.table_pool is not None:
+                self.table_pool.close()
             if DEBUG_MODE:
                 cv2.destroyAllWindows()
 
 if __name__ == "__main__":
-    agent = RealTimeAgent()
+    parser = argparse.ArgumentParser(description="Agent thời gian thực: chụp bàn chơi, phân tích và ra quyết định.")
+    parser.add_argument("--capture", choices=["auto", "dxcam", "mss"], default="auto", help="Cách chụp màn hình")
+    parser.add_argument("--replay", help="Phát lại thư mục ảnh hoặc file video thay vì chụp màn hình")
+    parser.add_argument("--fast", action="store_true", help="Phát lại nhanh nhất có thể (đo thông lượng)")
+    parser.add_argument("--loop", action="store_true", help="Phát lại lặp vô hạn")
+    parser.add_argument("--fps", type=float, default=5.0, help="Số khung hình mỗi giây (0: không giới hạn)")
+    parser.add_argument("--latency-budget", type=float, default=1.0, help="Bỏ khung hình cũ hơn số giây này")
+    parser.add_argument("--workers", type=int, default=0, help="Số tiến trình phân tích bàn (0: phân tích trên luồng)")
+    parser.add_argument("--game-type", choices=["CashGame", "Tournament", "SpinAndGo"],
+                        help="Loại game khi không suy ra được từ tiêu đề cửa sổ (ví dụ khi phát lại)")
+    parser.add_argument("--no-debug", action="store_true", help="Không hiển thị cửa sổ debug")
+    parser.add_argument("--no-gate", action="store_true", help="Phân tích đầy đủ mọi khung hình (không qua ActionGate)")
+    parser.add_argument("--record", action="store_true", help="Ghi khung hình vào test_captures/frames.ring")
+    parser.add_argument("--retention", type=int, default=RECORDER_RETENTION,
+                        help="Số khung hình giữ lại khi --record. File cấp trước retention x một khung thô: "
+                             "bàn 1000x700 BGRA ≈ 2.8 MB/khung, toàn màn hình 1920x1080 ≈ 8.3 MB/khung "
+                             f"(mặc định {RECORDER_RETENTION} khung ≈ 280-830 MB)")
+    args = parser.parse_args()
+
+    if args.no_debug:
+        DEBUG_MODE = False
+    source = create_capture_source(args.capture, replay=args.replay, realtime=not args.fast, loop=args.loop)
+    agent = RealTimeAgent(workers=args.workers, target_fps=args.fps, latency_budget=args.latency_budget,
+                          capture_source=source, record=args.record, retention=args.retention,
+                          gated=not args.no_gate, game_type=args.game_type)
     agent.run()
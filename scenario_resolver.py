@@ -0,0 +1,186 @@
+import re
+from collections import namedtuple
+
+# --- SCENARIO RESOLVER ---
+# Scenario keys in the chart files are free-form and differ between files:
+# "BTN_vs_CO_RFI", "UTG+1/+2_vs_UTG_RFI", "CO_vs_LJ/HJ_RFI", "SB_Strategy",
+# "Lojack" vs "LJ", ... They are parsed once at load time into structured keys
+# (table size, hero position, opener position, action type), so resolving a
+# situation read from the table is one dict lookup instead of guessing strings.
+
+ScenarioKey = namedtuple("ScenarioKey", "table_size hero opener action")
+ScenarioRef = namedtuple("ScenarioRef", "game_type chart situation scenario")
+
+# Action types: what hero is facing.
+RFI = "RFI"            # folded to hero (open / first in)
+VS_RFI = "vs_RFI"      # facing an open raise
+VS_LIMP = "vs_limp"    # facing a limp
+VS_3BET = "vs_3bet"    # hero opened and faces a 3-bet
+VS_4BET = "vs_4bet"    # hero 3-bet and faces a 4-bet
+
+POSITIONS = ["UTG", "UTG+1", "UTG+2", "LJ", "HJ", "CO", "BTN", "SB", "BB"]
+
+# Position labels per table size, starting at the button and going clockwise
+# (the direction of play). Heads-up the button posts the small blind and is
+# labelled SB, as in the heads-up charts.
+TABLE_POSITIONS = {
+    2: ["SB", "BB"],
+    3: ["BTN", "SB", "BB"],
+    4: ["BTN", "SB", "BB", "CO"],
+    5: ["BTN", "SB", "BB", "HJ", "CO"],
+    6: ["BTN", "SB", "BB", "LJ", "HJ", "CO"],
+    7: ["BTN", "SB", "BB", "UTG", "LJ", "HJ", "CO"],
+    8: ["BTN", "SB", "BB", "UTG", "UTG+1", "LJ", "HJ", "CO"],
+    9: ["BTN", "SB", "BB", "UTG", "UTG+1", "UTG+2", "LJ", "HJ", "CO"],
+}
+
+POSITION_ALIASES = {pos.upper(): pos for pos in POSITIONS}
+POSITION_ALIASES.update({
+    "LOJACK": "LJ", "HIJACK": "HJ", "CUTOFF": "CO", "BUTTON": "BTN", "BU": "BTN",
+    "SMALL BLIND": "SB", "BIG BLIND": "BB", "UTG1": "UTG+1", "UTG2": "UTG+2",
+})
+
+_ACTION_SUFFIXES = {
+    "RFI": VS_RFI, "RAISE": VS_RFI, "OPEN": VS_RFI,
+    "LIMP": VS_LIMP,
+    "3_BET": VS_3BET, "3BET": VS_3BET, "3-BET": VS_3BET,
+    "4_BET": VS_4BET, "4BET": VS_4BET, "4-BET": VS_4BET,
+}
+_FIRST_IN_SUFFIXES = {"RFI", "STRATEGY", "OPEN"}
+_VS_PATTERN = re.compile(r"^(?P<hero>.+?)_vs_(?P<opener>.+?)_(?P<action>[^_]+|[34]_bet)$", re.IGNORECASE)
+
+
+def normalize_position(text):
+    return POSITION_ALIASES.get(" ".join(text.replace("_", " ").split()).upper())
+
+
+def normalize_table_size(table_size):
+    """6, "6", "6max", "6-max" -> 6; None stays None."""
+    if table_size is None or isinstance(table_size, int):
+        return table_size
+    digits = re.match(r"\s*(\d+)", str(table_size))
+    return int(digits.group(1)) if digits else None
+
+
+def seat_positions(n_seats, button_seat):
+    """
+    Position label of every seat, for seats numbered clockwise 0..n_seats-1
+    with the dealer button at `button_seat`:
+    seat_positions(6, 2) -> ["HJ", "CO", "BTN", "SB", "BB", "LJ"].
+    """
+    labels = TABLE_POSITIONS[n_seats]
+    return [labels[(seat - button_seat) % n_seats] for seat in range(n_seats)]
+
+
+def preflop_order(n_seats):
+    """Preflop order of action: UTG ... BTN, SB, BB (heads-up the SB/button acts first)."""
+    labels = TABLE_POSITIONS[n_seats]
+    return labels if n_seats == 2 else labels[3:] + labels[:3]
+
+
+def parse_positions(text):
+    """Position group to canonical positions: "UTG+1/+2" -> ["UTG+1", "UTG+2"], "LJ/HJ" -> ["LJ", "HJ"]."""
+    positions = []
+    base = None
+    for part in text.split("/"):
+        part = part.strip()
+        if part.startswith("+") and base:
+            part = base + part
+        pos = normalize_position(part)
+        if pos is None:
+            return []
+        base = pos.split("+")[0]
+        positions.append(pos)
+    return positions
+
+
+def parse_scenario(situation, scenario):
+    """
+    All (hero, opener, action) triples a scenario key covers, e.g.
+    "CO_vs_LJ/HJ_RFI" -> [("CO", "LJ", vs_RFI), ("CO", "HJ", vs_RFI)].
+    Returns [] for keys that cannot be parsed.
+    """
+    match = _VS_PATTERN.match(scenario)
+    if match:
+        action = _ACTION_SUFFIXES.get(match.group("action").upper())
+        heroes = parse_positions(match.group("hero"))
+        openers = parse_positions(match.group("opener"))
+        if action is None:
+            return []
+        return [(hero, opener, action) for hero in heroes for opener in openers]
+
+    # First-in keys: a bare position under an RFI situation, or "<pos>_RFI" / "<pos>_Strategy".
+    head, _, suffix = scenario.rpartition("_")
+    if head and suffix.upper() in _FIRST_IN_SUFFIXES:
+        return [(hero, None, RFI) for hero in parse_positions(head)]
+    if "RFI" in situation.upper() or "FIRST IN" in situation.upper():
+        return [(hero, None, RFI) for hero in parse_positions(scenario)]
+    return []
+
+
+class ScenarioIndex:
+    """Structured index over every scenario in a compiled chart store."""
+
+    def __init__(self):
+        self.by_chart = {}    # (game_type, chart) -> {ScenarioKey: ScenarioRef}
+        self.by_key = {}      # game_type -> {ScenarioKey: [ScenarioRef, ...]} in load order
+        self.unresolved = []  # ScenarioRef the parser did not understand
+
+    @classmethod
+    def from_store(cls, store):
+        index = cls()
+        for game_type, chart_name, situation, scenario in store.scenario_rows:
+            meta = store.charts.get(game_type, {}).get(chart_name, {})
+            index.add(ScenarioRef(game_type, chart_name, situation, scenario), meta.get("table_size"))
+        return index
+
+    def add(self, ref, table_size):
+        table_size = normalize_table_size(table_size)
+        triples = parse_scenario(ref.situation, ref.scenario)
+        if not triples:
+            self.unresolved.append(ref)
+            return
+        chart_index = self.by_chart.setdefault((ref.game_type, ref.chart), {})
+        game_index = self.by_key.setdefault(ref.game_type, {})
+        for hero, opener, action in triples:
+            key = ScenarioKey(table_size, hero, opener, action)
+            if key not in chart_index:
+                chart_index[key] = ref
+                game_index.setdefault(key, []).append(ref)
+
+    def _chart_indexes(self, game_type=None, chart_name=None):
+        """by_chart entries matching chart_name, optionally restricted to one game type."""
+        return [chart_index for (chart_game_type, chart), chart_index in self.by_chart.items()
+                if chart == chart_name and game_type in (None, chart_game_type)]
+
+    def candidates(self, key, game_type=None, chart_name=None):
+        """Every ScenarioRef covering a ScenarioKey, in load order; None filters are wildcards."""
+        if chart_name is not None:
+            return [chart_index[key] for chart_index in self._chart_indexes(game_type, chart_name)
+                    if key in chart_index]
+        game_indexes = [self.by_key.get(game_type, {})] if game_type is not None else self.by_key.values()
+        return [ref for game_index in game_indexes for ref in game_index.get(key, [])]
+
+    def resolve_key(self, key, game_type=None, chart_name=None):
+        """
+        ScenarioRef for a ScenarioKey, or None. game_type and chart_name narrow
+        the search; when several charts still match, the first loaded wins.
+        """
+        refs = self.candidates(key, game_type, chart_name)
+        return refs[0] if refs else None
+
+    def resolve(self, table_size, hero, opener=None, action=RFI, game_type=None, chart_name=None):
+        """Like resolve_key, accepting loose spellings ("6max", "Button", "Hijack")."""
+        key = ScenarioKey(normalize_table_size(table_size), normalize_position(hero) or hero,
+                          opener and (normalize_position(opener) or opener), action)
+        return self.resolve_key(key, game_type, chart_name)
+
+    def keys(self, game_type=None, chart_name=None):
+        if chart_name is not None:
+            indexes = self._chart_indexes(game_type, chart_name)
+        else:
+            indexes = [self.by_key.get(game_type, {})] if game_type is not None else self.by_key.values()
+        keys = {}
+        for index in indexes:
+            keys.update(dict.fromkeys(index))
+        return list(keys)
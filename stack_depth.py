@@ -0,0 +1,101 @@
+import re
+
+import numpy as np
+
+from hand_index import HAND_SLOTS
+from strategy import with_remainder
+
+# --- STACK-DEPTH TABLE ---
+# index.json lists charts at discrete depths (15/25/40/75/100 BB). This table
+# stacks, for every structured scenario (see scenario_resolver), the frequency
+# rows of all depths into one (D, 169, A + 1) array once at load; the last
+# column is the unassigned remainder, i.e. the default action. A per-scenario
+# bucket table over stack sizes (0.1 BB steps) gives the bracketing depths and
+# blend weight, so a lookup at any effective stack (e.g. 31.5 BB) is a couple
+# of array indexes: the nearest depth's action, or the argmax of the linearly
+# interpolated frequencies. Several charts may share a depth (e.g. 100 BB 6-max
+# and full ring): their scenarios differ by the table size in the key.
+
+_DEPTH_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*bb", re.IGNORECASE)
+
+
+def chart_depth(chart_name, chart_meta):
+    """Stack depth in BB from a chart's "stack_depth" field or its name ("75BB ..."), or None."""
+    for text in (str(chart_meta.get("stack_depth", "")), chart_name):
+        match = _DEPTH_PATTERN.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class StackDepthTable:
+    def __init__(self, store, scenario_index, game_type, resolution=0.1, default="Fold"):
+        self.game_type = game_type
+        self.resolution = resolution
+        self.labels = list(store.labels) + [default]
+
+        depth_charts = {}
+        for chart_name, meta in store.charts.get(game_type, {}).items():
+            depth = chart_depth(chart_name, meta)
+            if depth is not None:
+                depth_charts.setdefault(depth, []).append(chart_name)
+        self.depths = sorted(depth_charts)
+        self.max_stack = self.depths[-1] if self.depths else 0.0
+        n_buckets = int(round(self.max_stack / resolution)) + 1
+        stacks = np.arange(n_buckets) * resolution
+
+        # key -> (freqs (D_key, 169, A + 1) float32, lo (n_buckets,), hi, weight)
+        self.tables = {}
+        by_key = {}
+        for depth in self.depths:
+            for chart_name in depth_charts[depth]:
+                for key in scenario_index.keys(game_type, chart_name):
+                    rows = by_key.setdefault(key, [])
+                    if rows and rows[-1][0] == depth:
+                        continue  # two charts of one depth cover the key: the first loaded wins
+                    ref = scenario_index.resolve_key(key, game_type, chart_name)
+                    rows.append((depth, with_remainder(store.scenario_freqs(*ref))))
+
+        for key, rows in by_key.items():
+            key_depths = np.array([depth for depth, _ in rows])
+            freqs = np.stack([f for _, f in rows])
+            hi = np.clip(np.searchsorted(key_depths, stacks), 0, len(key_depths) - 1)
+            lo = np.clip(hi - 1, 0, None)
+            lo = np.where(key_depths[hi] <= stacks, hi, lo)
+            span = key_depths[hi] - key_depths[lo]
+            weight = np.where(span > 0, (stacks - key_depths[lo]) / np.where(span > 0, span, 1.0), 0.0)
+            self.tables[key] = (freqs, lo.astype(np.int16), hi.astype(np.int16), np.clip(weight, 0.0, 1.0).astype(np.float32))
+
+    def _bucket(self, stack_bb):
+        return min(max(int(round(stack_bb / self.resolution)), 0), int(round(self.max_stack / self.resolution)))
+
+    def has_key(self, key):
+        return key in self.tables
+
+    def frequencies(self, stack_bb, key, classes, interpolate=True):
+        """(n, A + 1) action frequencies at `stack_bb` for an array of grid classes."""
+        freqs, lo, hi, weight = self.tables[key]
+        bucket = self._bucket(stack_bb)
+        classes = np.clip(np.asarray(classes), 0, 168)
+        if not interpolate:
+            nearest = lo[bucket] if weight[bucket] < 0.5 else hi[bucket]
+            return freqs[nearest, classes]
+        w = weight[bucket]
+        return (1.0 - w) * freqs[lo[bucket], classes] + w * freqs[hi[bucket], classes]
+
+    def lookup(self, stack_bb, key, classes, interpolate=False):
+        """
+        Action label per grid class at any effective stack: the nearest depth's
+        action, or with interpolate=True the most frequent action after blending
+        the two bracketing depths. Invalid classes (-1) get the default action.
+        Raises KeyError if no depth has a chart for `key`.
+        """
+        classes = np.asarray(classes)
+        picks = self.frequencies(stack_bb, key, classes, interpolate).argmax(axis=-1)
+        picks = np.where(classes < 0, len(self.labels) - 1, picks)
+        return np.array(self.labels, dtype=object)[picks]
+
+    def mix(self, stack_bb, key, hand, interpolate=True):
+        """{label: frequency} of one hand at `stack_bb`, default action included."""
+        row = self.frequencies(stack_bb, key, [HAND_SLOTS[hand]], interpolate)[0]
+        return {self.labels[a]: float(row[a]) for a in np.flatnonzero(row > 1e-6)}
@@ -0,0 +1,102 @@
+import numpy as np
+
+# --- MIXED-FREQUENCY STRATEGIES ---
+# A chart cell is either a plain label ("Raise", a pure strategy as before) or a
+# mix of labels to frequencies in [0, 1]:
+#
+#   "AJo": {"Raise": 0.6, "Call": 0.4}
+#
+# Frequencies missing from a cell (sum < 1) are the default action, i.e. Fold.
+# The compiled store (chart_store.py) keeps mixed scenarios as float16 frequency
+# rows over a label table, and the sampler below draws randomized actions for
+# whole arrays of hands at once.
+
+
+def cell_mix(cell):
+    """{label: frequency} of a chart cell; a plain label is a pure 100% strategy."""
+    if cell is None:
+        return {}
+    if isinstance(cell, dict):
+        return {label: float(freq) for label, freq in cell.items() if freq > 0}
+    return {cell: 1.0}
+
+
+def dominant_action(cell):
+    """Most frequent label of a cell (the label itself for pure cells), or None."""
+    mix = cell_mix(cell)
+    return max(mix, key=mix.get) if mix else None
+
+
+def is_mixed(cell):
+    return isinstance(cell, dict) and len(cell_mix(cell)) > 1
+
+
+def set_frequency(cell, label, freq):
+    """
+    New cell value with `label` played at `freq`; the other actions keep their
+    proportions within the remaining 1 - freq. Never mutates `cell`.
+    Returns a plain label for pure results and None for an empty cell.
+    """
+    freq = min(max(float(freq), 0.0), 1.0)
+    others = {l: f for l, f in cell_mix(cell).items() if l != label}
+    rest = sum(others.values())
+    mix = {l: f * (1.0 - freq) / rest for l, f in others.items()} if rest > 0 else {}
+    if freq > 0:
+        mix[label] = freq
+    mix = {l: round(f, 3) for l, f in mix.items() if round(f, 3) > 0}
+    if not mix:
+        return None
+    if len(mix) == 1 and sum(mix.values()) >= 0.999:
+        return next(iter(mix))
+    return mix
+
+
+def format_mix(cell):
+    """Human readable cell, e.g. "Raise 60% / Call 40%"."""
+    mix = cell_mix(cell)
+    if len(mix) == 1 and next(iter(mix.values())) >= 0.999:
+        return next(iter(mix))
+    return " / ".join(f"{label} {freq * 100:.0f}%" for label, freq in sorted(mix.items(), key=lambda x: -x[1]))
+
+
+def with_remainder(freqs):
+    """(..., A + 1) frequencies with a last column for the unassigned remainder (the default action)."""
+    freqs = np.asarray(freqs, dtype=np.float32)
+    rest = np.clip(1.0 - freqs.sum(axis=-1, keepdims=True), 0.0, 1.0)
+    return np.concatenate([freqs, rest], axis=-1)
+
+
+def dominant_codes(freqs):
+    """
+    Store codes (0 = default action, a + 1 = label a) of the most frequent action
+    per row of (..., A) frequencies, counting the remainder. Ties go to the first label in
+    label table order, the remainder loses ties. Every lookup path picks actions this way.
+    """
+    picks = with_remainder(freqs).argmax(axis=-1)
+    n_labels = np.shape(freqs)[-1]
+    return np.where(picks == n_labels, 0, picks + 1).astype(np.uint8)
+
+
+def cumulative_table(freqs):
+    """(169, A) cumulative frequencies; rows that sum to ~1 in float16 are snapped to exactly 1."""
+    cumulative = np.cumsum(np.asarray(freqs, dtype=np.float32), axis=1)
+    if cumulative.shape[1]:
+        total = cumulative[:, -1:]
+        full = total >= 0.999
+        cumulative = np.where(full, cumulative / np.where(full, total, 1.0), cumulative)
+    return cumulative
+
+
+def sample_from_cumulative(cumulative, labels, classes, rng, default="Fold"):
+    """
+    Shared sampler over a (169, A) cumulative-frequency table. Draws past the
+    last cumulative value (the unassigned remainder) and invalid classes (-1)
+    come back as `default`.
+    """
+    classes = np.asarray(classes)
+    draws = rng.random(classes.shape)
+    rows = cumulative[np.clip(classes, 0, 168)]
+    picks = (draws[..., None] >= rows).sum(axis=-1)
+    label_table = np.array(list(labels) + [default], dtype=object)
+    picks = np.where(classes < 0, len(labels), picks)
+    return label_table[picks]
@@ -0,0 +1,318 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# --- PHÂN TÍCH NHIỀU BÀN TRÊN NHIỀU TIẾN TRÌNH ---
+# Khung hình của mỗi bàn được chép vào một vòng đệm (ring buffer) trong
+# multiprocessing.shared_memory; qua hàng đợi chỉ gửi (bàn, ô, số thứ tự),
+# còn tiến trình con đọc thẳng mảng điểm ảnh từ bộ nhớ chung, không pickle.
+# Mỗi bàn luôn được gán cho cùng một tiến trình để TableAnalyzer của bàn đó
+# (cache theo ROI) được dùng lại giữa các khung hình.
+
+# Số ô trong vòng đệm của mỗi bàn
+RING_SLOTS = 4
+# Phần đầu của vùng nhớ: mỗi ô một hàng (seq, height, width, channels)
+_HEADER_FIELDS = 4
+
+
+def _header_bytes(slots):
+    return (slots * _HEADER_FIELDS * 8 + 63) // 64 * 64
+
+
+class FrameRing:
+    """
+    Vòng đệm khung hình trong bộ nhớ chung: `slots` ô, mỗi ô chứa được một
+    ảnh tối đa `slot_bytes` byte. Tiến trình chính ghi, tiến trình con đọc.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        size = _header_bytes(slots) + slots * slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Tiến trình con dùng chung resource_tracker với tiến trình chính,
+            # nên vùng nhớ chỉ được unlink một lần bởi tiến trình chính
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.header = np.ndarray((slots, _HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.header[:] = -1
+        self.next_seq = 0
+
+    @classmethod
+    def attach(cls, name, slots, slot_bytes):
+        return cls(slots, slot_bytes, name=name)
+
+    def write(self, frame):
+        """
+        Chép frame vào ô kế tiếp.
+
+        Returns:
+            (slot, seq) để gửi cho tiến trình đọc
+        """
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Khung hình {frame.shape} lớn hơn ô của vòng đệm ({self.slot_bytes} byte)")
+        seq = self.next_seq
+        self.next_seq += 1
+        slot = seq % self.slots
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        # Đánh dấu ô đang ghi dở trước, rồi mới ghi số thứ tự mới
+        self.header[slot, 0] = -1
+        self._slot_array(slot, (height, width, channels))[:] = frame.reshape(height, width, channels)
+        self.header[slot, 1:] = (height, width, channels)
+        self.header[slot, 0] = seq
+        return slot, seq
+
+    def _slot_array(self, slot, shape):
+        offset = _header_bytes(self.slots) + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def view(self, slot, seq):
+        """Mảng numpy trỏ thẳng vào ô `slot` (không sao chép), hoặc None nếu ô đã bị ghi đè."""
+        seq_now, height, width, channels = (int(v) for v in self.header[slot])
+        if seq_now != seq:
+            return None
+        frame = self._slot_array(slot, (height, width, channels))
+        return frame[:, :, 0] if channels == 1 else frame
+
+    def is_current(self, slot, seq):
+        return int(self.header[slot, 0]) == seq
+
+    def close(self):
+        # Bỏ tham chiếu tới buffer trước khi đóng vùng nhớ
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(tasks, results, gated=False):
+    """
+    Vòng lặp của một tiến trình con: phân tích mọi khung hình của các bàn được gán.
+    gated=True: qua TableAnalyzer.poll, khung không cần phân tích cho kết quả None.
+    """
+    import vision
+    from numeric_reader import OcrPool
+
+    # Tiến trình daemon không được tạo tiến trình con: OCR dự phòng chạy ngay
+    # trong tiến trình này (vốn đã tách khỏi vòng lặp chính)
+    vision.NUMERIC_READER.ocr_pool = OcrPool(workers=0, tesseract_cmd=vision.pytesseract.pytesseract.tesseract_cmd)
+
+    rings = {}
+    analyzers = {}
+    while True:
+        # Bỏ view của khung hình trước, nếu không vùng nhớ cũ không đóng được
+        frame = None
+        task = tasks.get()
+        if task is None:
+            break
+        table_id, ring_name, slots, slot_bytes, slot, seq = task
+        ring = rings.get(table_id)
+        if ring is None or ring.name != ring_name:
+            if ring is not None:
+                ring.close()
+                del rings[table_id]
+            try:
+                ring = rings[table_id] = FrameRing.attach(ring_name, slots, slot_bytes)
+            except (OSError, ValueError):
+                # Vòng đệm đã được thay (cửa sổ đổi kích thước) hoặc pool đang đóng
+                results.put((table_id, seq, None, "ring closed"))
+                continue
+        if table_id not in analyzers:
+            analyzers[table_id] = vision.TableAnalyzer()
+
+        frame = ring.view(slot, seq)
+        if frame is None:
+            results.put((table_id, seq, None, "overwritten"))
+            continue
+        try:
+            analyzer = analyzers[table_id]
+            result = analyzer.poll(frame) if gated else analyzer.analyze(frame)
+        except Exception as e:
+            results.put((table_id, seq, None, f"{type(e).__name__}: {e}"))
+            continue
+        # Nếu ô bị ghi đè trong lúc phân tích thì kết quả không còn tin được
+        if not ring.is_current(slot, seq):
+            results.put((table_id, seq, None, "overwritten"))
+        else:
+            results.put((table_id, seq, result, None))
+
+    for ring in rings.values():
+        ring.close()
+
+
+class TableWorkerPool:
+    """
+    Pool tiến trình phân tích bàn chơi.
+    submit() chép khung hình vào vòng đệm của bàn và báo cho tiến trình phụ trách
+    bàn đó; results() lấy các kết quả đã xong theo dạng
+    (table_id, seq, analysis_result hoặc None, lỗi hoặc None).
+    analyze() gửi một khung hình và chờ đúng kết quả của nó (an toàn khi gọi từ nhiều luồng),
+    tối đa `timeout` giây (nên đặt bằng latency_budget của pipeline).
+    Tiến trình con chết bất thường được khởi động lại; các khung đang chờ nó báo lỗi ngay.
+    """
+
+    def __init__(self, workers=None, slots=RING_SLOTS, gated=False, timeout=None):
+        self.n_workers = workers or os.cpu_count() or 1
+        self.slots = slots
+        self.gated = gated
+        self.timeout = timeout
+        self._ctx = mp.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._tasks = [None] * self.n_workers
+        self._processes = [None] * self.n_workers
+        for worker in range(self.n_workers):
+            self._start_worker(worker)
+        self._rings = {}
+        self._assigned = {}
+        self._lock = threading.Lock()
+        self._ready_changed = threading.Condition(self._lock)
+        self._waiting = {}        # (table_id, seq) -> Future của analyze()
+        self._ready = deque()     # kết quả không ai chờ, dành cho results()
+        self._abandoned = set()   # (table_id, seq) analyze() đã hết thời gian chờ
+        self._collector = None
+        self._closed = False
+        self.stats = {"submitted": 0, "completed": 0, "dropped": 0, "timeouts": 0, "restarted": 0}
+
+    def _start_worker(self, worker):
+        self._tasks[worker] = self._ctx.Queue()
+        self._processes[worker] = self._ctx.Process(
+            target=_worker_main, args=(self._tasks[worker], self._results, self.gated), daemon=True)
+        self._processes[worker].start()
+
+    def _check_workers(self):
+        """Khởi động lại tiến trình con đã chết; các analyze() đang chờ nó nhận lỗi ngay."""
+        failed = []
+        with self._lock:
+            if self._closed:
+                return
+            for worker, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                print(f"Tiến trình phân tích {worker} đã dừng (exitcode {process.exitcode}), khởi động lại.")
+                self._start_worker(worker)
+                self.stats["restarted"] += 1
+                for key in [key for key in self._waiting if self._assigned.get(key[0]) == worker]:
+                    failed.append((self._waiting.pop(key), key))
+                    self.stats["dropped"] += 1
+        for future, (table_id, seq) in failed:
+            future.set_result((table_id, seq, None, "worker exited"))
+
+    def submit(self, table_id, frame):
+        """Gửi một khung hình của bàn table_id đi phân tích; trả về số thứ tự của khung hình."""
+        with self._lock:
+            return self._submit(table_id, frame)
+
+    def _submit(self, table_id, frame):
+        ring = self._rings.get(table_id)
+        if ring is None or frame.nbytes > ring.slot_bytes:
+            # Bàn mới hoặc cửa sổ lớn hơn: cấp vòng đệm mới (tiến trình con tự gắn lại theo tên)
+            next_seq = 0
+            if ring is not None:
+                next_seq = ring.next_seq
+                ring.close()
+            ring = self._rings[table_id] = FrameRing(self.slots, frame.nbytes)
+            ring.next_seq = next_seq
+        if table_id not in self._assigned:
+            self._assigned[table_id] = len(self._assigned) % self.n_workers
+        slot, seq = ring.write(frame)
+        self._tasks[self._assigned[table_id]].put((table_id, ring.name, ring.slots, ring.slot_bytes, slot, seq))
+        self.stats["submitted"] += 1
+        return seq
+
+    def _collect(self):
+        """Luồng nền: chuyển kết quả tới analyze() đang chờ, phần còn lại cho results()."""
+        while not self._closed:
+            try:
+                item = self._results.get(timeout=0.2)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (OSError, ValueError):
+                continue
+            with self._lock:
+                self.stats["completed" if item[3] is None else "dropped"] += 1
+                future = self._waiting.pop((item[0], item[1]), None)
+                if future is None and (item[0], item[1]) in self._abandoned:
+                    # Kết quả về sau khi analyze() đã bỏ cuộc: không ai cần nữa
+                    self._abandoned.discard((item[0], item[1]))
+                elif future is None:
+                    self._ready.append(item)
+                    self._ready_changed.notify_all()
+            if future is not None:
+                future.set_result(item)
+
+    def analyze(self, table_id, frame, timeout=None):
+        """
+        Phân tích một khung hình trong tiến trình con và chờ kết quả
+        (tối đa `timeout` giây, mặc định self.timeout; None: chờ mãi).
+        Raises RuntimeError nếu khung hình bị bỏ (ô bị ghi đè, lỗi phân tích,
+        tiến trình con chết) hoặc quá thời gian chờ.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        future = Future()
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, daemon=True)
+                self._collector.start()
+            seq = self._submit(table_id, frame)
+            self._waiting[(table_id, seq)] = future
+        try:
+            _, _, result, error = future.result(timeout)
+        except FutureTimeout:
+            with self._lock:
+                if self._waiting.pop((table_id, seq), None) is not None:
+                    self._abandoned.add((table_id, seq))
+                self.stats["timeouts"] += 1
+            self._check_workers()
+            raise RuntimeError(f"Quá {timeout} giây chưa có kết quả phân tích bàn {table_id}")
+        finally:
+            with self._lock:
+                self._waiting.pop((table_id, seq), None)
+        if error is not None:
+            raise RuntimeError(error)
+        return result
+
+    def results(self, timeout=0.0):
+        """Các kết quả đã xong; chờ tối đa `timeout` giây cho kết quả đầu tiên."""
+        self._check_workers()
+        if self._collector is not None:
+            with self._ready_changed:
+                if timeout and not self._ready:
+                    self._ready_changed.wait(timeout)
+                done = list(self._ready)
+                self._ready.clear()
+            return done
+        done = []
+        try:
+            done.append(self._results.get(timeout=timeout) if timeout else self._results.get_nowait())
+            while True:
+                done.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        for _, _, result, error in done:
+            self.stats["completed" if error is None else "dropped"] += 1
+        return done
+
+    def close(self):
+        self._closed = True
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
@@ -1,8 +1,19 @@
+import atexit
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
 import cv2
 import numpy as np
 import pytesseract
 from PIL import Image
 
+from card_cache import CardCache
+from frame_view import as_frame
+from numeric_reader import NumericReader, OcrPool
+from scenario_resolver import seat_positions
+
 # --- BẠN CẦN TÙY CHỈNH PHẦN NÀY ---
 # Hướng dẫn Tesseract đến file thực thi của nó
 # Ví dụ trên Windows:
@@ -12,10 +23,19 @@ pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tessera
 # Tọa độ tương đối của các khu vực quan trọng (ROI - Region of Interest)
 # Giả sử bàn chơi có kích thước 1000x700 pixels
 # (x, y, width, height)
+# Có thể ghi theo tỉ lệ (0..1) hoặc theo pixel của bàn 1000x700; TableLayout
+# sẽ quy đổi cả hai về pixel nguyên theo kích thước cửa sổ thực tế.
+# Các ghế phải được liệt kê theo chiều kim đồng hồ, bắt đầu từ Hero.
+# Mỗi ghế có thể có thêm vùng "dealer": ô nhỏ nơi nút Dealer nằm khi ghế đó là BTN.
+# Nếu không khai báo, vùng này được suy ra từ vùng "cards" nới rộng DEALER_SEARCH_MARGIN.
 # BẠN PHẢI TỰ XÁC ĐỊNH CÁC TỌA ĐỘ NÀY CHO CHÍNH XÁC
 PLAYER_REGIONS = {
      "6max": {
-        "Hero": {"cards": (0.43, 0.736, 0.1371, 0.2216)}, # Tọa độ bạn tìm được
+        "Hero": {
+            "cards": (0.43, 0.736, 0.1371, 0.2216), # Tọa độ bạn tìm được
+            # Vùng các nút Fold/Call/Raise, hơi rộng hơn template action_panel.png
+            "action_panel": (0.6, 0.87, 0.39, 0.12)
+        },
         
         "Opponent1": {
             "cards": (0.0343, 0.5857, 0.1386, 0.2042), # Tọa độ bạn tìm được
@@ -51,6 +71,7 @@ PLAYER_REGIONS = {
 # Các đường dẫn template và mask tương ứng
 DEALER_BUTTON_TEMPLATE = 'templates/dealer_button.png'
 DEALER_BUTTON_MASK = 'templates/masks/dealer_button_mask.png'
+ACTION_PANEL_TEMPLATE = 'templates/action_panel.png'
 
 # Template và mask cho các quân bài
 CARD_TEMPLATES = {
@@ -77,35 +98,205 @@ CARD_TEMPLATES = {
     }
 }
 
+# Độ nới rộng (tỉ lệ theo chiều rộng/cao bàn) quanh vùng bài để tìm nút Dealer
+DEALER_SEARCH_MARGIN = 0.06
+
+# Kiểm tra panel hành động ở mỗi khung hình: vùng "action_panel" và template
+# được thu nhỏ ACTION_GATE_FACTOR lần trước khi so khớp (tầng thô của find_template_pyramid)
+ACTION_GATE_FACTOR = 4
+ACTION_GATE_THRESHOLD = 0.7
+
+# Kích thước bàn (width, height) mà tọa độ pixel trong PLAYER_REGIONS và
+# các file template được chụp theo
+BASE_TABLE_SIZE = (1000, 700)
+
 # --- KẾT THÚC PHẦN TÙY CHỈNH ---
 
-def find_template(image, template_path, mask_path=None, threshold=0.8):
+# Thư mục gốc để giải các đường dẫn template tương đối ở trên
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Một template đã giải mã sẵn: ảnh BGR, ảnh xám và mask (None nếu không có mask)
+Template = namedtuple("Template", "path bgr gray mask")
+
+
+class TemplateBank:
+    """
+    Kho template nạp sẵn trong bộ nhớ.
+    Mỗi cặp (template, mask) chỉ được đọc từ đĩa và chuyển đổi màu một lần,
+    sau đó mọi lần so khớp ở mọi khung hình/bàn chơi đều dùng lại.
+    """
+
+    def __init__(self, base_dir=BASE_DIR):
+        self.base_dir = base_dir
+        self._entries = {}
+        self._scaled = {}
+        self._classifiers = {}
+
+    def _resolve(self, path):
+        return path if os.path.isabs(path) else os.path.join(self.base_dir, path)
+
+    def get(self, template_path, mask_path=None):
+        """
+        Trả về Template cho cặp đường dẫn, đọc từ đĩa ở lần đầu tiên.
+        Trả về None (và chỉ báo lỗi một lần) nếu không đọc được file.
+        """
+        key = (template_path, mask_path)
+        if key in self._entries:
+            return self._entries[key]
+
+        bgr = cv2.imread(self._resolve(template_path), cv2.IMREAD_COLOR)
+        mask = cv2.imread(self._resolve(mask_path), cv2.IMREAD_GRAYSCALE) if mask_path else None
+        if bgr is None or (mask_path and mask is None):
+            print(f"Không thể đọc template hoặc mask: {template_path}, {mask_path}")
+            entry = None
+        else:
+            entry = Template(template_path, bgr, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), mask)
+        self._entries[key] = entry
+        return entry
+
+    def scaled(self, template_path, mask_path=None, scale=None):
+        """
+        Trả về Template đã co giãn theo tỉ lệ (fx, fy) của cửa sổ so với BASE_TABLE_SIZE.
+        Mỗi tỉ lệ chỉ resize một lần, sau đó được dùng lại cho mọi khung hình.
+        """
+        if scale is None or scale == (1.0, 1.0):
+            return self.get(template_path, mask_path)
+        key = (template_path, mask_path, scale)
+        if key in self._scaled:
+            return self._scaled[key]
+
+        entry = self.get(template_path, mask_path)
+        if entry is not None:
+            fx, fy = scale
+            interpolation = cv2.INTER_AREA if fx * fy < 1.0 else cv2.INTER_LINEAR
+            bgr = cv2.resize(entry.bgr, None, fx=fx, fy=fy, interpolation=interpolation)
+            mask = None
+            if entry.mask is not None:
+                mask = cv2.resize(entry.mask, (bgr.shape[1], bgr.shape[0]), interpolation=cv2.INTER_NEAREST)
+            entry = Template(entry.path, bgr, cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY), mask)
+        self._scaled[key] = entry
+        return entry
+
+    def preload(self):
+        """Nạp toàn bộ template quân bài, nút Dealer và bảng hành động."""
+        for group in CARD_TEMPLATES.values():
+            for paths in group.values():
+                self.get(paths['template'], paths['mask'])
+        self.get(DEALER_BUTTON_TEMPLATE, DEALER_BUTTON_MASK)
+        self.get(ACTION_PANEL_TEMPLATE)
+        return self
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._entries.values())
+
+
+# Kho dùng chung cho cả tiến trình
+TEMPLATE_BANK = TemplateBank()
+
+
+# Bố cục đã quy đổi cho một kích thước cửa sổ:
+# regions = {người chơi: {vùng: (x, y, w, h) pixel nguyên}}, scale = (fx, fy) cho template
+CompiledLayout = namedtuple("CompiledLayout", "width height scale regions")
+
+
+class TableLayout:
+    """
+    Quy đổi PLAYER_REGIONS (tỉ lệ hoặc pixel của bàn gốc) thành hình chữ nhật
+    pixel nguyên cho từng kích thước cửa sổ, chỉ một lần cho mỗi kích thước.
+    """
+
+    def __init__(self, table_type="6max", regions=None, base_size=BASE_TABLE_SIZE):
+        self.table_type = table_type
+        self.regions = (regions if regions is not None else PLAYER_REGIONS).get(table_type, {})
+        self.base_size = base_size
+        self._compiled = {}
+
+    @staticmethod
+    def _is_fraction(rect):
+        return all(isinstance(v, float) and 0.0 <= v <= 1.0 for v in rect)
+
+    def _to_pixels(self, rect, width, height):
+        if self._is_fraction(rect):
+            sx, sy = width, height
+        else:
+            sx, sy = width / self.base_size[0], height / self.base_size[1]
+        x, y, w, h = rect
+        x0, y0 = int(round(x * sx)), int(round(y * sy))
+        x1, y1 = int(round((x + w) * sx)), int(round((y + h) * sy))
+        # Cắt về trong khung ảnh để việc slice luôn hợp lệ
+        x0, x1 = min(max(x0, 0), width), min(max(x1, 0), width)
+        y0, y1 = min(max(y0, 0), height), min(max(y1, 0), height)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    @staticmethod
+    def _dealer_window(cards, width, height):
+        x, y, w, h = cards
+        mx, my = int(round(DEALER_SEARCH_MARGIN * width)), int(round(DEALER_SEARCH_MARGIN * height))
+        x0, y0 = max(x - mx, 0), max(y - my, 0)
+        x1, y1 = min(x + w + mx, width), min(y + h + my, height)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def compile(self, width, height):
+        """
+        Trả về CompiledLayout cho cửa sổ width x height (có cache theo kích thước).
+        """
+        key = (int(width), int(height))
+        if key not in self._compiled:
+            regions = {
+                player: {name: self._to_pixels(rect, *key) for name, rect in fields.items()}
+                for player, fields in self.regions.items()
+            }
+            for fields in regions.values():
+                if "dealer" not in fields and "cards" in fields:
+                    fields["dealer"] = self._dealer_window(fields["cards"], *key)
+            scale = (round(key[0] / self.base_size[0], 2), round(key[1] / self.base_size[1], 2))
+            self._compiled[key] = CompiledLayout(key[0], key[1], scale, regions)
+        return self._compiled[key]
+
+    def for_image(self, image):
+        return self.compile(image.shape[1], image.shape[0])
+
+
+def split_cards(rect):
+    """Chia vùng bài (x, y, w, h) thành hai vùng cho hai lá bài."""
+    x, y, w, h = rect
+    half = w // 2
+    return (x, y, half, h), (x + half, y, w - half, h)
+
+
+# Bố cục mặc định cho bàn 6-max
+TABLE_LAYOUT = TableLayout("6max")
+
+
+def find_template(image, template_path, mask_path=None, threshold=0.8, bank=None, scale=None):
     """
     Tìm một template trong một ảnh lớn và trả về tọa độ.
     Hỗ trợ sử dụng mask để tăng độ chính xác.
     
     Args:
-        image: Ảnh nguồn cần tìm kiếm
+        image: Ảnh nguồn cần tìm kiếm (ndarray BGR/BGRA/xám hoặc FrameView)
         template_path: Đường dẫn đến file ảnh template
         mask_path: Đường dẫn đến file ảnh mask (tùy chọn)
         threshold: Ngưỡng để xác định điểm khớp
+        bank: TemplateBank chứa template đã nạp sẵn (mặc định TEMPLATE_BANK)
+        scale: Tỉ lệ (fx, fy) của cửa sổ so với BASE_TABLE_SIZE (CompiledLayout.scale)
         
     Returns:
         Tọa độ điểm khớp đầu tiên hoặc None nếu không tìm thấy
     """
-    # Đọc template
+    # Lấy template đã nạp sẵn (chỉ đọc đĩa và resize ở lần gọi đầu tiên)
+    entry = (bank if bank is not None else TEMPLATE_BANK).scaled(template_path, mask_path, scale)
+    if entry is None:
+        return None
+    frame = as_frame(image)
+
     if mask_path:
         # Sử dụng phương pháp có mask
-        template = cv2.imread(template_path)
-        mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        
-        if template is None or mask is None:
-            print(f"Không thể đọc template hoặc mask: {template_path}, {mask_path}")
-            return None
+        template = entry.bgr
+        mask = entry.mask
             
-        # Đảm bảo ảnh nguồn cũng ở dạng màu
-        if len(image.shape) == 2:  # Grayscale
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        # Đảm bảo ảnh nguồn cũng ở dạng màu (BGR)
+        image = frame.color()
             
         # Sử dụng TM_SQDIFF_NORMED với mask
         res = cv2.matchTemplate(image, template, cv2.TM_SQDIFF_NORMED, mask=mask)
@@ -118,12 +309,9 @@ def find_template(image, template_path, mask_path=None, threshold=0.8):
         return None
     else:
         # Phương pháp không có mask (dùng TM_CCOEFF_NORMED)
-        template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-        if template is None:
-            print(f"Không thể đọc template: {template_path}")
-            return None
+        template = entry.gray
             
-        img_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) > 2 else image
+        img_gray = frame.gray()
         res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
         
         # Tìm vị trí có giá trị lớn hơn ngưỡng
@@ -134,19 +322,169 @@ def find_template(image, template_path, mask_path=None, threshold=0.8):
             return pt
         return None
 
+def _score_map(area, entry, masked):
+    """
+    Bản đồ điểm khớp của template trên vùng ảnh, càng lớn càng khớp:
+    1 - TM_SQDIFF_NORMED với mask, TM_CCOEFF_NORMED trên ảnh xám nếu không có mask.
+    """
+    if masked:
+        if len(area.shape) == 2:
+            area = cv2.cvtColor(area, cv2.COLOR_GRAY2BGR)
+        res = 1.0 - cv2.matchTemplate(area, entry.bgr, cv2.TM_SQDIFF_NORMED, mask=entry.mask)
+    else:
+        gray = cv2.cvtColor(area, cv2.COLOR_BGR2GRAY) if len(area.shape) > 2 else area
+        res = cv2.matchTemplate(gray, entry.gray, cv2.TM_CCOEFF_NORMED)
+    # Vùng phẳng tuyệt đối cho NaN/inf: coi như không khớp
+    return np.nan_to_num(res, nan=-1.0, posinf=-1.0, neginf=-1.0)
+
+
+# Hệ số thu nhỏ thử lần lượt cho tầng thô, và kích thước tối thiểu (pixel)
+# của template ở tầng thô để việc so khớp còn ý nghĩa
+PYRAMID_FACTORS = (8, 4, 2)
+PYRAMID_MIN_TEMPLATE = 8
+
+
+def _coarse_level(image, template_path, mask_path, bank, scale, factor):
+    """
+    Tầng thô dùng chung cho find_template_pyramid và ActionGate: ảnh (đã ở dạng
+    màu nếu có mask, xám nếu không) thu nhỏ 1/factor cùng template tương ứng,
+    lấy từ TemplateBank.scaled nên chỉ resize template một lần.
+
+    Returns:
+        (ảnh thu nhỏ, template tầng thô); None nếu thiếu template hoặc ảnh
+        nhỏ hơn template ở tầng thô
+    """
+    base = scale if scale is not None else (1.0, 1.0)
+    entry = bank.scaled(template_path, mask_path, (round(base[0] / factor, 4), round(base[1] / factor, 4)))
+    if entry is None or min(entry.bgr.shape[:2]) < 1:
+        return None
+    height, width = image.shape[:2]
+    size = (width // factor, height // factor)
+    if size[0] < entry.bgr.shape[1] or size[1] < entry.bgr.shape[0]:
+        return None
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), entry
+
+
+def find_template_pyramid(image, template_path, mask_path=None, threshold=0.8, bank=None, scale=None,
+                          factor=None, candidates=3):
+    """
+    Như find_template (cùng tham số, cùng cách chấm điểm có/không mask) nhưng
+    tìm từ thô đến mịn: so khớp trên ảnh thu nhỏ 1/factor trước, rồi chỉ so
+    khớp ở độ phân giải đầy đủ trong vùng lân cận của vài ứng viên tốt nhất.
+    Template tầng thô lấy từ TemplateBank.scaled nên chỉ resize một lần.
+    
+    Args:
+        factor: Hệ số thu nhỏ (mặc định: lớn nhất trong PYRAMID_FACTORS mà template còn đủ lớn)
+        candidates: Số ứng viên ở tầng thô được kiểm tra lại
+        
+    Returns:
+        Tọa độ điểm khớp tốt nhất hoặc None nếu không đạt ngưỡng
+        (khác find_template không mask, vốn trả về điểm đầu tiên vượt ngưỡng)
+    """
+    bank = bank if bank is not None else TEMPLATE_BANK
+    entry = bank.scaled(template_path, mask_path, scale)
+    if entry is None:
+        return None
+    th, tw = entry.bgr.shape[:2]
+    if factor is None:
+        factor = next((f for f in PYRAMID_FACTORS if min(th, tw) // f >= PYRAMID_MIN_TEMPLATE), 1)
+    frame = as_frame(image)
+    height, width = frame.shape[:2]
+    if factor <= 1 or height // factor < th // factor or width // factor < tw // factor:
+        return find_template(frame, template_path, mask_path, threshold, bank=bank, scale=scale)
+
+    masked = bool(mask_path)
+    # Chuyển màu một lần cho cả hai tầng (view nếu khung hình đã đúng định dạng)
+    image = frame.color() if masked else frame.gray()
+    level = _coarse_level(image, template_path, mask_path, bank, scale, factor)
+    if level is None:
+        return find_template(frame, template_path, mask_path, threshold, bank=bank, scale=scale)
+
+    small, coarse_entry = level
+    coarse = _score_map(small, coarse_entry, masked)
+    ch, cw = coarse_entry.bgr.shape[:2]
+    best_score, best_loc = -1.0, None
+    for _ in range(candidates):
+        _, _, _, (cx, cy) = cv2.minMaxLoc(coarse)
+        # Loại vùng lân cận của ứng viên này trước khi lấy ứng viên tiếp theo
+        coarse[max(cy - ch // 2, 0):cy + ch // 2 + 1, max(cx - cw // 2, 0):cx + cw // 2 + 1] = -2.0
+
+        # Tinh chỉnh ở độ phân giải đầy đủ trong cửa sổ ±2*factor pixel
+        margin = 2 * factor
+        x0, y0 = max(cx * factor - margin, 0), max(cy * factor - margin, 0)
+        x1, y1 = min(cx * factor + tw + margin, width), min(cy * factor + th + margin, height)
+        if x1 - x0 < tw or y1 - y0 < th:
+            continue
+        _, score, _, (fx, fy) = cv2.minMaxLoc(_score_map(image[y0:y1, x0:x1], entry, masked))
+        if score > best_score:
+            best_score, best_loc = score, (x0 + fx, y0 + fy)
+    return best_loc if best_score >= threshold else None
+
+
+def template_score(image, rect, template_path, mask_path=None, bank=None, scale=None):
+    """
+    Điểm khớp tốt nhất của một template trong vùng rect (cùng cách tính với find_template).
+
+    Returns:
+        Điểm trong [0, 1] (1 - TM_SQDIFF_NORMED nếu có mask, TM_CCOEFF_NORMED nếu không);
+        0.0 nếu thiếu template hoặc vùng nhỏ hơn template
+    """
+    entry = (bank if bank is not None else TEMPLATE_BANK).scaled(template_path, mask_path, scale)
+    x, y, w, h = rect
+    if entry is None or h < entry.bgr.shape[0] or w < entry.bgr.shape[1]:
+        return 0.0
+    frame = as_frame(image)
+    area = frame.color(rect) if mask_path else frame.gray(rect)
+    return float(_score_map(area, entry, bool(mask_path)).max())
+
+
+def find_dealer_seat(image, compiled, threshold=0.8, bank=None, score=None):
+    """
+    Tìm ghế đang giữ nút Dealer, chỉ so khớp trong vùng "dealer" nhỏ của từng ghế.
+
+    Args:
+        image: Ảnh bàn chơi
+        compiled: CompiledLayout của ảnh (TableLayout.for_image)
+        threshold: Điểm khớp tối thiểu
+        bank: TemplateBank dùng chung (mặc định TEMPLATE_BANK)
+        score: Hàm score(seat_name) thay cho việc tính trực tiếp (để TableAnalyzer dùng lại kết quả)
+
+    Returns:
+        Chỉ số ghế (theo thứ tự trong PLAYER_REGIONS, 0 = Hero) hoặc None nếu không tìm thấy
+    """
+    if score is None:
+        def score(seat):
+            return template_score(image, compiled.regions[seat]["dealer"], DEALER_BUTTON_TEMPLATE,
+                                  DEALER_BUTTON_MASK, bank=bank, scale=compiled.scale)
+    seats = list(compiled.regions)
+    if not seats:
+        return None
+    scores = [score(seat) for seat in seats]
+    best = int(np.argmax(scores))
+    return best if scores[best] >= threshold else None
+
+
+# Bộ đọc số dùng chung: template ký tự trong tiến trình, OCR pool khi cần
+NUMERIC_READER = NumericReader(ocr_pool=OcrPool(tesseract_cmd=pytesseract.pytesseract.tesseract_cmd))
+
+
 def read_text_from_region(image, region, is_number=True):
-    """Cắt một vùng ảnh và dùng OCR để đọc text."""
+    """
+    Cắt một vùng ảnh và đọc text.
+    Ô số (bet, stack) đi qua NUMERIC_READER; text tự do dùng OCR trực tiếp.
+    """
+    if is_number:
+        return NUMERIC_READER.read(image, region)
     x, y, w, h = region
-    cropped_image = image[y:y+h, x:x+w]
+    if w <= 0 or h <= 0:
+        return ""
     
     # Tiền xử lý để tăng độ chính xác của OCR
-    gray_image = cv2.cvtColor(cropped_image, cv2.COLOR_BGR2GRAY)
+    gray_image = as_frame(image).gray(region)
     _, thresh_image = cv2.threshold(gray_image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
 
     # Cấu hình Tesseract
     config = "--psm 7" # Chế độ 7: Coi ảnh như một dòng text duy nhất
-    if is_number:
-        config += " -c tessedit_char_whitelist=0123456789.$BB" # Chỉ nhận dạng các ký tự này
 
     try:
         text = pytesseract.image_to_string(thresh_image, config=config).strip()
@@ -155,99 +493,505 @@ def read_text_from_region(image, region, is_number=True):
         print(f"Lỗi OCR: {e}")
         return ""
 
-def find_card(image, roi):
+# Kết quả nhận diện một quân bài: độ tin cậy là điểm khớp (1 - SQDIFF_NORMED)
+# thấp hơn của rank và suit, margin là khoảng cách tới ứng viên đứng thứ hai
+CardReading = namedtuple("CardReading", "card rank suit confidence margin")
+
+
+class _TemplateStack:
+    """Một nhóm template (13 rank hoặc 4 suit) được xếp chồng, đệm về cùng kích thước."""
+
+    def __init__(self, names, entries):
+        self.names = names
+        self.height = max(e.bgr.shape[0] for e in entries)
+        self.width = max(e.bgr.shape[1] for e in entries)
+        n = len(entries)
+        weighted = np.zeros((n, self.height, self.width, 3), np.float32)   # M² * T
+        mask_sq = np.zeros((n, self.height, self.width), np.float32)       # M²
+        energy = np.zeros(n, np.float32)                                   # Σ M² T²
+        for i, e in enumerate(entries):
+            h, w = e.bgr.shape[:2]
+            template = e.bgr.astype(np.float32) / 255.0
+            mask = e.mask.astype(np.float32) / 255.0 if e.mask is not None else np.ones((h, w), np.float32)
+            mask_sq[i, :h, :w] = mask * mask
+            weighted[i, :h, :w] = template * mask_sq[i, :h, :w, None]
+            energy[i] = (weighted[i, :h, :w] * template).sum()
+        self.weighted = weighted
+        self.mask_sq = mask_sq
+        self.energy = energy
+        self._spectra = {}
+
+    def spectra(self, shape):
+        """Phổ FFT (liên hợp) của các template cho một kích thước ROI, tính một lần rồi dùng lại."""
+        if shape not in self._spectra:
+            self._spectra[shape] = (
+                np.conj(np.fft.rfft2(self.weighted, s=shape, axes=(1, 2))),
+                np.conj(np.fft.rfft2(self.mask_sq, s=shape, axes=(1, 2))),
+            )
+        return self._spectra[shape]
+
+    def scores(self, area):
+        """
+        Điểm khớp tốt nhất (1 - TM_SQDIFF_NORMED có mask) của mọi template trong nhóm.
+
+        Args:
+            area: Ảnh BGR float32 trong [0, 1], không nhỏ hơn kích thước template
+
+        Returns:
+            Mảng (số template,) điểm trong [0, 1], càng lớn càng khớp
+        """
+        shape = area.shape[:2]
+        weighted_f, mask_f = self.spectra(shape)
+        # Tương quan chéo cho cả chồng template trong một lượt FFT:
+        #   Σ M²(T - I)² = Σ M²T² - 2 Σ M²T·I + Σ M²I²
+        cross = np.fft.irfft2((weighted_f * np.fft.rfft2(area, axes=(0, 1))[None]).sum(axis=-1), s=shape, axes=(1, 2))
+        image_energy = np.fft.irfft2(mask_f * np.fft.rfft2((area * area).sum(axis=2))[None], s=shape, axes=(1, 2))
+        valid = (slice(None), slice(0, shape[0] - self.height + 1), slice(0, shape[1] - self.width + 1))
+        cross, image_energy = cross[valid], np.maximum(image_energy[valid], 1e-6)
+        energy = self.energy[:, None, None]
+        sqdiff = np.maximum(energy - 2.0 * cross + image_energy, 0.0) / np.sqrt(energy * image_energy)
+        return np.clip(1.0 - sqdiff.reshape(len(self.names), -1).min(axis=1), 0.0, 1.0)
+
+
+class CardClassifier:
+    """
+    Nhận diện quân bài bằng cách chấm điểm đồng thời cả 13 rank và 4 suit,
+    rồi chọn điểm cao nhất (không phụ thuộc thứ tự trong CARD_TEMPLATES).
+    Chi phí mỗi lá bài cố định: hai lượt FFT trên ROI, phổ template được
+    tính sẵn theo kích thước ROI.
+    """
+
+    def __init__(self, bank=None, scale=None):
+        bank = bank if bank is not None else TEMPLATE_BANK
+        self.scale = scale
+        self.stacks = {}
+        self.entries = {}
+        for group, templates in CARD_TEMPLATES.items():
+            names, entries = [], []
+            for name, paths in templates.items():
+                entry = bank.scaled(paths['template'], paths['mask'], scale)
+                if entry is not None:
+                    names.append(name)
+                    entries.append(entry)
+            self.stacks[group] = _TemplateStack(names, entries) if entries else None
+            self.entries[group] = dict(zip(names, entries))
+
+    def _best(self, group, area):
+        stack = self.stacks[group]
+        if stack is None:
+            return None, 0.0, 0.0
+        h, w = area.shape[:2]
+        if h < stack.height or w < stack.width:
+            area = cv2.copyMakeBorder(area, 0, max(stack.height - h, 0), 0, max(stack.width - w, 0),
+                                      cv2.BORDER_REPLICATE)
+        scores = stack.scores(area)
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        runner_up = float(scores[order[1]]) if len(order) > 1 else 0.0
+        return stack.names[order[0]], best, best - runner_up
+
+    def _template_score(self, area, entry):
+        h, w = area.shape[:2]
+        th, tw = entry.bgr.shape[:2]
+        if h < th or w < tw:
+            area = cv2.copyMakeBorder(area, 0, max(th - h, 0), 0, max(tw - w, 0), cv2.BORDER_REPLICATE)
+        res = cv2.matchTemplate(area, entry.bgr, cv2.TM_SQDIFF_NORMED, mask=entry.mask)
+        return 1.0 - float(res.min())
+
+    def score_card(self, card_area, card):
+        """
+        Điểm khớp của riêng rank và suit của `card` trên vùng ảnh (chỉ hai template),
+        dùng để kiểm tra một kết quả lấy từ cache.
+        """
+        rank_entry = self.entries['ranks'].get(card[:-1])
+        suit_entry = self.entries['suits'].get(card[-1:])
+        if rank_entry is None or suit_entry is None or card_area.size == 0:
+            return 0.0
+        if len(card_area.shape) == 2:
+            card_area = cv2.cvtColor(card_area, cv2.COLOR_GRAY2BGR)
+        return min(self._template_score(card_area, rank_entry), self._template_score(card_area, suit_entry))
+
+    def classify(self, card_area):
+        """
+        Chấm điểm toàn bộ rank và suit trên vùng ảnh của một lá bài.
+
+        Args:
+            card_area: Ảnh (BGR hoặc xám) chỉ chứa lá bài
+
+        Returns:
+            CardReading(card, rank, suit, confidence, margin); card là None nếu thiếu template
+        """
+        if card_area.size == 0:
+            return CardReading(None, None, None, 0.0, 0.0)
+        if len(card_area.shape) == 2:
+            card_area = cv2.cvtColor(card_area, cv2.COLOR_GRAY2BGR)
+        area = card_area.astype(np.float32) / 255.0
+        rank, rank_score, rank_margin = self._best('ranks', area)
+        suit, suit_score, suit_margin = self._best('suits', area)
+        card = rank + suit if rank and suit else None
+        return CardReading(card, rank, suit, min(rank_score, suit_score), min(rank_margin, suit_margin))
+
+
+def card_classifier(bank=None, scale=None):
+    """CardClassifier dùng chung của một TemplateBank cho một tỉ lệ (tạo ở lần gọi đầu tiên)."""
+    bank = bank if bank is not None else TEMPLATE_BANK
+    if scale == (1.0, 1.0):
+        scale = None
+    if scale not in bank._classifiers:
+        bank._classifiers[scale] = CardClassifier(bank, scale)
+    return bank._classifiers[scale]
+
+
+# Cache nhận diện quân bài theo perceptual hash, lưu ra đĩa khi thoát. Chỉ tiến
+# trình chính ghi file; tiến trình con (table_workers) chỉ nạp, nếu không các
+# tiến trình sẽ ghi đè file của nhau khi thoát
+CARD_CACHE = CardCache(readonly=multiprocessing.parent_process() is not None)
+atexit.register(CARD_CACHE.save)
+
+# Độ lệch cho phép giữa điểm khớp hiện tại và điểm đã lưu khi dùng kết quả từ cache
+CARD_CACHE_TOLERANCE = 0.05
+
+
+def find_card(image, roi, bank=None, threshold=0.7, scale=None, use_cache=True):
     """
     Tìm kiếm rank và suit của quân bài trong vùng roi.
     
     Args:
-        image: Ảnh nguồn
+        image: Ảnh nguồn (ndarray hoặc FrameView)
         roi: (x, y, width, height) định nghĩa vùng để tìm quân bài
+        bank: TemplateBank dùng chung (mặc định TEMPLATE_BANK)
+        threshold: Điểm khớp tối thiểu của cả rank và suit
+        scale: Tỉ lệ (fx, fy) của cửa sổ so với BASE_TABLE_SIZE
+        use_cache: Tra CARD_CACHE theo perceptual hash trước khi chấm điểm toàn bộ template
         
     Returns:
         String mô tả quân bài (ví dụ: "Ah", "Kd", etc.) hoặc None nếu không tìm thấy
     """
-    x, y, w, h = roi
-    card_area = image[y:y+h, x:x+w]
-    
-    found_rank = None
-    found_suit = None
-    
-    # Tìm kiếm rank
-    for rank, paths in CARD_TEMPLATES['ranks'].items():
-        pos = find_template(card_area, paths['template'], paths['mask'], threshold=0.7)
-        if pos:
-            found_rank = rank
-            break
-            
-    # Tìm kiếm suit
-    for suit, paths in CARD_TEMPLATES['suits'].items():
-        pos = find_template(card_area, paths['template'], paths['mask'], threshold=0.7)
-        if pos:
-            found_suit = suit
-            break
-    
-    if found_rank and found_suit:
-        return found_rank + found_suit
+    frame = as_frame(image)
+    card_area = frame.color(roi)
+    if card_area.size == 0:
+        return None
+    classifier = card_classifier(bank, scale)
+
+    # dHash tính trên ảnh xám của ROI, dùng chung với RoiChangeDetector
+    key = CARD_CACHE.key(frame.gray(roi)) if use_cache else None
+    cached = CARD_CACHE.get(key) if use_cache else None
+    if cached is not None:
+        card, stored_score = cached
+        # Kiểm tra trùng hash: chỉ chấm lại rank và suit của quân bài đã lưu
+        if classifier.score_card(card_area, card) >= max(threshold, stored_score - CARD_CACHE_TOLERANCE):
+            return card
+        CARD_CACHE.invalidate(key)
+
+    reading = classifier.classify(card_area)
+    if reading.card and reading.confidence >= threshold:
+        if use_cache:
+            CARD_CACHE.put(key, reading.card, reading.confidence)
+        return reading.card
     return None
 
-def analyze_table(table_image):
+class RoiChangeDetector:
+    """
+    Phát hiện thay đổi theo từng ROI giữa các khung hình.
+    Mỗi ROI được thu nhỏ (INTER_AREA) thành một lưới ảnh xám khoảng `cell` pixel
+    mỗi ô; ROI được coi là thay đổi khi có ô lệch quá `threshold` mức xám so với
+    chữ ký lần trước.
+    """
+
+    def __init__(self, cell=8, threshold=8, max_grid=64):
+        self.cell = cell
+        self.threshold = threshold
+        self.max_grid = max_grid
+        self._signatures = {}
+
+    def signature(self, image, rect):
+        x, y, w, h = rect
+        if w <= 0 or h <= 0:
+            return np.zeros((1, 1), np.int16)
+        # Ảnh xám của ROI được giữ trong FrameView để các bước nhận diện dùng lại
+        area = as_frame(image).gray(rect)
+        grid = (min(max(w // self.cell, 1), self.max_grid), min(max(h // self.cell, 1), self.max_grid))
+        return cv2.resize(area, grid, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def compare(self, key, image, rect):
+        """
+        So ROI `key` với chữ ký đã lưu, không cập nhật chữ ký.
+
+        Returns:
+            (True nếu ROI mới xuất hiện hoặc đã thay đổi, chữ ký hiện tại)
+        """
+        signature = self.signature(image, rect)
+        previous = self._signatures.get(key)
+        if previous is None or previous.shape != signature.shape:
+            return True, signature
+        return int(np.abs(signature - previous).max()) > self.threshold, signature
+
+    def commit(self, key, signature):
+        """Lưu chữ ký của ROI `key` sau khi ROI đã được nhận diện lại."""
+        self._signatures[key] = signature
+
+    def changed(self, key, image, rect):
+        """
+        True nếu ROI `key` mới xuất hiện hoặc đã thay đổi. Chữ ký chỉ được lưu
+        khi có thay đổi: ROI trôi dần qua nhiều khung (mỗi khung lệch dưới
+        ngưỡng) vẫn được so với trạng thái đã nhận diện, không bị bỏ sót.
+        """
+        is_changed, signature = self.compare(key, image, rect)
+        if is_changed:
+            self.commit(key, signature)
+        return is_changed
+
+    def reset(self):
+        self._signatures.clear()
+
+
+class ActionGate:
+    """
+    Bước kiểm tra rẻ chạy trên mọi khung hình trước khi phân tích đầy đủ:
+    panel hành động của Hero có đang hiện không (so khớp ở tầng thô của
+    find_template_pyramid trong vùng "action_panel" của Hero) và bài của Hero có đổi không (chữ ký
+    ảnh xám của hai lá bài, dùng chung chuyển đổi với find_card).
+    Trạng thái chỉ được chốt bằng commit() sau khi phân tích đầy đủ xong: khi
+    panel đang hiện, cổng tiếp tục yêu cầu phân tích cho tới khi có một kết quả
+    biết vị trí và bài của Hero.
+    """
+
+    def __init__(self, template_path=ACTION_PANEL_TEMPLATE, threshold=ACTION_GATE_THRESHOLD,
+                 factor=ACTION_GATE_FACTOR, bank=None, detector=None, mask_path=None):
+        self.template_path = template_path
+        self.mask_path = mask_path
+        self.threshold = threshold
+        self.factor = factor
+        self.bank = bank if bank is not None else TEMPLATE_BANK
+        self.detector = detector if detector is not None else RoiChangeDetector()
+        self.visible = False
+        # True khi đã có kết quả dùng được trong lần panel hiện này
+        self.delivered = False
+        self._pending = []  # (khóa, chữ ký) của lá bài đã đổi, lưu khi commit()
+
+    def panel_score(self, image, compiled):
+        """
+        Điểm khớp của panel hành động trong vùng "action_panel" của Hero.
+
+        Returns:
+            Điểm như _score_map (trong [0, 1] nếu có mask, [-1, 1] nếu không); 0.0 nếu
+            vùng nhỏ hơn template; None nếu bố cục không có vùng này hoặc thiếu template
+        """
+        rect = compiled.regions.get("Hero", {}).get("action_panel")
+        if rect is None:
+            return None
+        if self.bank.scaled(self.template_path, self.mask_path, compiled.scale) is None:
+            return None
+        frame = as_frame(image)
+        masked = bool(self.mask_path)
+        area = frame.color(rect) if masked else frame.gray(rect)
+        level = _coarse_level(area, self.template_path, self.mask_path, self.bank, compiled.scale, self.factor)
+        if level is None:
+            return 0.0
+        return float(_score_map(*level, masked).max())
+
+    def check(self, image, compiled):
+        """
+        Kiểm tra một khung hình; trạng thái cổng chưa đổi cho tới commit().
+
+        Returns:
+            True nếu cần phân tích đầy đủ: bài của Hero vừa đổi, hoặc panel đang hiện
+            mà chưa có kết quả dùng được (luôn True nếu không kiểm tra được panel)
+        """
+        frame = as_frame(image)
+        score = self.panel_score(frame, compiled)
+        self._pending = []
+        cards = compiled.regions.get("Hero", {}).get("cards")
+        if cards is not None:
+            for i, rect in enumerate(split_cards(cards)):
+                is_changed, signature = self.detector.compare(("gate", i), frame, rect)
+                if is_changed:
+                    self._pending.append((("gate", i), signature))
+        if score is None:
+            self.visible = True
+            return True
+        self.visible = score >= self.threshold
+        if not self.visible:
+            # Panel ẩn: lần hiện sau lại cần một kết quả mới
+            self.delivered = False
+        return bool(self._pending) or (self.visible and not self.delivered)
+
+    def commit(self, result):
+        """Chốt trạng thái sau khi phân tích đầy đủ khung hình vừa check() xong."""
+        for key, signature in self._pending:
+            self.detector.commit(key, signature)
+        self._pending = []
+        self.delivered = (self.visible and result["my_position"] != "Unknown"
+                          and result["my_hand"] != "Unknown")
+
+    def reset(self):
+        self.detector.reset()
+        self.visible = False
+        self.delivered = False
+        self._pending = []
+
+
+class TableAnalyzer:
+    """
+    Phân tích liên tục một bàn chơi: nhận diện bài, tìm nút Dealer và OCR chỉ
+    chạy trên những ROI đã thay đổi; các ROI đứng yên dùng lại kết quả cũ.
+    Mỗi bàn (cửa sổ) nên có một TableAnalyzer riêng.
+    """
+
+    def __init__(self, layout=None, detector=None, gate=None):
+        self.layout = layout if layout is not None else TABLE_LAYOUT
+        self.detector = detector if detector is not None else RoiChangeDetector()
+        self.gate = gate if gate is not None else ActionGate()
+        self._results = {}
+        self._size = None
+        self._last_result = None
+        self.stats = {"recognized": 0, "reused": 0, "frames": 0, "gated": 0, "conversions": 0, "allocated_bytes": 0}
+        # Số lần chuyển đổi màu / số byte cấp phát của khung hình gần nhất
+        self.last_frame = {}
+
+    def recognize(self, key, image, rect, compute):
+        """Kết quả của compute() cho ROI `key`, tính lại chỉ khi vùng `rect` thay đổi."""
+        is_changed, signature = self.detector.compare(key, image, rect)
+        if is_changed or key not in self._results:
+            self._results[key] = compute()
+            # Chữ ký chỉ được lưu cùng kết quả nhận diện, để lần sau so với đúng trạng thái đó
+            self.detector.commit(key, signature)
+            self.stats["recognized"] += 1
+        else:
+            self.stats["reused"] += 1
+        return self._results[key]
+
+    def _check_size(self, frame):
+        size = frame.shape[:2]
+        if size != self._size:
+            # Cửa sổ đổi kích thước: mọi ROI đều khác, bắt đầu lại từ đầu
+            self.reset()
+            self._size = size
+
+    def _count_frame(self, frame):
+        self.last_frame = dict(frame.stats)
+        self.stats["frames"] += 1
+        for name, value in frame.stats.items():
+            self.stats[name] += value
+
+    def analyze(self, table_image):
+        frame = as_frame(table_image)
+        self._check_size(frame)
+        result = analyze_table(frame, self.layout, analyzer=self)
+        self._count_frame(frame)
+        return result
+
+    def poll(self, table_image):
+        """
+        Như analyze() nhưng qua ActionGate trước: chỉ phân tích đầy đủ khi panel
+        hành động đang hiện mà chưa có kết quả biết vị trí và bài của Hero, hoặc
+        khi bài của Hero đổi; các khung còn lại chỉ tốn bước kiểm tra và trả về None.
+        Kết quả có thêm "hero_to_act": panel hành động có đang hiện không.
+        """
+        frame = as_frame(table_image)
+        self._check_size(frame)
+        if not self.gate.check(frame, self.layout.for_image(frame)) and self._last_result is not None:
+            self.stats["gated"] += 1
+            self._count_frame(frame)
+            return None
+        result = self.analyze(frame)
+        self.gate.commit(result)
+        result["hero_to_act"] = self.gate.visible
+        self._last_result = result
+        return result
+
+    def reset(self):
+        self.detector.reset()
+        self.gate.reset()
+        self._results.clear()
+        self._last_result = None
+
+
+def analyze_table(table_image, layout=None, analyzer=None, timings=None):
     """
     Hàm chính của module vision.
-    Nhận vào một ảnh chụp bàn chơi và trả về một dictionary dữ liệu.
+    Nhận vào một ảnh chụp bàn chơi (ndarray BGR/BGRA hoặc FrameView) và trả về một dictionary dữ liệu.
+    Mọi ROI là view trên cùng một buffer; truyền FrameView để đọc số lần cấp phát (FrameView.stats).
+    layout: TableLayout dùng để quy đổi ROI (mặc định TABLE_LAYOUT, bàn 6-max)
+    analyzer: TableAnalyzer để bỏ qua các ROI không thay đổi (tùy chọn)
+    timings: dict nhận thời gian (giây) của từng bước "dealer", "cards", "ocr" (tùy chọn)
     """
     print("Bắt đầu phân tích hình ảnh bàn chơi...")
+    stage_start = time.perf_counter()
+
+    def end_stage(stage):
+        nonlocal stage_start
+        now = time.perf_counter()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + now - stage_start
+        stage_start = now
+    table_image = as_frame(table_image)
+    compiled = (layout if layout is not None else TABLE_LAYOUT).for_image(table_image)
+
+    def recognize(key, rect, compute):
+        if analyzer is None:
+            return compute()
+        return analyzer.recognize(key, table_image, rect, compute)
     
     analysis_result = {
         "my_position": "Unknown",
         "my_hand": "Unknown",
+        "dealer_seat": None,
+        "positions": {},
         "actions_before": []
     }
 
-    # 1. Tìm nút Dealer để xác định vị trí
-    dealer_pos_coords = find_template(table_image, DEALER_BUTTON_TEMPLATE, DEALER_BUTTON_MASK)
-    if dealer_pos_coords:
-        print(f"Tìm thấy nút Dealer tại tọa độ: {dealer_pos_coords}")
-        # **LOGIC XÁC ĐỊNH VỊ TRÍ:**
-        # Dựa vào tọa độ của nút Dealer và các vùng tọa độ của người chơi
-        # trong PLAYER_REGIONS, bạn sẽ viết logic để suy ra vị trí của từng người.
-        # Ví dụ: Nếu dealer_pos_coords gần với tọa độ của Player 3, thì Player 3 là BTN.
-        # Từ đó suy ra các vị trí khác.
-        
-        # Logic tính khoảng cách từ dealer button đến các vị trí người chơi
-        # (Code thực tế sẽ phức tạp hơn, đây chỉ là minh họa)
-        # ...
-        
-        analysis_result["my_position"] = "UTG"  # Tạm thời để là "UTG" để minh họa
+    # 1. Tìm nút Dealer trong vùng nhỏ cạnh từng ghế để xác định vị trí
+    def dealer_score(seat):
+        window = compiled.regions[seat]["dealer"]
+        return recognize(("dealer", seat), window, lambda: template_score(
+            table_image, window, DEALER_BUTTON_TEMPLATE, DEALER_BUTTON_MASK, scale=compiled.scale))
+
+    seats = list(compiled.regions)
+    dealer_seat = find_dealer_seat(table_image, compiled, score=dealer_score)
+    if dealer_seat is not None:
+        print(f"Tìm thấy nút Dealer ở ghế: {seats[dealer_seat]}")
+        # Ghế được liệt kê theo chiều kim đồng hồ từ Hero (chỉ số 0)
+        positions = seat_positions(len(seats), dealer_seat)
+        analysis_result["dealer_seat"] = dealer_seat
+        analysis_result["positions"] = dict(zip(seats, positions))
+        analysis_result["my_position"] = positions[0]
         print(f"Xác định vị trí của bạn là: {analysis_result['my_position']}")
+    end_stage("dealer")
 
     # 2. Đọc bài của bản thân (Hero)
     # Sử dụng hàm find_card để nhận diện các lá bài
-    hero_card_region = PLAYER_REGIONS["6max"]["Hero"]["cards"]
+    hero_card_region = compiled.regions["Hero"]["cards"]
     
     # Giả sử có 2 vùng riêng biệt cho 2 lá bài
-    card1_region = (hero_card_region[0], hero_card_region[1], hero_card_region[2]//2, hero_card_region[3])
-    card2_region = (hero_card_region[0] + hero_card_region[2]//2, hero_card_region[1], hero_card_region[2]//2, hero_card_region[3])
+    card1_region, card2_region = split_cards(hero_card_region)
     
-    card1 = find_card(table_image, card1_region)
-    card2 = find_card(table_image, card2_region)
+    card1 = recognize("card1", card1_region, lambda: find_card(table_image, card1_region, scale=compiled.scale))
+    card2 = recognize("card2", card2_region, lambda: find_card(table_image, card2_region, scale=compiled.scale))
     
     if card1 and card2:
         analysis_result["my_hand"] = card1 + card2
         print(f"Xác định bài của bạn là: {analysis_result['my_hand']}")
     else:
-        # Fallback - có thể cần phương pháp khác hoặc debug
-        analysis_result["my_hand"] = "AhKd"  # Giả định
-        print(f"Không thể nhận dạng bài, giả định là: {analysis_result['my_hand']}")
+        # Không đoán bài: my_hand giữ "Unknown" để bước quyết định bỏ qua khung hình này
+        print("Không thể nhận dạng bài của Hero.")
+    end_stage("cards")
 
     # 3. Đọc hành động của đối thủ
     # Lặp qua các vị trí trước bạn và sử dụng find_template với mask để phát hiện các chip, rồi đọc giá trị bet
-    bet_size_text = read_text_from_region(table_image, PLAYER_REGIONS["6max"]["BTN"]["bet_size"])
-    if bet_size_text:
-         analysis_result["actions_before"].append({
-             "position": "BTN",
-             "action": "Raise",  # Logic thực tế cần phân biệt giữa raise/call/etc.
-             "size_text": bet_size_text
-         })
+    for player, regions in compiled.regions.items():
+        if "bet_size" not in regions:
+            continue
+        bet_size_text = recognize((player, "bet_size"), regions["bet_size"],
+                                  lambda: read_text_from_region(table_image, regions["bet_size"]))
+        if bet_size_text:
+            analysis_result["actions_before"].append({
+                "position": analysis_result["positions"].get(player, player),
+                "seat": player,
+                "action": "Raise",  # Logic thực tế cần phân biệt giữa raise/call/etc.
+                "size_text": bet_size_text
+            })
+    end_stage("ocr")
     print(f"Hành động đã ghi nhận: {analysis_result['actions_before']}")
     
     print("Phân tích hình ảnh hoàn tất.")
@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import vision
+from card_cache import CardCache
+from frame_view import FrameView
+
+# --- BENCHMARK VISION ---
+# Chạy analyze_table trên một thư mục ảnh chụp (ví dụ ảnh xuất từ file ghi
+# test_captures/frames.ring bằng frame_recorder.py) kèm file nhãn, đo thời
+# gian từng bước (dealer, cards, ocr, total) theo p50/p95/p99 và độ chính xác
+# từng trường. So với baseline đã lưu, trả về mã thoát 1 nếu chậm đi hoặc kém
+# chính xác hơn. Không cần client poker, chạy được trên Linux. Số lần chuyển
+# đổi màu và số byte cấp phát mỗi khung hình (FrameView.stats) cũng được so
+# với baseline.
+#
+#   python vision_benchmark.py [--captures test_captures] [--labels labels.json]
+#                              [--baseline baseline.json] [--save-baseline] [--repeat 3] [--warm] [--bgra]
+#
+# File nhãn (mặc định <captures>/labels.json), mỗi ảnh chỉ cần các trường đã biết:
+#   {"capture_1712345678.png": {"my_hand": "AhKd", "my_position": "BTN",
+#                               "dealer_seat": 3, "bets": {"Opponent2": "2.5BB"}}}
+
+STAGES = ["dealer", "cards", "ocr", "total"]
+PERCENTILES = [50, 95, 99]
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def _same_hand(expected, actual):
+    """So sánh bài không phụ thuộc thứ tự hai lá: "AhKd" == "KdAh"."""
+    def cards(hand):
+        return sorted([hand[:2], hand[2:]]) if isinstance(hand, str) and len(hand) == 4 else hand
+    return cards(expected) == cards(actual)
+
+
+def score_fields(labels, result):
+    """
+    {trường: [số đúng, số nhãn]} của một ảnh.
+    Bài hoặc vị trí không nhận diện được ("Unknown") luôn tính là sai, kể cả khi nhãn trống.
+    """
+    scores = {}
+    for field in ("my_hand", "my_position", "dealer_seat"):
+        if field in labels:
+            if result[field] == "Unknown":
+                ok = False
+            elif field == "my_hand":
+                ok = _same_hand(labels[field], result[field])
+            else:
+                ok = labels[field] == result[field]
+            scores[field] = [int(ok), 1]
+    if "bets" in labels:
+        read = {action.get("seat"): action["size_text"] for action in result["actions_before"]}
+        expected = labels["bets"]
+        scores["bets"] = [sum(read.get(seat, "") == text for seat, text in expected.items()), len(expected)]
+    return scores
+
+
+def run_benchmark(captures_dir, labels, repeat=3, warm=False, bgra=False):
+    """
+    Args:
+        bgra: Đưa ảnh vào dạng BGRA như khi chụp màn hình (mss/dxcam)
+
+    Returns:
+        (latency_ms {stage: {"p50", "p95", "p99"}}, accuracy {trường: tỉ lệ đúng},
+         allocations {"conversions", "allocated_kb"} lớn nhất mỗi khung hình, số ảnh)
+    """
+    images = sorted(name for name in os.listdir(captures_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    samples = {stage: [] for stage in STAGES}
+    correct = {}
+    allocations = {"conversions": 0, "allocated_kb": 0.0}
+
+    # Cache quân bài chỉ trong bộ nhớ, không đọc/ghi file cache của phiên chơi thật
+    vision.CARD_CACHE = CardCache(path=None)
+    for name in images:
+        image = cv2.imread(os.path.join(captures_dir, name))
+        if image is None:
+            print(f"Bỏ qua {name}: không đọc được ảnh")
+            continue
+        if bgra:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+        for run in range(repeat + 1):
+            if not warm:
+                # Mỗi lần đo là một khung hình "lạnh": không dùng kết quả của lần trước
+                vision.CARD_CACHE.invalidate()
+                vision.NUMERIC_READER.clear()
+            timings = {}
+            frame = FrameView(image)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = vision.analyze_table(frame, timings=timings)
+            timings["total"] = time.perf_counter() - start
+            allocations["conversions"] = max(allocations["conversions"], frame.stats["conversions"])
+            allocations["allocated_kb"] = max(allocations["allocated_kb"], round(frame.stats["allocated_bytes"] / 1024, 1))
+            if run == 0:
+                # Lần đầu chỉ để nạp template / dựng cache, không tính thời gian
+                for field, (ok, n) in score_fields(labels.get(name, {}), result).items():
+                    correct.setdefault(field, [0, 0])
+                    correct[field][0] += ok
+                    correct[field][1] += n
+                continue
+            for stage in STAGES:
+                samples[stage].append(timings.get(stage, 0.0) * 1000.0)
+
+    latency = {stage: {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+               for stage, values in samples.items() if values}
+    accuracy = {field: round(ok / n, 4) for field, (ok, n) in correct.items() if n}
+    return latency, accuracy, allocations, len(images)
+
+
+def compare(current, baseline, latency_tolerance, accuracy_tolerance, min_slowdown_ms=1.0):
+    """Danh sách mô tả các chỉ số kém hơn baseline (rỗng nếu không có)."""
+    regressions = []
+    for stage, values in baseline.get("latency_ms", {}).items():
+        for key, base in values.items():
+            now = current["latency_ms"].get(stage, {}).get(key)
+            if now is not None and now > base * (1.0 + latency_tolerance) and now - base > min_slowdown_ms:
+                regressions.append(f"{stage} {key}: {now:.1f} ms > baseline {base:.1f} ms")
+    for name, base in baseline.get("allocations", {}).items():
+        now = current.get("allocations", {}).get(name)
+        if now is not None and now > base:
+            regressions.append(f"cấp phát {name} mỗi khung hình: {now} > baseline {base}")
+    for field, base in baseline.get("accuracy", {}).items():
+        now = current["accuracy"].get(field)
+        if now is not None and now < base - accuracy_tolerance:
+            regressions.append(f"độ chính xác {field}: {now:.1%} < baseline {base:.1%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo tốc độ và độ chính xác của vision.analyze_table trên ảnh đã chụp.")
+    parser.add_argument("--captures", default="test_captures")
+    parser.add_argument("--labels", help="File nhãn (mặc định <captures>/labels.json)")
+    parser.add_argument("--baseline", help="File baseline (mặc định <captures>/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả lần này làm baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo mỗi ảnh")
+    parser.add_argument("--warm", action="store_true", help="Giữ cache giữa các lần đo (trạng thái ổn định)")
+    parser.add_argument("--bgra", action="store_true", help="Đưa ảnh vào dạng BGRA như khi chụp màn hình")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="Cho phép chậm hơn baseline (tỉ lệ)")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0, help="Cho phép kém chính xác hơn baseline")
+    args = parser.parse_args(argv)
+
+    labels_path = args.labels or os.path.join(args.captures, "labels.json")
+    baseline_path = args.baseline or os.path.join(args.captures, "baseline.json")
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding='utf-8') as f:
+            labels = json.load(f)
+    else:
+        print(f"Không có file nhãn {labels_path}: chỉ đo thời gian.")
+
+    latency, accuracy, allocations, n_images = run_benchmark(args.captures, labels, max(args.repeat, 1), args.warm,
+                                                             args.bgra)
+    if not latency:
+        print(f"Không có ảnh nào trong {args.captures}.")
+        return 1
+
+    print(f"{n_images} ảnh, {max(args.repeat, 1)} lần đo mỗi ảnh{' (warm)' if args.warm else ''}")
+    for stage, values in latency.items():
+        print(f"  {stage:<7} " + "  ".join(f"{key} {value:8.2f} ms" for key, value in values.items()))
+    for field, value in accuracy.items():
+        print(f"  {field:<12} {value:.1%}")
+    print(f"  cấp phát    {allocations['conversions']} lần chuyển đổi, {allocations['allocated_kb']} KB mỗi khung hình")
+
+    current = {"latency_ms": latency, "accuracy": accuracy, "allocations": allocations}
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        print(f"Đã lưu baseline: {baseline_path}")
+        return 0
+    if not os.path.exists(baseline_path):
+        print("Chưa có baseline (chạy với --save-baseline để tạo).")
+        return 0
+    with open(baseline_path, "r", encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.latency_tolerance, args.accuracy_tolerance)
+    for line in regressions:
+        print(f"HỒI QUY: {line}")
+    if not regressions:
+        print("Không có hồi quy so với baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())